@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class ChatConfig(AppConfig):
     name = 'chat'
+
+    def ready(self):
+        from media.storage import track_blob_field
+        from .models import ChatMessage
+        track_blob_field(ChatMessage, 'attachment')
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:41
+
+import media.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatmessage_is_edited'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=media.storage.blob_storage, upload_to='chat_attachments/'),
+        ),
+    ]
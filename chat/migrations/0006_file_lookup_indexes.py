@@ -0,0 +1,19 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:49
+
+import media.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_alter_chatmessage_attachment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='attachment',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=media.storage.blob_storage, upload_to='chat_attachments/'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
+from media.storage import blob_storage
 
 class ChatThread(models.Model):
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_threads')
@@ -36,7 +37,7 @@ class ChatMessage(models.Model):
     read_at = models.DateTimeField(null=True, blank=True)
     
     # Media support
-    attachment = models.FileField(upload_to='chat_attachments/', null=True, blank=True)
+    attachment = models.FileField(upload_to='chat_attachments/', storage=blob_storage, null=True, blank=True, db_index=True)
     
     # CRUD support
     reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies')
@@ -90,7 +90,7 @@ class AdminUserUpdateForm(forms.ModelForm):
     
     class Meta:
         model = User
-        fields = ['first_name', 'last_name', 'email', 'phone_number', 'gender', 'is_uploader', 'download_preference', 'theme_preference']
+        fields = ['first_name', 'last_name', 'email', 'phone_number', 'gender', 'is_uploader', 'download_preference', 'theme_preference', 'storage_quota']
         widgets = {
             'first_name': forms.TextInput(attrs={'class': 'v-auth-input'}),
             'last_name': forms.TextInput(attrs={'class': 'v-auth-input'}),
@@ -99,6 +99,7 @@ class AdminUserUpdateForm(forms.ModelForm):
             'gender': forms.Select(attrs={'class': 'v-auth-input'}),
             'download_preference': forms.Select(attrs={'class': 'v-auth-input'}),
             'theme_preference': forms.Select(attrs={'class': 'v-auth-input'}),
+            'storage_quota': forms.NumberInput(attrs={'class': 'v-auth-input', 'min': 0}),
         }
         help_texts = {
             'is_uploader': "Designates whether the user can upload files and create folders.",
@@ -0,0 +1,60 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.typeahead import TypeaheadIndex
+
+SYLLABLES = ['ka', 'ri', 'mo', 'an', 'jo', 'sa', 'le', 'na', 'th', 'vi', 'pa', 'de', 'lu', 'ch', 'ar', 'em', 'si', 'ro', 'ba', 'ni']
+
+def name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+class Command(BaseCommand):
+    help = "Micro-benchmark of the user typeahead index on synthetic users (in memory, no database)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=300, help="Accounts each simulated searcher follows")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, users, queries, follows, seed, **kwargs):
+        rng = random.Random(seed)
+        rows = [
+            (pk, f'{name(rng).lower()}{rng.choice(["", "_", ""])}{rng.randint(0, 9999) if rng.random() < 0.6 else ""}', name(rng), name(rng))
+            for pk in range(1, users + 1)
+        ]
+        # Follower counts are heavy-tailed
+        popularity = {pk: int(rng.paretovariate(1.2)) - 1 for pk in range(1, users + 1)}
+
+        start = time.perf_counter()
+        index = TypeaheadIndex(rows, popularity)
+        self.stdout.write(f"Built {len(index.keys)} tokens, {len(index.top)} top lists in {time.perf_counter() - start:.1f} s")
+
+        samples = []
+        for _ in range(queries):
+            _, username, first_name, last_name = rng.choice(rows)
+            token = rng.choice([username, first_name, last_name]).lower()
+            samples.append(token[:rng.randint(2, min(len(token), 6))])
+        followed = [set(rng.sample(range(1, users + 1), follows)) for _ in range(50)]
+
+        timings = []
+        for n, prefix in enumerate(samples):
+            start = time.perf_counter()
+            index.lookup(prefix, followed=followed[n % len(followed)], exclude=1)
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"{queries} lookups: p50 {percentile(timings, 0.5):.3f} ms   p99 {percentile(timings, 0.99):.3f} ms   max {max(timings):.3f} ms"
+        )
+
+        timings = []
+        for pk in rng.sample(range(1, users + 1), 200):
+            start = time.perf_counter()
+            index.update(pk, ''.join(rng.choice(string.ascii_lowercase) for _ in range(8)), name(rng), name(rng))
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(f"200 renames: p50 {percentile(timings, 0.5):.3f} ms   p99 {percentile(timings, 0.99):.3f} ms")
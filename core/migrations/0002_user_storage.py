@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='storage_quota',
+            field=models.BigIntegerField(blank=True, help_text='Bytes this user may store. Empty uses STORAGE_QUOTA_DEFAULT; 0 means unlimited.', null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='storage_used',
+            field=models.BigIntegerField(default=0, help_text='Bytes of uploads and their generated files, kept up to date by media.quota.'),
+        ),
+    ]
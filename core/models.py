@@ -30,6 +30,8 @@ class User(AbstractUser):
     is_public = models.BooleanField(default=True, help_text="Designates whether the profile is visible to others.")
     is_private = models.BooleanField(default=False, help_text="If true, only followers can see content.")
     allowed_downloaders = models.ManyToManyField('self', symmetrical=False, related_name='download_access_granted', blank=True)
+    storage_used = models.BigIntegerField(default=0, help_text="Bytes of uploads and their generated files, kept up to date by media.quota.")
+    storage_quota = models.BigIntegerField(null=True, blank=True, help_text="Bytes this user may store. Empty uses STORAGE_QUOTA_DEFAULT; 0 means unlimited.")
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -37,6 +39,15 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # storage_used is moved with F() updates; a full save must not write back a stale copy
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'storage_used'
+            ]
+        super().save(*args, **kwargs)
+
     def get_role_display(self):
         if self.is_superuser:
             return "Admin"
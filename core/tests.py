@@ -1,3 +1,26 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from media.models import MediaItem
+from media.reaper import schedule
+from social.models import MediaView, Review
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='x')
+        self.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='x')
+        self.kept, self.deleted = [
+            MediaItem.objects.create(uploader=self.owner, title=title, file=f'{title}.txt', media_type='DOCUMENT')
+            for title in ('kept', 'deleted')
+        ]
+        for item in (self.kept, self.deleted):
+            MediaView.objects.create(user=self.viewer, media_item=item)
+            Review.objects.create(user=self.viewer, media_item=item, rating=5, content='Nice')
+        self.client.force_login(self.viewer)
+
+    def test_tombstoned_items_leave_history_and_comments_at_once(self):
+        schedule(self.owner, items=MediaItem.objects.filter(pk=self.deleted.pk))
+        response = self.client.get('/profile/')
+        self.assertEqual(response.context['history'], [self.kept])
+        self.assertEqual([review.media_item for review in response.context['comments']], [self.kept])
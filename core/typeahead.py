@@ -0,0 +1,217 @@
+"""
+Prefix typeahead for user search.
+
+Every active user contributes normalised tokens (username, first and last name: case
+folded, accents stripped, non-alphanumerics dropped) to a sorted in-memory array, so the
+users matching a prefix are one bisect range. Ranges larger than TYPEAHEAD_SCAN_LIMIT
+(short or common prefixes) are answered from top lists precomputed for those prefixes at
+build time. Candidates are ranked: people the searcher follows, then exact username
+matches, then popularity (accepted followers).
+
+Each worker process keeps its own copy. It is built in a background thread on first
+use (seconds at a million users), and until it is ready searches fall back to a plain
+database query. It is refreshed every TYPEAHEAD_REFRESH_SECONDS from the user rows of
+media.SearchEntry, which are rewritten (and so get new ids) whenever a user's name or
+privacy changes. Changed users go to a small sorted overlay instead of the main array,
+so an update never shifts millions of entries while searches wait; their stale main
+entries are skipped. A full rebuild, also in the background, every
+TYPEAHEAD_REBUILD_SECONDS folds the overlay in, picks up popularity changes and drops
+deleted users; until then deleted or deactivated users are filtered out when the
+results are loaded.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from array import array
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count, Max, Q
+
+# Sorts after every token that starts with a given prefix
+LAST = '\U0010ffff'
+
+NOT_ALNUM = re.compile(r'[\W_]+')
+
+def normalise(text):
+    text = (text or '').casefold()
+    if not text.isascii():
+        # Decompose so accents become separate marks, which NOT_ALNUM then drops
+        text = unicodedata.normalize('NFKD', text)
+    return NOT_ALNUM.sub('', text)
+
+def user_tokens(username, first_name, last_name):
+    return {token for token in map(normalise, (username, first_name, last_name)) if token}
+
+class TypeaheadIndex:
+    def __init__(self, rows, popularity, scan_limit=None, top_k=None):
+        """`rows`: (user id, username, first name, last name); `popularity`: {user id: score}."""
+        self.scan_limit = scan_limit or settings.TYPEAHEAD_SCAN_LIMIT
+        self.top_k = top_k or settings.TYPEAHEAD_TOP_K
+        self.popularity = popularity
+        self.usernames = {}
+        self.tokens = {}
+        pairs = []
+        for pk, username, first_name, last_name in rows:
+            self.usernames[pk] = normalise(username)
+            self.tokens[pk] = user_tokens(username, first_name, last_name)
+            pairs.extend((token, pk) for token in self.tokens[pk])
+        pairs.sort()
+        self.keys = [token for token, _ in pairs]
+        self.owners = array('q', (pk for _, pk in pairs))
+        self.top = self._top_lists()
+        # Users updated since the build: their current tokens, as sorted (token, id) pairs
+        self.changed = set()
+        self.extra = []
+        self.lock = threading.Lock()
+
+    def _top_lists(self):
+        """Best `top_k` users of every prefix that matches more than `scan_limit` tokens."""
+        top = {}
+
+        def collect(prefix, lo, hi):
+            # A heavy prefix's list merges its heavy children's lists with its light children's
+            # ranges, so each token is looked at once however deep the heavy prefixes go
+            candidates = set()
+            start = lo
+            while start < hi:
+                if self.keys[start] == prefix:
+                    end = bisect.bisect_right(self.keys, prefix, start, hi)
+                    candidates.update(self.owners[start:end])
+                else:
+                    child = self.keys[start][:len(prefix) + 1]
+                    end = bisect.bisect_left(self.keys, child + LAST, start, hi)
+                    candidates.update(collect(child, start, end) if end - start > self.scan_limit else self.owners[start:end])
+                start = end
+            best = heapq.nsmallest(self.top_k, candidates, key=lambda pk: (-self.popularity.get(pk, 0), pk))
+            if prefix:
+                top[prefix] = best
+            return best
+
+        if len(self.keys) > self.scan_limit:
+            collect('', 0, len(self.keys))
+        return top
+
+    def _range(self, prefix):
+        return bisect.bisect_left(self.keys, prefix), bisect.bisect_left(self.keys, prefix + LAST)
+
+    def update(self, pk, username=None, first_name='', last_name=''):
+        """Replace one user's tokens (username None removes the user)."""
+        with self.lock:
+            if pk in self.changed:
+                for token in self.tokens.get(pk, ()):
+                    index = bisect.bisect_left(self.extra, (token, pk))
+                    del self.extra[index]
+            # Entries in the main array for this user are stale from now on
+            self.changed.add(pk)
+            self.tokens.pop(pk, None)
+            self.usernames.pop(pk, None)
+            if username is None:
+                return
+            self.usernames[pk] = normalise(username)
+            self.tokens[pk] = user_tokens(username, first_name, last_name)
+            for token in self.tokens[pk]:
+                bisect.insort(self.extra, (token, pk))
+
+    def lookup(self, query, followed=(), exclude=None, limit=10):
+        """Ids of the best `limit` users with a token starting with `query`."""
+        prefix = normalise(query)
+        if not prefix:
+            return []
+
+        def matches(pk):
+            return any(token.startswith(prefix) for token in self.tokens.get(pk, ()))
+
+        with self.lock:
+            lo, hi = self._range(prefix)
+            if hi - lo <= self.scan_limit:
+                candidates = set(self.owners[lo:hi]) - self.changed
+            elif prefix in self.top:
+                # Lists are from the last build; skip users renamed or removed since
+                candidates = {pk for pk in self.top[prefix] if pk not in self.changed or matches(pk)}
+            else:
+                # Grew past the limit since the last build; the next rebuild adds its top list
+                candidates = set(self.owners[lo:lo + self.scan_limit]) - self.changed
+            start = bisect.bisect_left(self.extra, (prefix,))
+            end = bisect.bisect_left(self.extra, (prefix + LAST,))
+            candidates.update(pk for _, pk in self.extra[start:end][:self.scan_limit])
+            candidates.update(pk for pk in followed if matches(pk))
+        candidates.discard(exclude)
+        ranked = sorted(candidates, key=lambda pk: (
+            pk not in followed, self.usernames.get(pk) != prefix, -self.popularity.get(pk, 0), pk,
+        ))
+        return ranked[:limit]
+
+def _popularity():
+    from social.models import Follow
+    counts = Follow.objects.filter(is_accepted=True).values('followed_id').annotate(n=Count('pk')).values_list('followed_id', 'n')
+    return dict(counts.iterator())
+
+def _watermark():
+    from media.models import SearchEntry
+    return SearchEntry.objects.filter(kind='user').aggregate(last=Max('pk'))['last'] or 0
+
+def build():
+    watermark = _watermark()
+    rows = get_user_model().objects.filter(is_active=True).values_list('pk', 'username', 'first_name', 'last_name')
+    return TypeaheadIndex(rows.iterator(chunk_size=10000), _popularity()), watermark
+
+_state = {'index': None, 'watermark': 0, 'built_at': 0.0, 'refreshed_at': 0.0, 'building': False}
+_build_lock = threading.Lock()
+
+def _build_in_background(now):
+    try:
+        index, watermark = build()
+        with _build_lock:
+            _state.update(index=index, watermark=watermark, built_at=now, refreshed_at=now)
+    finally:
+        _state['building'] = False
+        connection.close()
+
+def get_index():
+    """This process's index brought up to date, or None while its first build runs."""
+    now = time.monotonic()
+    with _build_lock:
+        due = _state['index'] is None or now - _state['built_at'] > settings.TYPEAHEAD_REBUILD_SECONDS
+        if due and not _state['building']:
+            _state['building'] = True
+            threading.Thread(target=_build_in_background, args=(now,), daemon=True).start()
+        if _state['index'] is not None and now - _state['refreshed_at'] > settings.TYPEAHEAD_REFRESH_SECONDS:
+            refresh(now)
+        return _state['index']
+
+def refresh(now=None):
+    """Apply the users whose search entry was rewritten since the last refresh."""
+    from media.models import SearchEntry
+    changed = SearchEntry.objects.filter(kind='user', pk__gt=_state['watermark']).values_list('pk', 'object_id')
+    ids = {}
+    for pk, user_id in changed:
+        ids[user_id] = max(pk, ids.get(user_id, 0))
+    if ids:
+        users = get_user_model().objects.filter(pk__in=ids).values_list('pk', 'username', 'first_name', 'last_name', 'is_active')
+        found = set()
+        for pk, username, first_name, last_name, is_active in users:
+            found.add(pk)
+            _state['index'].update(pk, username if is_active else None, first_name, last_name)
+        for pk in set(ids) - found:
+            _state['index'].update(pk)
+        _state['watermark'] = max(_state['watermark'], *ids.values())
+    _state['refreshed_at'] = now or time.monotonic()
+
+def suggest(user, query, limit=10):
+    """Users for the search box of `user`, best first."""
+    from social.models import Follow
+    index = get_index()
+    users = get_user_model().objects.filter(is_active=True)
+    if index is None:
+        # Still building: the unranked query the index replaces
+        matches = users.filter(Q(username__icontains=query) | Q(first_name__icontains=query) | Q(last_name__icontains=query))
+        return list(matches.exclude(pk=user.pk)[:limit])
+    followed = set(Follow.objects.filter(follower=user, is_accepted=True).values_list('followed_id', flat=True))
+    ids = index.lookup(query, followed=followed, exclude=user.pk, limit=limit)
+    users = users.in_bulk(ids)
+    return [users[pk] for pk in ids if pk in users]
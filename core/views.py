@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.contrib.auth import login, logout
-from django.db.models import Count, Q
+from django.db.models import Q, Sum
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.contrib import messages
@@ -13,7 +13,12 @@ from .forms import (
     AdminUserUpdateForm, UploadRequestForm, ReportProblemForm, UsernameUpdateForm
 )
 from .models import UploadRequest, ReportedProblem
+from .typeahead import suggest
 from media.models import MediaItem, Folder, Category
+from media.quota import quota_for
+from media.recommend import recommended_for
+from media.reaper import schedule
+from media.search import search
 from social.models import Follow, Like, Favorite, MediaView, Review
 from django.contrib.auth import get_user_model
 
@@ -26,30 +31,9 @@ def home(request):
     date_filter = request.GET.get("date", "all")
     is_search = bool(query)
 
-    # Base Querysets
-    items_qs = MediaItem.objects.filter(is_hidden=False)
-    folders_qs = Folder.objects.filter(is_hidden=False)
-    
-    # Ownership/Privacy rules
-    if not (request.user.is_authenticated and request.user.is_superuser):
-        if request.user.is_authenticated:
-            # Can see: (Public items AND Public profile) OR (My items) OR (Followed items)
-            followed_users = Follow.objects.filter(follower=request.user, is_accepted=True).values_list('followed_id', flat=True)
-            
-            items_qs = items_qs.filter(
-                (Q(is_private=False) & Q(uploader__is_private=False)) | 
-                Q(uploader=request.user) |
-                Q(uploader_id__in=followed_users)
-            )
-            folders_qs = folders_qs.filter(
-                (Q(is_private=False) & Q(owner__is_private=False)) | 
-                Q(owner=request.user) |
-                Q(owner_id__in=followed_users)
-            )
-        else:
-            # Anonymous users only see Public items from Public profiles
-            items_qs = items_qs.filter(is_private=False, uploader__is_private=False)
-            folders_qs = folders_qs.filter(is_private=False, owner__is_private=False)
+    # Base Querysets: (public items from public profiles) OR my items OR followed users' items
+    items_qs = MediaItem.objects.visible_to(request.user).prefetch_related('renditions')
+    folders_qs = Folder.objects.visible_to(request.user)
 
     # Apply Sidebar Filters
     if media_type != "ALL":
@@ -77,40 +61,25 @@ def home(request):
     else: # date_desc
         items_qs = items_qs.order_by('-created_at')
 
-    search_users = User.objects.none()
-    search_photos = MediaItem.objects.none()
-    search_videos = MediaItem.objects.none()
-    search_documents = MediaItem.objects.none()
-    search_folders = Folder.objects.none()
+    search_users, search_photos, search_videos, search_documents, search_folders = [], [], [], [], []
 
     if is_search:
-        search_users = User.objects.filter(
-            Q(username__icontains=query) | Q(bio__icontains=query)
-        ).distinct()
-        
-        search_photos = items_qs.filter(media_type='IMAGE').filter(
-            Q(title__icontains=query) | Q(file__icontains=query)
-        ).distinct()
-
-        search_videos = items_qs.filter(media_type='VIDEO').filter(
-            Q(title__icontains=query) | Q(file__icontains=query)
-        ).distinct()
-        
-        search_documents = items_qs.filter(media_type='DOCUMENT').filter(
-            Q(title__icontains=query) | Q(file__icontains=query)
-        ).distinct()
-        
-        search_folders = folders_qs.filter(name__icontains=query).distinct()
-
-    no_results = is_search and not (
-        search_users.exists() or search_photos.exists() or 
-        search_videos.exists() or search_documents.exists() or search_folders.exists()
-    )
-
-    featured = MediaItem.objects.filter(uploader__is_superuser=True, is_hidden=False, is_private=False)[:10]
-    trending = items_qs.annotate(lc=Count('likes')).order_by('-lc')[:10]
-    # Combine or pick one for Recommended
-    recommended = (featured | trending).distinct()[:15]
+        # One ranked full-text query for every group (media.search)
+        hits = search(request.user, query)
+        # Loaded through the querysets above, so the sidebar filters still apply
+        found = items_qs.in_bulk([pk for group in ('IMAGE', 'VIDEO', 'DOCUMENT') for pk in hits.get(group, [])])
+        search_photos = [found[pk] for pk in hits.get('IMAGE', []) if pk in found]
+        search_videos = [found[pk] for pk in hits.get('VIDEO', []) if pk in found]
+        search_documents = [found[pk] for pk in hits.get('DOCUMENT', []) if pk in found]
+        folders = folders_qs.in_bulk(hits.get('folder', []))
+        search_folders = [folders[pk] for pk in hits.get('folder', []) if pk in folders]
+        users = User.objects.filter(is_active=True).in_bulk(hits.get('user', []))
+        search_users = [users[pk] for pk in hits.get('user', []) if pk in users]
+
+    no_results = is_search and not (search_users or search_photos or search_videos or search_documents or search_folders)
+
+    # Precomputed per-user picks (media.recommend), topped up from trending and staff uploads
+    recommended = recommended_for(request.user, items_qs)
     recent = items_qs.order_by('-created_at')[:20]
 
     context = {
@@ -156,9 +125,8 @@ def search_users(request):
     if len(q) < 2:
         return JsonResponse({'users': []})
     
-    users = User.objects.filter(
-        Q(username__icontains=q) | Q(first_name__icontains=q) | Q(last_name__icontains=q)
-    ).exclude(id=request.user.id)[:10]
+    # Prefix index ranked by follows and popularity (core.typeahead)
+    users = suggest(request.user, q)
     
     results = []
     for u in users:
@@ -173,7 +141,11 @@ def search_users(request):
 @login_required
 def delete_account(request):
     if request.method == 'POST':
-        user = request.user; logout(request); user.delete(); messages.success(request, "Account deleted."); return redirect('home')
+        user = request.user; logout(request)
+        # Content is hidden now and removed by the reaper, which deletes the account last
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        schedule(user, items=MediaItem.objects.filter(uploader=user), folders=Folder.objects.filter(owner=user, parent__isnull=True), kind='ACCOUNT')
+        messages.success(request, "Account deleted."); return redirect('home')
     return redirect('profile')
 
 def profile(request, username=None):
@@ -194,14 +166,15 @@ def profile(request, username=None):
 
     is_profile_private = user_obj.is_private and not is_own and not is_admin and not is_following
     
-    uploads_all_files = MediaItem.objects.filter(uploader=user_obj, is_hidden=False)
+    uploads_all_files = MediaItem.objects.filter(uploader=user_obj, is_hidden=False).prefetch_related('renditions')
     uploads_folders = Folder.objects.filter(owner=user_obj, parent__isnull=True, is_hidden=False)
-    uploads_direct = MediaItem.objects.filter(uploader=user_obj, folder__isnull=True, is_hidden=False)
-    favorites = MediaItem.objects.filter(favorited_by__user=user_obj).select_related('uploader')
-    likes = MediaItem.objects.filter(likes__user=user_obj).select_related('uploader')
-    comments = Review.objects.filter(user=user_obj).select_related('media_item')
-    history = [v.media_item for v in MediaView.objects.filter(user=user_obj).select_related('media_item')[:20]]
-    hidden_items = MediaItem.objects.filter(uploader=user_obj, is_hidden=True) if is_own or is_admin else []
+    uploads_direct = MediaItem.objects.filter(uploader=user_obj, folder__isnull=True, is_hidden=False).prefetch_related('renditions')
+    favorites = MediaItem.objects.filter(favorited_by__user=user_obj).select_related('uploader').prefetch_related('renditions')
+    likes = MediaItem.objects.filter(likes__user=user_obj).select_related('uploader').prefetch_related('renditions')
+    # Forward FKs go through the base manager, so tombstoned items are filtered out here
+    comments = Review.objects.filter(user=user_obj, media_item__deletion__isnull=True).select_related('media_item')
+    history = [v.media_item for v in MediaView.objects.filter(user=user_obj, media_item__deletion__isnull=True).select_related('media_item').prefetch_related('media_item__renditions')[:20]]
+    hidden_items = MediaItem.objects.filter(uploader=user_obj, is_hidden=True).prefetch_related('renditions') if is_own or is_admin else []
 
     # Content Filtering
     if not is_own and not is_admin:
@@ -355,7 +328,17 @@ def admin_upload_requests(request):
 @login_required
 def admin_dashboard(request):
     if not request.user.is_superuser: return redirect('home')
+    # Storage comes from the per-user counters, never from walking MEDIA_ROOT
+    storage_users = []
+    for u in User.objects.filter(storage_used__gt=0).order_by('-storage_used')[:25]:
+        quota = quota_for(u)
+        storage_users.append({
+            'user': u, 'used': u.storage_used, 'quota': quota,
+            'percent': min(100, round(u.storage_used * 100 / quota)) if quota else None,
+        })
     return render(request, 'core/admin_dashboard.html', {
+        'storage_total': User.objects.aggregate(total=Sum('storage_used'))['total'] or 0,
+        'storage_users': storage_users,
         'user_count': User.objects.count(),
         'media_count': MediaItem.objects.count(),
         'uploader_count': User.objects.filter(is_uploader=True).count(),
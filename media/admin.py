@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import MediaItem, Folder, Category, Collection
+from .models import MediaItem, Folder, Category, Collection, ProcessingJob
 
 @admin.register(MediaItem)
 class MediaItemAdmin(admin.ModelAdmin):
@@ -23,3 +23,9 @@ class CollectionAdmin(admin.ModelAdmin):
     list_display = ('name', 'owner', 'is_public', 'created_at')
     list_filter = ('is_public', 'created_at')
     search_fields = ('name',)
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'media_item', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('kind', 'status')
+    raw_id_fields = ('media_item',)
@@ -1,9 +1,106 @@
-from rest_framework import viewsets, permissions, status
+import os
+import re
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework import viewsets, mixins, permissions, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import MediaItem, Folder
-from .serializers import MediaItemSerializer
+from .models import Deletion, MediaItem, Folder, FolderClosure, UploadSession
+from .serializers import DeletionSerializer, MediaItemSerializer, UploadSessionSerializer
+from .counters import items_added
+from .jobs import enqueue_processing, job_status
+from .phash import HashIndex
+from .quota import charge_items, enforce
+from .search import index_folders, index_items
+from .storage import incref
+from social.timeline import fan_out
 from django.shortcuts import get_object_or_404
 
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def resolve_folder(user, relative_path=None, parent_folder_id=None):
+    """Return the folder an upload belongs in, creating any folders named in `relative_path`."""
+    folder = None
+
+    if parent_folder_id:
+        folder = get_object_or_404(Folder, id=parent_folder_id, owner=user)
+
+    resolver = FolderTreeResolver(user, folder)
+    resolver.resolve([relative_path])
+    return resolver.get(relative_path)
+
+def folder_parts(relative_path):
+    # 'A/B/photo.jpg' -> ('A', 'B'); the last segment is the file name
+    return tuple(part for part in (relative_path or '').split('/')[:-1] if part)
+
+class FolderTreeResolver:
+    """
+    Resolves the folders for a whole batch of relative paths at once.
+
+    Paths are walked one depth at a time, so the cost is one SELECT (plus at most one
+    bulk INSERT) per tree level instead of a get_or_create per segment per file.
+    """
+    def __init__(self, user, root=None):
+        self.user = user
+        self.root = root
+        self.folders = {(): root}
+
+    def resolve(self, relative_paths):
+        wanted = {parts[:depth] for parts in map(folder_parts, relative_paths) for depth in range(1, len(parts) + 1)}
+        max_depth = max((len(path) for path in wanted), default=0)
+
+        for depth in range(1, max_depth + 1):
+            level = sorted(path for path in wanted if len(path) == depth)
+            self._resolve_level(level)
+
+        return self.folders
+
+    def get(self, relative_path):
+        return self.folders[folder_parts(relative_path)]
+
+    def _parent_id(self, path):
+        parent = self.folders[path[:-1]]
+        return parent.id if parent else None
+
+    def _resolve_level(self, level):
+        parent_ids = {self._parent_id(path) for path in level}
+        parent_q = Q(parent_id__in=[pid for pid in parent_ids if pid is not None])
+        if None in parent_ids:
+            parent_q |= Q(parent__isnull=True)
+
+        existing = {
+            (folder.parent_id, folder.name): folder
+            for folder in Folder.objects.filter(parent_q, owner=self.user, name__in={path[-1] for path in level})
+        }
+
+        missing = []
+        for path in level:
+            folder = existing.get((self._parent_id(path), path[-1]))
+            if folder is None:
+                folder = Folder(name=path[-1], owner=self.user, parent=self.folders[path[:-1]])
+                missing.append(folder)
+            self.folders[path] = folder
+
+        if missing:
+            try:
+                with transaction.atomic():
+                    Folder.objects.bulk_create(missing)
+                    # bulk_create bypasses Folder.save and its signals, so add the closure rows and search entries here
+                    FolderClosure.link(missing)
+                    index_folders(Folder.objects.filter(pk__in=[folder.pk for folder in missing]))
+            except IntegrityError:
+                # Another request created some of these concurrently; fall back to one at a time.
+                for path in level:
+                    folder = self.folders[path]
+                    if folder.pk is None:
+                        self.folders[path], _ = Folder.objects.get_or_create(
+                            name=folder.name, owner=self.user, parent=folder.parent
+                        )
+
 class MediaItemViewSet(viewsets.ModelViewSet):
     serializer_class = MediaItemSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -11,24 +108,260 @@ class MediaItemViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return MediaItem.objects.filter(uploader=self.request.user)
 
+    def initial(self, request, *args, **kwargs):
+        # SessionAuthentication parses the body for its CSRF check, so the quota goes first
+        if self.action in ('create', 'batch'):
+            enforce(request._request)
+        super().initial(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         # Determine folder if relative_path is provided
-        relative_path = self.request.data.get('relative_path')
-        parent_folder_id = self.request.data.get('parent_folder_id')
-        folder = None
+        folder = resolve_folder(
+            self.request.user,
+            self.request.data.get('relative_path'),
+            self.request.data.get('parent_folder_id'),
+        )
+        serializer.save(uploader=self.request.user, folder=folder)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Ingest many files in one request.
 
+        Multipart fields: `files` (repeated), `relative_paths` (repeated, same order as `files`,
+        optional) and `parent_folder_id`. Responds with one manifest entry per file.
+        """
+        files = request.FILES.getlist('files')
+        relative_paths = request.data.getlist('relative_paths') if hasattr(request.data, 'getlist') else []
+        relative_paths += [''] * (len(files) - len(relative_paths))
+        if not files:
+            return Response({'error': 'No files provided.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        root = None
+        parent_folder_id = request.data.get('parent_folder_id')
         if parent_folder_id:
-            folder = get_object_or_404(Folder, id=parent_folder_id, owner=self.request.user)
-        
-        if relative_path and '/' in relative_path:
-            # Simple logic to handle folder structure from path
-            path_parts = relative_path.split('/')[:-1] # Exclude filename
-            current_parent = folder
-            for part in path_parts:
-                if part:
-                    current_parent, created = Folder.objects.get_or_create(
-                        name=part, owner=self.request.user, parent=current_parent
-                    )
-            folder = current_parent
+            root = get_object_or_404(Folder, id=parent_folder_id, owner=request.user)
 
-        serializer.save(uploader=self.request.user, folder=folder)
+        manifest = []
+        items = []
+        with transaction.atomic():
+            resolver = FolderTreeResolver(request.user, root)
+            resolver.resolve(relative_paths)
+
+            for index, (upload, relative_path) in enumerate(zip(files, relative_paths)):
+                entry = {'index': index, 'name': upload.name, 'relative_path': relative_path}
+                manifest.append(entry)
+                if not upload.size:
+                    entry.update(status='error', error='Empty file.')
+                    continue
+                item = MediaItem(uploader=request.user, folder=resolver.get(relative_path), file=upload, uploader_is_private=request.user.is_private)
+                item.apply_file_defaults()
+                items.append((entry, item))
+
+            # FileField.pre_save writes each file to storage as part of the insert
+            MediaItem.objects.bulk_create([item for _, item in items])
+            # bulk_create skips post_save, so count blob references and queue processing explicitly
+            for name, count in Counter(item.file.name for _, item in items).items():
+                incref(name, count)
+            items_added([item for _, item in items])
+            charge_items([item for _, item in items])
+            index_items(MediaItem.objects.filter(pk__in=[item.pk for _, item in items]))
+            enqueue_processing([item for _, item in items])
+            fan_out([item for _, item in items])
+
+        for entry, item in items:
+            entry.update(status='created', id=item.id, folder=item.folder_id, media_type=item.media_type)
+
+        created = sum(1 for entry in manifest if entry['status'] == 'created')
+        return Response(
+            {'created': created, 'failed': len(manifest) - created, 'results': manifest},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(detail=False, methods=['get'])
+    def duplicates(self, request):
+        """
+        Groups of near-identical images in the user's library: `?folder=<id>` limits the
+        search to one folder, `?distance=<bits>` sets how different two copies may be.
+        """
+        distance = self._distance(request)
+        images = self.get_queryset().filter(media_type='IMAGE')
+        folder_id = request.query_params.get('folder')
+        if folder_id:
+            images = images.filter(folder=get_object_or_404(Folder, pk=folder_id, owner=request.user))
+
+        index = HashIndex.from_queryset(images)
+        key = f'phash-groups:{index.fingerprint()}:{distance}'
+        groups = cache.get(key)
+        if groups is None:
+            groups = index.groups(distance)
+            cache.set(key, groups, settings.PHASH_GROUPS_CACHE_SECONDS)
+        total = len(groups)
+        groups = groups[:settings.PHASH_MAX_GROUPS]
+        items = self._summaries(id for group in groups for id in group)
+        return Response({
+            'distance': distance,
+            'indexed': len(index),
+            'total_groups': total,
+            'groups': [[items[pk] for pk in group if pk in items] for group in groups],
+        })
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Images in the user's library within `?distance=<bits>` of this one, closest first."""
+        item = self.get_object()
+        if item.phash is None:
+            return Response({'error': 'This item has no perceptual hash (not an image, or not processed yet).'}, status=status.HTTP_409_CONFLICT)
+
+        distance = self._distance(request)
+        index = HashIndex.from_queryset(self.get_queryset().filter(media_type='IMAGE').exclude(pk=item.pk))
+        ids, distances = index.near(item.phash, distance)
+        items = self._summaries(ids.tolist())
+        return Response({
+            'distance': distance,
+            'results': [dict(items[pk], distance=int(d)) for pk, d in zip(ids.tolist(), distances) if pk in items],
+        })
+
+    def _distance(self, request):
+        try:
+            distance = int(request.query_params.get('distance', settings.PHASH_DUPLICATE_DISTANCE))
+        except ValueError:
+            distance = settings.PHASH_DUPLICATE_DISTANCE
+        return min(max(distance, 0), settings.PHASH_MAX_DISTANCE)
+
+    def _summaries(self, ids):
+        items = MediaItem.objects.filter(pk__in=list(ids)).only('id', 'title', 'file', 'folder_id', 'width', 'height', 'created_at')
+        return {
+            item.id: {
+                'id': item.id, 'title': item.title, 'url': item.file.url, 'folder': item.folder_id,
+                'width': item.width, 'height': item.height, 'created_at': item.created_at,
+            }
+            for item in items
+        }
+
+    @action(detail=False, methods=['get'], url_path='status')
+    def processing_status(self, request):
+        """Poll processing state: `?ids=1,2,3`. Live updates are also pushed on ws/media/status/."""
+        try:
+            ids = [int(pk) for pk in request.query_params.get('ids', '').split(',') if pk]
+        except ValueError:
+            return Response({'error': 'ids must be a comma separated list of integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'items': job_status(ids[:500], request.user)})
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable uploads.
+
+    POST   /uploads/                 create a session (filename, total_size, relative_path, parent_folder_id)
+    GET    /uploads/<id>/            committed offset (also sent as the Upload-Offset header, HEAD works too)
+    PUT    /uploads/<id>/            write a byte range, `Content-Range: bytes start-end/total`
+    PATCH  /uploads/<id>/            same as PUT
+    POST   /uploads/<id>/finalize/   turn the completed upload into a MediaItem
+    DELETE /uploads/<id>/            abort and remove the partial file
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(uploader=self.request.user)
+
+    def perform_create(self, serializer):
+        enforce(self.request, serializer.validated_data['total_size'])
+        serializer.save(uploader=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        session = self.get_object()
+        return self._offset_response(session)
+
+    def perform_destroy(self, instance):
+        if not instance.media_item_id and default_storage.exists(instance.storage_path):
+            default_storage.delete(instance.storage_path)
+        instance.delete()
+
+    def update(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+
+        content_range = request.headers.get('Content-Range')
+        if content_range:
+            match = CONTENT_RANGE_RE.match(content_range.strip())
+            if not match:
+                return Response({'error': 'Malformed Content-Range header.'}, status=status.HTTP_400_BAD_REQUEST)
+            start, end, total = int(match.group(1)), int(match.group(2)), match.group(3)
+            if end < start or end - start + 1 != length:
+                return Response({'error': 'Content-Range does not match the request body.'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            start = total = None
+
+        with transaction.atomic():
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if session.media_item_id:
+                return Response({'error': 'Upload already finalized.'}, status=status.HTTP_409_CONFLICT)
+            if total not in (None, '*') and int(total) != session.total_size:
+                return Response({'error': 'Content-Range total does not match the declared upload size.'}, status=status.HTTP_400_BAD_REQUEST)
+            if start is None:
+                start = session.offset
+            # Only the next byte after the committed offset may be written; anything else is a
+            # retry of data we already have (or a gap), so tell the client where to resume.
+            if start != session.offset:
+                return self._offset_response(session, status.HTTP_409_CONFLICT)
+            if start + length > session.total_size:
+                return Response({'error': 'Chunk exceeds the declared upload size.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            session.offset = start + self._write_chunk(request, session, start, length)
+            session.save(update_fields=['offset', 'updated_at'])
+
+        return self._offset_response(session)
+
+    partial_update = update
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        with transaction.atomic():
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if session.media_item_id:
+                return Response(MediaItemSerializer(session.media_item, context={'request': request}).data)
+            # The file is missing if the stale-session cleanup got to it first
+            written = default_storage.size(session.storage_path) if default_storage.exists(session.storage_path) else 0
+            if not session.is_complete or written != session.total_size:
+                return self._offset_response(session, status.HTTP_409_CONFLICT)
+
+            folder = resolve_folder(request.user, session.relative_path, session.parent_folder_id)
+            item = MediaItem(uploader=request.user, folder=folder, title=session.title or session.filename)
+            item.file.name = item.file.storage.adopt(session.storage_path)
+            item.save()
+
+            session.media_item = item
+            session.save(update_fields=['media_item', 'updated_at'])
+
+        return Response(MediaItemSerializer(item, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+    def _write_chunk(self, request, session, start, length):
+        # Stream the body straight into the final file; never hold more than one read buffer.
+        path = default_storage.path(session.storage_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+b') as fh:
+            fh.seek(start)
+            fh.truncate()  # drop bytes past the committed offset left by an interrupted chunk
+            while written < length:
+                data = request.stream.read(min(settings.UPLOAD_CHUNK_READ_SIZE, length - written))
+                if not data:
+                    break
+                fh.write(data)
+                written += len(data)
+        return written
+
+    def _offset_response(self, session, status_code=status.HTTP_200_OK):
+        data = self.get_serializer(session).data
+        return Response(data, status=status_code, headers={'Upload-Offset': str(session.offset)})
+
+class DeletionViewSet(viewsets.ReadOnlyModelViewSet):
+    """Progress of the user's background deletions (see media.reaper)."""
+    serializer_class = DeletionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Deletion.objects.filter(owner=self.request.user)
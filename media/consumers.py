@@ -0,0 +1,26 @@
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from .jobs import status_group
+
+class MediaStatusConsumer(AsyncWebsocketConsumer):
+    """Pushes processing updates for the connected user's uploads."""
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = status_group(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def media_status(self, event):
+        await self.send(text_data=json.dumps({
+            'media_id': event['media_id'],
+            'is_processed': event['is_processed'],
+        }))
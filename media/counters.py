@@ -0,0 +1,100 @@
+"""
+Denormalised folder statistics.
+
+Folder.item_count (items directly in the folder), Folder.total_size (bytes in the
+folder and everything below it) and Folder.cover_cache (the resolved cover) let
+folder cards render without per-folder queries. The signals in media.signals keep
+them current with F() updates - a size change reaches every ancestor through the
+closure table in one UPDATE - and `manage.py reconcile_folder_stats` repairs drift.
+"""
+from django.apps import apps as global_apps
+from django.core.files.storage import default_storage
+from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Folder, FolderClosure, MediaItem
+
+def shift(folder_id, items=0, size=0):
+    """Add `items` to the folder's count and `size` bytes to it and all of its ancestors."""
+    if folder_id is None:
+        return
+    if items:
+        Folder.all_objects.filter(pk=folder_id).update(item_count=F('item_count') + items)
+    if size:
+        ancestors = FolderClosure.objects.filter(descendant_id=folder_id).values('ancestor_id')
+        Folder.all_objects.filter(pk__in=ancestors).update(total_size=F('total_size') + size)
+
+def no_cover():
+    return Q(cover_image='') | Q(cover_image__isnull=True)
+
+def cover_expression(item_model):
+    newest_image = (
+        item_model.objects.filter(folder=OuterRef('pk'), media_type='IMAGE')
+        .order_by('-created_at', '-id').values('file')[:1]
+    )
+    return Case(
+        When(no_cover(), then=Coalesce(Subquery(newest_image), Value(''))),
+        default=F('cover_image'),
+        output_field=models.CharField(),
+    )
+
+def refresh_covers(folders):
+    """Re-resolve cover_cache for a Folder queryset in one UPDATE."""
+    folders.update(cover_cache=cover_expression(MediaItem))
+
+def items_added(items):
+    """Counters for MediaItems created with bulk_create, which skips post_save."""
+    totals = {}
+    for item in items:
+        if item.folder_id:
+            count, size = totals.get(item.folder_id, (0, 0))
+            totals[item.folder_id] = (count + 1, size + item.file_size)
+    for folder_id, (count, size) in totals.items():
+        shift(folder_id, count, size)
+    with_images = {item.folder_id for item in items if item.folder_id and item.media_type == 'IMAGE'}
+    if with_images:
+        refresh_covers(Folder.objects.filter(no_cover(), pk__in=with_images))
+
+def reconcile(apps=global_apps):
+    """
+    Recompute file sizes that were never recorded and every folder's counters from
+    scratch; returns the number of folders that had drifted. Takes an app registry so
+    migrations can run it against historical models.
+    """
+    folder_model = apps.get_model('media', 'Folder')
+    item_model = apps.get_model('media', 'MediaItem')
+    blob_model = apps.get_model('media', 'Blob')
+
+    unsized = item_model._base_manager.filter(file_size=0)
+    unsized.update(file_size=Coalesce(Subquery(blob_model.objects.filter(name=OuterRef('file')).values('size')[:1]), 0))
+    # Files outside the blob store (older uploads) have to be stat'ed
+    for pk, name in unsized.exclude(file='').values_list('pk', 'file'):
+        try:
+            item_model._base_manager.filter(pk=pk).update(file_size=default_storage.size(name))
+        except OSError:
+            pass
+
+    # Items queued for deletion still count until the reaper removes them
+    items = item_model._base_manager
+    direct = items.filter(folder=OuterRef('pk')).order_by().values('folder').annotate(n=Count('pk')).values('n')
+    subtree = (
+        items.filter(folder__ancestor_links__ancestor=OuterRef('pk')).order_by()
+        .values('folder__ancestor_links__ancestor').annotate(total=Sum('file_size')).values('total')
+    )
+    real_cover = cover_expression(item_model)
+    if any(field.name == 'deletion' for field in folder_model._meta.fields):
+        # Covers resolve to live items only, so a tombstoned folder keeps its last one
+        real_cover = Case(When(deletion__isnull=True, then=real_cover), default=F('cover_cache'))
+    drifted = folder_model._base_manager.annotate(
+        real_count=Coalesce(Subquery(direct), 0),
+        real_size=Coalesce(Subquery(subtree), 0),
+        real_cover=real_cover,
+    ).filter(~Q(item_count=F('real_count')) | ~Q(total_size=F('real_size')) | ~Q(cover_cache=F('real_cover')))
+
+    fixed = [
+        folder_model(pk=pk, item_count=count, total_size=size, cover_cache=cover)
+        for pk, count, size, cover in drifted.values_list('pk', 'real_count', 'real_size', 'real_cover').iterator()
+    ]
+    folder_model._base_manager.bulk_update(fixed, ['item_count', 'total_size', 'cover_cache'], batch_size=500)
+    return len(fixed)
@@ -0,0 +1,210 @@
+"""
+Permission-checked delivery of stored files.
+
+Everything under MEDIA_URL is routed through `serve_media`, which looks up the
+objects referencing the requested file and applies the same visibility rules as
+the detail pages before any bytes are sent. The bytes go out through the front
+proxy (X-Accel-Redirect / X-Sendfile) when MEDIA_SENDFILE_BACKEND is set;
+otherwise as a FileResponse whose file object WSGI servers pass to os.sendfile.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .models import Folder, MediaItem, Rendition
+
+# Files anyone may fetch without a lookup
+PUBLIC_PREFIXES = ('profile_pics',)
+# Per-item output directories: <prefix>/<MediaItem id>/...
+ITEM_DIR_PREFIXES = ('hls', 'previews')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# mimetypes gets these wrong or does not know them on every platform
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.vtt': 'text/vtt',
+}
+
+def can_view(user, owner, is_private=False):
+    """Visibility rule of media_detail / folder_detail: private content is for the owner, admins and followers."""
+    if not (is_private or owner.is_private):
+        return True
+    if not user.is_authenticated:
+        return False
+    if user.is_superuser or owner.pk == user.pk:
+        return True
+    from social.models import Follow
+    return Follow.objects.filter(follower=user, followed=owner, is_accepted=True).exists()
+
+def download_denied(user, uploader):
+    """The uploader's download_preference check; returns the reason `user` may not download, or None."""
+    if not user.is_authenticated:
+        return 'Log in to download this content.'
+    if user.is_superuser or uploader.pk == user.pk:
+        return None
+
+    if uploader.download_preference == 'RESTRICTED':
+        # Check if user is an uploader/admin OR explicitly allowed
+        is_explicitly_allowed = uploader.allowed_downloaders.filter(id=user.id).exists()
+        if not (user.is_uploader or is_explicitly_allowed):
+            return 'Downloads for this content are restricted. You need explicit permission from the uploader.'
+
+    elif uploader.download_preference == 'FOLLOWERS':
+        from social.models import Follow
+        if not Follow.objects.filter(follower=user, followed=uploader, is_accepted=True).exists():
+            return 'You must be a follower to download this user\'s content.'
+
+    return None
+
+def find_grant(user, name):
+    """
+    Return whatever entitles `user` to the stored file `name`: a MediaItem, Folder or
+    ChatMessage that references it and is visible to them, True for public files, or
+    None. Blobs are shared, so one visible reference is enough.
+    """
+    head, _, rest = name.partition('/')
+    if head in PUBLIC_PREFIXES:
+        return True
+
+    if head in ITEM_DIR_PREFIXES:
+        item_id = rest.split('/', 1)[0]
+        items = MediaItem.objects.filter(pk=item_id) if item_id.isdigit() else MediaItem.objects.none()
+    else:
+        rendition_of = Rendition.objects.filter(file=name).values('media_item_id')
+        items = (MediaItem.objects.filter(file=name) | MediaItem.objects.filter(thumbnail=name)
+                 | MediaItem.objects.filter(pk__in=rendition_of))
+
+    for item in items.select_related('uploader'):
+        if can_view(user, item.uploader, item.is_private):
+            return item
+
+    if head in ITEM_DIR_PREFIXES:
+        return None
+
+    for folder in Folder.objects.filter(cover_image=name).select_related('owner'):
+        if can_view(user, folder.owner, folder.is_private):
+            return folder
+
+    if user.is_authenticated:
+        from chat.models import ChatMessage
+        message = ChatMessage.objects.filter(attachment=name, thread__participants=user).first()
+        if message:
+            return message
+
+    return None
+
+class RangeFile:
+    """Bytes [start, start + length) of a file. Exposes fileno() so a WSGI file_wrapper can sendfile() it."""
+    def __init__(self, path, start, length):
+        self._fh = open(path, 'rb')
+        self._fh.seek(start)
+        self.remaining = length
+
+    def fileno(self):
+        return self._fh.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self._fh.close()
+
+def parse_range(header, size):
+    """
+    (start, end) for a single `bytes=` range, None if it cannot be satisfied.
+    Raises ValueError for anything else (multiple ranges, other units), which is served in full.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        raise ValueError(header)
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            raise ValueError(header)
+    else:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+        if int(last) == 0:
+            return None
+    if start >= size:
+        return None
+    return start, end
+
+def if_range_matches(request, etag, last_modified):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag  # strong comparison: weak validators never match
+    return parse_http_date_safe(value) == last_modified
+
+def send_file(request, name, filename=None, public=False):
+    """Serve stored file `name` with conditional GET and byte-range support."""
+    path = default_storage.path(name)
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+
+    size, last_modified = st.st_size, int(st.st_mtime)
+    etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = CONTENT_TYPES.get(os.path.splitext(name)[1].lower()) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        backend = settings.MEDIA_SENDFILE_BACKEND
+        if backend == 'nginx':
+            # nginx reads the file from its `internal` location and applies Range itself
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_LOCATION + quote(name)
+        elif backend == 'xsendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+        else:
+            response = _stream(request, path, size, etag, last_modified, content_type)
+        if filename:
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    patch_cache_control(response, public=public, private=not public, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
+
+def _stream(request, path, size, etag, last_modified, content_type):
+    start, end, status = 0, size - 1, 200
+    range_header = request.headers.get('Range')
+    if range_header and size and if_range_matches(request, etag, last_modified):
+        try:
+            span = parse_range(range_header, size)
+        except ValueError:
+            span = (start, end)
+        else:
+            if span is None:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+            status = 206
+        start, end = span
+
+    length = end - start + 1 if size else 0
+    response = FileResponse(RangeFile(path, start, length), status=status, content_type=content_type)
+    response['Content-Length'] = length
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
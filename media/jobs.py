@@ -0,0 +1,181 @@
+"""
+DB-backed job queue for media post-processing.
+
+Uploads only enqueue rows here; `manage.py process_media` claims and runs them in a
+process pool. A claimed job is leased until `locked_until`; if the worker dies the
+lease expires and the job is handed out again. Failures are retried with exponential
+backoff until `max_attempts`, after which the job is marked FAILED.
+"""
+import datetime
+import logging
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MediaItem, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+# Jobs enqueued for a new MediaItem, by media type
+PIPELINES = {
+    'VIDEO': ['metadata', 'thumbnail', 'hls', 'previews'],
+    'IMAGE': ['metadata', 'renditions', 'phash', 'placeholder'],
+    'DOCUMENT': [],
+    'OTHER': [],
+}
+
+class RetryLater(Exception):
+    """Raised by a task that cannot run right now (e.g. no free slot); it is rescheduled without using an attempt."""
+    def __init__(self, delay=30):
+        super().__init__(f"retry in {delay}s")
+        self.delay = delay
+
+def task(kind):
+    def register(func):
+        TASKS[kind] = func
+        return func
+    return register
+
+def enqueue(kind, media_item=None, delay=0, **payload):
+    job = ProcessingJob.objects.create(
+        kind=kind, media_item=media_item, payload=payload,
+        max_attempts=settings.MEDIA_JOB_MAX_ATTEMPTS,
+        run_after=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+    if media_item is not None:
+        MediaItem.objects.filter(pk=media_item.pk, is_processed=True).update(is_processed=False)
+    return job
+
+def enqueue_processing(items):
+    """Queue the pipeline for each new item; items with nothing to do are marked processed."""
+    jobs = [
+        ProcessingJob(kind=kind, media_item=item, max_attempts=settings.MEDIA_JOB_MAX_ATTEMPTS)
+        for item in items for kind in PIPELINES.get(item.media_type, [])
+    ]
+    ProcessingJob.objects.bulk_create(jobs)
+
+    queued = {job.media_item_id for job in jobs}
+    idle = [item.pk for item in items if item.pk not in queued]
+    if idle:
+        MediaItem.objects.filter(pk__in=idle).update(is_processed=True)
+    return jobs
+
+def claim(limit):
+    """Lease up to `limit` runnable jobs and return their ids."""
+    now = timezone.now()
+    lease = now + datetime.timedelta(seconds=settings.MEDIA_JOB_VISIBILITY_TIMEOUT)
+
+    # Leases that ran out on their last allowed attempt are not retried again
+    expired = ProcessingJob.objects.filter(status='RUNNING', locked_until__lt=now, attempts__gte=F('max_attempts'))
+    for job in expired:
+        _fail(job, 'Visibility timeout expired on final attempt.')
+
+    runnable = ProcessingJob.objects.filter(
+        Q(status='PENDING', run_after__lte=now) | Q(status='RUNNING', locked_until__lt=now),
+        attempts__lt=F('max_attempts'),
+    )
+    claimed = []
+    for job in runnable.values('id', 'status', 'locked_until')[:limit * 2]:
+        # Conditional UPDATE so two workers can never lease the same job
+        won = ProcessingJob.objects.filter(
+            id=job['id'], status=job['status'], locked_until=job['locked_until']
+        ).update(status='RUNNING', locked_until=lease, attempts=F('attempts') + 1, updated_at=now)
+        if won:
+            claimed.append(job['id'])
+            if len(claimed) == limit:
+                break
+    return claimed
+
+def extend_lease(job, seconds):
+    """For long tasks: keep the job leased past the default visibility timeout."""
+    ProcessingJob.objects.filter(id=job.id, status='RUNNING').update(
+        locked_until=timezone.now() + datetime.timedelta(seconds=seconds)
+    )
+
+def run_job(job_id):
+    """Run one leased job. Executed inside a worker process."""
+    from . import tasks  # noqa: F401 -- registers TASKS
+
+    job = ProcessingJob.objects.select_related('media_item').filter(id=job_id, status='RUNNING').first()
+    if job is None:
+        return None
+
+    try:
+        func = TASKS[job.kind]
+        func(job)
+    except RetryLater as exc:
+        ProcessingJob.objects.filter(id=job.id).update(
+            status='PENDING', locked_until=None, attempts=F('attempts') - 1,
+            run_after=timezone.now() + datetime.timedelta(seconds=exc.delay), updated_at=timezone.now(),
+        )
+        return 'DEFERRED'
+    except Exception as exc:
+        logger.warning("Job %s (%s) failed on attempt %s: %s", job.id, job.kind, job.attempts, exc)
+        if job.attempts >= job.max_attempts:
+            _fail(job, traceback.format_exc())
+            return 'FAILED'
+        else:
+            backoff = min(settings.MEDIA_JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1), settings.MEDIA_JOB_MAX_BACKOFF)
+            ProcessingJob.objects.filter(id=job.id).update(
+                status='PENDING', locked_until=None, last_error=traceback.format_exc(),
+                run_after=timezone.now() + datetime.timedelta(seconds=backoff), updated_at=timezone.now(),
+            )
+        return 'PENDING'
+
+    ProcessingJob.objects.filter(id=job.id).update(
+        status='DONE', locked_until=None, finished_at=timezone.now(), updated_at=timezone.now()
+    )
+    _settle(job)
+    return 'DONE'
+
+def _fail(job, error):
+    ProcessingJob.objects.filter(id=job.id).update(
+        status='FAILED', locked_until=None, last_error=error,
+        finished_at=timezone.now(), updated_at=timezone.now(),
+    )
+    logger.error("Job %s (%s) gave up after %s attempts", job.id, job.kind, job.attempts)
+    _settle(job)
+
+def _settle(job):
+    """Flip is_processed once nothing is outstanding for the item, and tell anyone listening."""
+    if job.media_item_id is None:
+        return
+    with transaction.atomic():
+        outstanding = ProcessingJob.objects.filter(media_item_id=job.media_item_id, status__in=['PENDING', 'RUNNING'])
+        if outstanding.exists():
+            return
+        MediaItem.objects.filter(pk=job.media_item_id).update(is_processed=True)
+    notify(job.media_item)
+
+def job_status(item_ids, user):
+    """Processing state for the given items, as returned by the status API."""
+    items = MediaItem.objects.filter(pk__in=item_ids, uploader=user).only('id', 'is_processed')
+    jobs = ProcessingJob.objects.filter(media_item_id__in=item_ids).values('media_item_id', 'kind', 'status', 'attempts', 'updated_at')
+    by_item = {}
+    for job in jobs:
+        by_item.setdefault(job['media_item_id'], []).append({k: v for k, v in job.items() if k != 'media_item_id'})
+    return [{'id': item.id, 'is_processed': item.is_processed, 'jobs': by_item.get(item.id, [])} for item in items]
+
+def status_group(user_id):
+    return f'media_status_{user_id}'
+
+def notify(media_item):
+    """Push a processing update to the uploader's websocket group (needs a shared channel layer, e.g. Redis)."""
+    try:
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        async_to_sync(channel_layer.group_send)(status_group(media_item.uploader_id), {
+            'type': 'media_status',
+            'media_id': media_item.id,
+            'is_processed': True,
+        })
+    except Exception as exc:
+        logger.warning("Could not publish status for media %s: %s", media_item.id, exc)
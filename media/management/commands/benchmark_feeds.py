@@ -0,0 +1,97 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from media.models import MediaItem
+from social.models import Follow
+
+MEDIA_TYPES = ['IMAGE', 'VIDEO', 'DOCUMENT', 'OTHER']
+FEED_INDEXES = ['media_live_recent_idx', 'media_live_type_idx', 'media_public_recent_idx', 'media_public_type_idx', 'media_uploader_feed_idx']
+
+class Rollback(Exception):
+    pass
+
+def legacy_feed(user):
+    """The predicate home/all_media built inline before MediaItem.objects.visible_to."""
+    qs = MediaItem.objects.filter(is_hidden=False)
+    if not user.is_authenticated:
+        return qs.filter(is_private=False, uploader__is_private=False)
+    followed = Follow.objects.filter(follower=user, is_accepted=True).values_list('followed_id', flat=True)
+    return qs.filter((Q(is_private=False) & Q(uploader__is_private=False)) | Q(uploader=user) | Q(uploader_id__in=followed))
+
+class Command(BaseCommand):
+    help = "Time the feed visibility query against the old join-based predicate on synthetic data (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--items', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=50, help="Accounts the benchmark viewer follows")
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--explain', action='store_true', help="Print the query plans")
+
+    def handle(self, *args, users, items, follows, runs, explain, **kwargs):
+        self.runs, self.explain = runs, explain
+        try:
+            with transaction.atomic():
+                viewer = self.seed(users, items, follows)
+                cases = [('anonymous', AnonymousUser(), None), ('anonymous, videos', AnonymousUser(), 'VIDEO'), ('follower', viewer, None), ('follower, images', viewer, 'IMAGE')]
+                new = {label: self.measure(MediaItem.objects.visible_to(user), media_type) for label, user, media_type in cases}
+                # The old predicate, without the indexes added alongside visible_to
+                # (plain SQL: SQLite will not open a schema editor inside a transaction)
+                with connection.cursor() as cursor:
+                    for name in FEED_INDEXES:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                old = {label: self.measure(legacy_feed(user), media_type) for label, user, media_type in cases}
+                for label, *_ in cases:
+                    self.stdout.write(f"{label:<20} before {old[label] * 1000:8.2f} ms   after {new[label] * 1000:8.2f} ms   x{old[label] / new[label]:.1f}")
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, users, items, follows):
+        User = get_user_model()
+        tag = f'bench{int(time.time())}'
+        accounts = User.objects.bulk_create([
+            User(username=f'{tag}_{n}', email=f'{tag}_{n}@example.com', password='!', is_private=random.random() < 0.2)
+            for n in range(users)
+        ])
+        viewer = accounts[0]
+        Follow.objects.bulk_create([Follow(follower=viewer, followed=followed) for followed in random.sample(accounts[1:], min(follows, users - 1))])
+
+        now = timezone.now()
+        batch = []
+        for n in range(items):
+            uploader = random.choice(accounts)
+            batch.append(MediaItem(
+                uploader=uploader, uploader_is_private=uploader.is_private, title=f'{tag} {n}', file=f'bench/{n}.bin',
+                media_type=random.choice(MEDIA_TYPES), is_private=random.random() < 0.1, is_hidden=random.random() < 0.05,
+            ))
+        MediaItem.objects.bulk_create(batch, batch_size=1000)
+        # auto_now_add stamps every row with the same time; spread them over a year
+        for item in batch:
+            item.created_at = now - timedelta(seconds=random.randrange(365 * 86400))
+        MediaItem.objects.bulk_update(batch, ['created_at'], batch_size=1000)
+        with connection.cursor() as cursor:
+            if connection.vendor in ('sqlite', 'postgresql'):
+                cursor.execute('ANALYZE')
+        self.stdout.write(f"Seeded {users} users and {items} items.")
+        return viewer
+
+    def measure(self, qs, media_type):
+        if media_type:
+            qs = qs.filter(media_type=media_type)
+        qs = qs.order_by('-created_at').values_list('pk', flat=True)[:24]
+        if self.explain:
+            self.stdout.write(qs.explain())
+        list(qs.all())
+        start = time.perf_counter()
+        for _ in range(self.runs):
+            list(qs.all())  # a fresh queryset each time, not the cached result
+        return (time.perf_counter() - start) / self.runs
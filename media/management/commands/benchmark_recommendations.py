@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from media import recommend
+from media.related import interactions
+
+def synthetic(users, items, per_user, seed):
+    """Interactions drawn from hidden tastes plus heavy-tailed item popularity, as dense (users, items, weights)."""
+    rng = np.random.default_rng(seed)
+    tastes, traits = rng.normal(size=(users, 8)), rng.normal(size=(items, 8))
+    popularity = np.log(rng.pareto(1.2, items) + 1)
+    rows, cols = [], []
+    for begin in range(0, users, 1000):
+        affinity = tastes[begin:begin + 1000] @ traits.T + popularity + rng.gumbel(size=(min(1000, users - begin), items))
+        picked = np.argpartition(-affinity, per_user, axis=1)[:, :per_user]
+        rows.append(np.repeat(np.arange(begin, begin + len(picked)), per_user))
+        cols.append(picked.ravel())
+    weights = rng.choice([1.0, 3.0, 4.0], size=users * per_user, p=[0.8, 0.15, 0.05])
+    return np.concatenate(rows), np.concatenate(cols), weights
+
+class Command(BaseCommand):
+    help = "Offline evaluation and timing of the recommendation model, on synthetic or stored interactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stored', action='store_true', help="Use the stored views, likes and favorites instead of synthetic data")
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--items', type=int, default=5000)
+        parser.add_argument('--per-user', type=int, default=20)
+        parser.add_argument('--holdout', type=float, default=0.2)
+        parser.add_argument('-k', type=int, default=10)
+        parser.add_argument('--factors', type=int, nargs='+', default=[None], help="Factor counts to compare")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, stored, users, items, per_user, holdout, k, factors, seed, **kwargs):
+        if stored:
+            user_ids, item_ids, weights = interactions()
+            _, rows = np.unique(user_ids, return_inverse=True)
+            _, cols = np.unique(item_ids, return_inverse=True)
+        else:
+            start = time.perf_counter()
+            rows, cols, weights = synthetic(users, items, per_user, seed)
+            self.stdout.write(f"Generated {len(rows)} synthetic interactions in {time.perf_counter() - start:.1f} s")
+        if not len(rows):
+            self.stdout.write("No interactions to evaluate.")
+            return
+        n_users, n_items = rows.max() + 1, cols.max() + 1
+        self.stdout.write(f"{n_users} users, {n_items} items, {len(rows)} interactions; holding out {holdout:.0%} per user")
+
+        for count in factors:
+            params = {'factors': count} if count else {}
+            result = recommend.evaluate(rows, cols, weights, n_users, n_items, holdout=holdout, k=k, seed=seed, **params)
+            self.stdout.write(
+                f"factors={count or 'default'}: fit {result['fit_seconds']:.1f} s, "
+                f"top-{k} for {result['users']} users {result['rank_seconds']:.2f} s"
+            )
+            for name in ('als', 'popular'):
+                self.stdout.write('  ' + f"{name:8}" + '  '.join(f"{metric} {value:.4f}" for metric, value in result[name].items()))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from media import recommend
+
+class Command(BaseCommand):
+    help = "Refit the recommendation model and store each active user's recommended items"
+
+    def handle(self, *args, **kwargs):
+        written, fitted = recommend.refresh()
+        self.stdout.write(self.style.SUCCESS(f"Stored recommendations for {written} users (model fitted in {fitted:.1f} s)."))
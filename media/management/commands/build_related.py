@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+from media import related
+
+class Command(BaseCommand):
+    help = "Refresh the precomputed related items of media with new views, likes or favorites"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every item, e.g. nightly to account for removed likes")
+
+    def handle(self, *args, full, **kwargs):
+        start = time.perf_counter()
+        written = related.refresh(full=full)
+        self.stdout.write(self.style.SUCCESS(f"Wrote related items for {written} media in {time.perf_counter() - start:.1f} s."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from media import trending
+
+class Command(BaseCommand):
+    help = "Drop trending scores that have decayed below TRENDING_MIN_SCORE (run periodically, e.g. hourly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Recompute every score from the like/favorite/view/download logs instead")
+
+    def handle(self, *args, rebuild, **kwargs):
+        if rebuild:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {trending.rebuild()} trending scores."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Dropped {trending.compact()} cold trending scores."))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from media.models import MediaItem
+from media.pool import worker_pool
+from media.tasks import compute_phash_for
+
+class Command(BaseCommand):
+    help = "Compute perceptual hashes for existing images using a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.MEDIA_WORKER_PROCESSES)
+        parser.add_argument('--all', dest='revisit', action='store_true', help="Also rehash images that already have a hash")
+
+    def handle(self, *args, workers, revisit, **kwargs):
+        items = MediaItem.objects.filter(media_type='IMAGE')
+        if not revisit:
+            items = items.filter(phash__isnull=True)
+        ids = list(items.values_list('id', flat=True))
+        self.stdout.write(f"Hashing {len(ids)} images with {workers} workers...")
+
+        hashed = failed = 0
+        with worker_pool(workers) as pool:
+            futures = {pool.submit(compute_phash_for, pk): pk for pk in ids}
+            for future, pk in futures.items():
+                try:
+                    hashed += future.result() is not None
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"Image {pk}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {hashed} images ({failed} failed)."))
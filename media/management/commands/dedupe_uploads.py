@@ -0,0 +1,95 @@
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from chat.models import ChatMessage
+from media.jobs import enqueue
+from media.models import Blob, Folder, MediaItem
+from media.storage import HASH_CHUNK_SIZE, blob_name, blob_storage, is_blob
+
+# Every field stored through the content-addressed storage
+BLOB_FIELDS = [
+    (MediaItem, 'file'),
+    (ChatMessage, 'attachment'),
+    (Folder, 'cover_image'),
+]
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class Command(BaseCommand):
+    help = "Move legacy uploads into the content-addressed blob store, merging duplicates, and rebuild reference counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Files hashed in parallel")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, workers, dry_run, **kwargs):
+        storage = blob_storage()
+
+        legacy = set()
+        for model, field in BLOB_FIELDS:
+            names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True)
+            legacy.update(name for name in names.distinct() if not is_blob(name))
+        legacy = sorted(name for name in legacy if storage.exists(name))
+        self.stdout.write(f"Hashing {len(legacy)} legacy files with {workers} workers...")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digests = dict(zip(legacy, pool.map(lambda name: sha256_file(storage.path(name)), legacy)))
+
+        moved = merged = saved_bytes = 0
+        for name, digest in digests.items():
+            target = blob_name(digest, os.path.splitext(name)[1])
+            duplicate = storage.exists(target)
+            if duplicate:
+                merged += 1
+                saved_bytes += storage.size(name)
+            else:
+                moved += 1
+            if dry_run:
+                continue
+
+            if not duplicate:
+                # Link (or copy) first so the old path stays valid until the rows are repointed
+                os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+                try:
+                    os.link(storage.path(name), storage.path(target))
+                except OSError:
+                    shutil.copy2(storage.path(name), storage.path(target))
+            Blob.objects.get_or_create(name=target, defaults={'sha256': digest, 'size': storage.size(target)})
+
+            with transaction.atomic():
+                for model, field in BLOB_FIELDS:
+                    model.objects.filter(**{field: name}).update(**{field: target})
+            os.remove(storage.path(name))
+
+        if not dry_run:
+            self.rebuild_ref_counts()
+
+        verb = "Would move" if dry_run else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved} files into the blob store and merged {merged} duplicates ({saved_bytes} bytes freed)."
+        ))
+
+    def rebuild_ref_counts(self):
+        counts = {}
+        for model, field in BLOB_FIELDS:
+            for row in model.objects.filter(**{f'{field}__startswith': 'blobs/'}).values(field).annotate(n=Count('pk')):
+                counts[row[field]] = counts.get(row[field], 0) + row['n']
+
+        for blob in Blob.objects.iterator():
+            expected = counts.get(blob.name, 0)
+            if blob.ref_count != expected:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=expected)
+                if expected == 0:
+                    enqueue('purge_blob', name=blob.name, delay=settings.BLOB_PURGE_GRACE_SECONDS)
@@ -0,0 +1,63 @@
+import json
+import os
+from concurrent.futures import wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from media.models import MediaItem
+from media.pool import worker_pool
+from media.tasks import read_metadata_for
+
+class Command(BaseCommand):
+    help = "Backfill duration/width/height for existing videos and images. Resumable via a checkpoint file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.MEDIA_WORKER_PROCESSES)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--checkpoint', default='extract_metadata.checkpoint',
+                            help="File recording the last fully processed id")
+        parser.add_argument('--all', dest='revisit', action='store_true',
+                            help="Re-read items that already have metadata")
+        parser.add_argument('--reset', action='store_true', help="Ignore an existing checkpoint")
+
+    def handle(self, *args, workers, batch_size, checkpoint, revisit, reset, **kwargs):
+        last_id = 0 if reset else self.read_checkpoint(checkpoint)
+        items = MediaItem.objects.filter(media_type__in=['VIDEO', 'IMAGE'], id__gt=last_id).order_by('id')
+        if not revisit:
+            items = items.filter(Q(width__isnull=True) | Q(height__isnull=True) | Q(media_type='VIDEO', duration__isnull=True))
+        ids = list(items.values_list('id', flat=True))
+        self.stdout.write(f"Probing {len(ids)} items with {workers} workers (resuming after id {last_id})...")
+
+        done = failed = 0
+        with worker_pool(workers) as pool:
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                futures = {pool.submit(read_metadata_for, pk): pk for pk in batch}
+                wait(futures)
+                for future, pk in futures.items():
+                    try:
+                        done += bool(future.result())
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f"Item {pk}: {exc}")
+                # The whole batch has finished, so everything up to its last id is done
+                self.write_checkpoint(checkpoint, batch[-1])
+                self.stdout.write(f"  {start + len(batch)}/{len(ids)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {done} items ({failed} failed)."))
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as fh:
+                return int(json.load(fh)['last_id'])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def write_checkpoint(self, path, last_id):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump({'last_id': last_id}, fh)
+        os.replace(tmp, path)
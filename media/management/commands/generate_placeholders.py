@@ -0,0 +1,46 @@
+from concurrent.futures import wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from media.models import MediaItem
+from media.pool import worker_pool
+from media.tasks import build_placeholder_for
+
+class Command(BaseCommand):
+    help = "Backfill inline placeholders and dominant colours for images and video thumbnails"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.MEDIA_WORKER_PROCESSES)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', dest='revisit', action='store_true', help="Also redo items that already have one")
+
+    def handle(self, *args, workers, batch_size, revisit, **kwargs):
+        items = MediaItem.objects.filter(Q(media_type='IMAGE') | Q(media_type='VIDEO', thumbnail__gt=''))
+        if not revisit:
+            items = items.filter(placeholder='')
+        ids = list(items.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f"Building placeholders for {len(ids)} items with {workers} workers...")
+
+        done = failed = 0
+        with worker_pool(workers) as pool:
+            for start in range(0, len(ids), batch_size):
+                futures = {pool.submit(build_placeholder_for, pk): pk for pk in ids[start:start + batch_size]}
+                wait(futures)
+                updates = []
+                for future, pk in futures.items():
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f"Item {pk}: {exc}")
+                        continue
+                    if result:
+                        pk, placeholder, color = result
+                        updates.append(MediaItem(pk=pk, placeholder=placeholder, dominant_color=color))
+                # One UPDATE statement per batch instead of one per item
+                MediaItem.objects.bulk_update(updates, ['placeholder', 'dominant_color'])
+                done += len(updates)
+                self.stdout.write(f"  {start + len(futures)}/{len(ids)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {done} items ({failed} failed)."))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from media.models import MediaItem
+from media.pool import worker_pool
+from media.tasks import build_renditions_for
+
+class Command(BaseCommand):
+    help = "Generate srcset renditions for existing images using a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.MEDIA_WORKER_PROCESSES)
+        parser.add_argument('--all', dest='revisit', action='store_true', help="Also revisit images that already have renditions")
+
+    def handle(self, *args, workers, revisit, **kwargs):
+        items = MediaItem.objects.filter(media_type='IMAGE')
+        if not revisit:
+            items = items.annotate(n=Count('renditions')).filter(n=0)
+        ids = list(items.values_list('id', flat=True))
+        self.stdout.write(f"Rendering {len(ids)} images with {workers} workers...")
+
+        created = failed = 0
+        with worker_pool(workers) as pool:
+            futures = {pool.submit(build_renditions_for, pk): pk for pk in ids}
+            for future, pk in futures.items():
+                try:
+                    created += future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"Image {pk}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} renditions ({failed} images failed)."))
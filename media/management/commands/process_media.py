@@ -0,0 +1,40 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from media import jobs
+from media.pool import worker_pool
+
+class Command(BaseCommand):
+    help = "Run queued media processing jobs in a bounded process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.MEDIA_WORKER_PROCESSES)
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is drained")
+
+    def handle(self, *args, workers, poll_interval, once, **kwargs):
+        self.stdout.write(f"Processing media jobs with {workers} workers.")
+
+        with worker_pool(workers) as pool:
+            running = {}
+            while True:
+                for future in [f for f in running if f.done()]:
+                    job_id = running.pop(future)
+                    try:
+                        self.stdout.write(f"Job {job_id}: {future.result()}")
+                    except Exception as exc:
+                        # The worker process itself died; the lease will expire and the job is retried
+                        self.stderr.write(f"Job {job_id} crashed its worker: {exc}")
+
+                claimed = jobs.claim(workers - len(running)) if len(running) < workers else []
+                for job_id in claimed:
+                    running[pool.submit(jobs.run_job, job_id)] = job_id
+
+                if running:
+                    wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                elif once:
+                    break
+                else:
+                    time.sleep(poll_interval)
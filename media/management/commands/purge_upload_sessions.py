@@ -0,0 +1,16 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from media.models import UploadSession
+
+class Command(BaseCommand):
+    help = "Delete upload sessions that have been idle longer than UPLOAD_SESSION_EXPIRY_HOURS"
+
+    def handle(self, *args, **kwargs):
+        purged = 0
+        for session in UploadSession.stale().iterator():
+            # Finalized sessions hand their file over to the MediaItem; only abandoned ones own it.
+            if not session.media_item_id and default_storage.exists(session.storage_path):
+                default_storage.delete(session.storage_path)
+            session.delete()
+            purged += 1
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} upload sessions."))
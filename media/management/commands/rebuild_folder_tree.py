@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from media.models import Folder, FolderClosure
+from media.tree import rebuild_closure
+
+class Command(BaseCommand):
+    help = "Recompute the folder closure table (ancestor/descendant links) from Folder.parent"
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            rows = rebuild_closure(Folder, FolderClosure)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} links for {Folder.objects.count()} folders."))
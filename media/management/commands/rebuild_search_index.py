@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from media import search
+
+class Command(BaseCommand):
+    help = "Recreate the full-text search entries of every media item, folder and user"
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS(f"Indexed {search.rebuild()} entries."))
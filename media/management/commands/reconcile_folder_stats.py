@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from media.counters import reconcile
+
+class Command(BaseCommand):
+    help = "Recompute folder item counts, recursive sizes and covers, fixing any drift"
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            fixed = reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} folders."))
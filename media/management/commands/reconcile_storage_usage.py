@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from media import quota
+
+class Command(BaseCommand):
+    help = "Re-measure generated files and recompute every user's storage usage, fixing any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-derived', action='store_true', help="Trust MediaItem.derived_size instead of walking the generated files")
+
+    def handle(self, *args, skip_derived, **kwargs):
+        items = 0 if skip_derived else quota.measure_derived()
+        with transaction.atomic():
+            users = quota.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Fixed {items} items and {users} users."))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:41
+
+import media.models
+import media.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0004_processingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='folder',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=media.storage.blob_storage, upload_to='folder_covers/'),
+        ),
+        migrations.AlterField(
+            model_name='mediaitem',
+            name='file',
+            field=models.FileField(storage=media.storage.blob_storage, upload_to=media.models.media_file_path),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:44
+
+import django.db.models.deletion
+import media.models
+import media.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0005_blob_alter_folder_cover_image_alter_mediaitem_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('file', models.ImageField(storage=media.storage.blob_storage, upload_to=media.models.rendition_path)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('media_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='media.mediaitem')),
+            ],
+            options={
+                'ordering': ['width'],
+                'unique_together': {('media_item', 'width', 'format')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0006_rendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaitem',
+            name='hls_manifest',
+            field=models.CharField(blank=True, help_text='Master playlist of the HLS ladder, relative to MEDIA_ROOT', max_length=255),
+        ),
+    ]
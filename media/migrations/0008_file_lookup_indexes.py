@@ -0,0 +1,35 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:49
+
+import media.models
+import media.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0007_mediaitem_hls_manifest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='folder',
+            name='cover_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=media.storage.blob_storage, upload_to='folder_covers/'),
+        ),
+        migrations.AlterField(
+            model_name='mediaitem',
+            name='file',
+            field=models.FileField(db_index=True, storage=media.storage.blob_storage, upload_to=media.models.media_file_path),
+        ),
+        migrations.AlterField(
+            model_name='mediaitem',
+            name='thumbnail',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to=media.models.thumbnail_path),
+        ),
+        migrations.AlterField(
+            model_name='rendition',
+            name='file',
+            field=models.ImageField(db_index=True, storage=media.storage.blob_storage, upload_to=media.models.rendition_path),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0008_file_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaitem',
+            name='phash',
+            field=models.BigIntegerField(blank=True, help_text='64-bit perceptual hash (dHash) of images', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('phash__isnull', False)), fields=['uploader', 'phash'], name='media_uploader_phash_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0009_mediaitem_phash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaitem',
+            name='dominant_color',
+            field=models.CharField(blank=True, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='mediaitem',
+            name='placeholder',
+            field=models.TextField(blank=True, help_text='Tiny blurred WebP data URI shown while the image loads'),
+        ),
+    ]
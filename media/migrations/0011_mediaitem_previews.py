@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0010_mediaitem_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaitem',
+            name='preview_clip',
+            field=models.CharField(blank=True, help_text='Short muted clip played on card hover', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mediaitem',
+            name='sprite_vtt',
+            field=models.CharField(blank=True, help_text='WebVTT index of the scrub sprite sheets', max_length=255),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from media.tree import rebuild_closure
+
+
+def build_closure(apps, schema_editor):
+    rebuild_closure(apps.get_model('media', 'Folder'), apps.get_model('media', 'FolderClosure'), schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0011_mediaitem_previews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='media.folder')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='media.folder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='media_folde_descend_d906e0_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+from media.counters import reconcile
+
+
+def fill_counters(apps, schema_editor):
+    reconcile(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0012_folderclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='cover_cache',
+            field=models.CharField(blank=True, help_text='Storage name of cover_image, or of the newest image in the folder', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='item_count',
+            field=models.IntegerField(default=0, help_text='Items directly in this folder'),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='total_size',
+            field=models.BigIntegerField(default=0, help_text='Bytes of every item in this folder and its subfolders'),
+        ),
+        migrations.AddField(
+            model_name='mediaitem',
+            name='file_size',
+            field=models.BigIntegerField(default=0, help_text='Size of `file` in bytes'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
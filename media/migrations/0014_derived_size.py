@@ -0,0 +1,27 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+from media import quota
+
+
+def fill_usage(apps, schema_editor):
+    quota.measure_derived(apps)
+    quota.reconcile(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_user_storage'),
+        ('media', '0013_folder_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaitem',
+            name='derived_size',
+            field=models.BigIntegerField(default=0, help_text='Bytes of the thumbnail, renditions, HLS ladder and previews'),
+        ),
+        migrations.RunPython(fill_usage, migrations.RunPython.noop),
+    ]
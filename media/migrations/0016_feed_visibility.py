@@ -0,0 +1,46 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_uploader_privacy(apps, schema_editor):
+    MediaItem = apps.get_model('media', 'MediaItem')
+    MediaItem._base_manager.filter(uploader__is_private=True).update(uploader_is_private=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0015_deletion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaitem',
+            name='uploader_is_private',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(copy_uploader_privacy, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False)), fields=['-created_at'], name='media_live_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False)), fields=['media_type', '-created_at'], name='media_live_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False), ('is_private', False), ('uploader_is_private', False)), fields=['-created_at'], name='media_public_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False), ('is_private', False), ('uploader_is_private', False)), fields=['media_type', '-created_at'], name='media_public_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(fields=['uploader', 'is_hidden', '-created_at'], name='media_uploader_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0016_feed_visibility'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='mediaitem',
+            name='media_live_recent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='mediaitem',
+            name='media_live_type_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='mediaitem',
+            name='media_public_recent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='mediaitem',
+            name='media_public_type_idx',
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False)), fields=['-created_at', '-id'], name='media_live_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False)), fields=['media_type', '-created_at', '-id'], name='media_live_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False), ('is_private', False), ('uploader_is_private', False)), fields=['-created_at', '-id'], name='media_public_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False), ('is_private', False), ('uploader_is_private', False)), fields=['media_type', '-created_at', '-id'], name='media_public_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False)), fields=['-views_count', '-id'], name='media_live_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediaitem',
+            index=models.Index(condition=models.Q(('deletion__isnull', True), ('is_hidden', False)), fields=['title', 'id'], name='media_live_title_idx'),
+        ),
+    ]
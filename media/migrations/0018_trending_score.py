@@ -0,0 +1,34 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from media import trending
+
+
+def fill_scores(apps, schema_editor):
+    trending.rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0017_keyset_indexes'),
+        ('social', '0002_follow_is_accepted_notification'),
+        ('stats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('media_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='media.mediaitem')),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='media_trending_score_idx')],
+            },
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from media import search
+
+
+def install_index(apps, schema_editor):
+    search.install(schema_editor)
+    search.rebuild(apps)
+
+
+def uninstall_index(apps, schema_editor):
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0018_trending_score'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('media', 'Media'), ('folder', 'Folder'), ('user', 'User')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('media_type', models.CharField(blank=True, max_length=20)),
+                ('is_hidden', models.BooleanField(default=False)),
+                ('is_private', models.BooleanField(default=False)),
+                ('owner_is_private', models.BooleanField(default=False)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Search entries',
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(install_index, uninstall_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from media import related
+
+
+def fill_related(apps, schema_editor):
+    related.refresh(full=True, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0019_search_index'),
+        ('social', '0002_follow_is_accepted_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedItems',
+            fields=[
+                ('media_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related', serialize=False, to='media.mediaitem')),
+                ('item_ids', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(fill_related, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,13 @@
 from django.db import models
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.validators import FileExtensionValidator
+from django.db import transaction
+from django.utils import timezone
+import datetime
 import os
 import uuid
+from .storage import blob_storage
 
 def media_file_path(instance, filename):
     ext = filename.split('.')[-1]
@@ -14,15 +19,64 @@ def thumbnail_path(instance, filename):
     filename = f'{uuid.uuid4()}.{ext}'
     return os.path.join('thumbnails', str(instance.uploader.id), filename)
 
+class LiveManager(models.Manager):
+    """Default manager: hides rows queued for deletion (see media.reaper). `all_objects` sees everything."""
+    def get_queryset(self):
+        return super().get_queryset().filter(deletion__isnull=True)
+
+def _followed_by(user):
+    from social.models import Follow
+    return Follow.objects.filter(follower=user, is_accepted=True).values('followed_id')
+
+class FolderQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Folders listed to `user`: not hidden, and public, their own, or from someone they follow."""
+        qs = self.filter(is_hidden=False)
+        if user.is_authenticated and user.is_superuser:
+            return qs
+        if not user.is_authenticated:
+            return qs.filter(is_private=False, owner__is_private=False)
+        return qs.filter(models.Q(is_private=False, owner__is_private=False) | models.Q(owner=user) | models.Q(owner_id__in=_followed_by(user)))
+
+# The conditions of the feed indexes; visible_to emits exactly these terms so the planner can match them
+LISTED = models.Q(is_hidden=False, deletion__isnull=True)
+PUBLIC = models.Q(is_private=False, uploader_is_private=False)
+
+class MediaItemQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Items listed to `user`: not hidden, and public from a public profile, their own, or
+        from someone they follow. Reads the denormalised uploader_is_private, so there is no
+        join on the user table; the feed indexes in Meta serve the usual orderings.
+        """
+        qs = self.filter(is_hidden=False)
+        if user.is_authenticated and user.is_superuser:
+            return qs
+        if not user.is_authenticated:
+            return qs.filter(PUBLIC)
+        return qs.filter(PUBLIC | models.Q(uploader=user) | models.Q(uploader_id__in=_followed_by(user)))
+
 class Folder(models.Model):
     name = models.CharField(max_length=255)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='folders')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='subfolders', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    cover_image = models.ImageField(upload_to='folder_covers/', null=True, blank=True)
+    cover_image = models.ImageField(upload_to='folder_covers/', storage=blob_storage, null=True, blank=True, db_index=True)
     is_private = models.BooleanField(default=False)
     is_hidden = models.BooleanField(default=False)
+    # Maintained by media.counters with F() updates; see COUNTER_FIELDS
+    item_count = models.IntegerField(default=0, help_text="Items directly in this folder")
+    total_size = models.BigIntegerField(default=0, help_text="Bytes of every item in this folder and its subfolders")
+    cover_cache = models.CharField(max_length=255, blank=True, help_text="Storage name of cover_image, or of the newest image in the folder")
+    deletion = models.ForeignKey('Deletion', on_delete=models.PROTECT, related_name='folders', null=True, blank=True)
+
+    objects = LiveManager.from_queryset(FolderQuerySet)()
+    all_objects = models.Manager.from_queryset(FolderQuerySet)()
+
+    # Never written by a full save, so a stale instance cannot overwrite concurrent updates
+    # (cover_cache is only saved along with a cover_image it mirrors)
+    COUNTER_FIELDS = ('item_count', 'total_size', 'cover_cache')
 
     class Meta:
         ordering = ['name']
@@ -33,21 +87,116 @@ class Folder(models.Model):
     
     @property
     def effective_cover(self):
+        # cover_image, else the newest image in the folder (resolved ahead of time in cover_cache)
+        return default_storage.url(self.cover_cache) if self.cover_cache else None
+
+    def save(self, *args, **kwargs):
+        from .counters import refresh_covers, shift
+
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
         if self.cover_image:
-            return self.cover_image.url
-        # Default: first image in folder
-        first_img = self.media_items.filter(media_type='IMAGE').first()
-        if first_img:
-            return first_img.file.url
-        return None
-    
+            self.cover_cache = self.cover_image.name
+            if update_fields is not None and 'cover_image' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'cover_cache'}
+        if not adding and update_fields is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+            if self.cover_image:
+                kwargs['update_fields'].append('cover_cache')
+
+        old = None
+        if not adding and (update_fields is None or {'parent', 'parent_id', 'cover_image'} & set(update_fields)):
+            old = Folder.all_objects.filter(pk=self.pk).values('parent_id', 'cover_image', 'total_size').first()
+        moved = old is not None and old['parent_id'] != self.parent_id
+        if moved and self.parent_id and FolderClosure.objects.filter(ancestor_id=self.pk, descendant_id=self.parent_id).exists():
+            raise ValueError("A folder cannot be moved into its own subtree.")
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                FolderClosure.link([self])
+            elif moved:
+                FolderClosure.relink(self)
+                shift(old['parent_id'], size=-old['total_size'])
+                shift(self.parent_id, size=old['total_size'])
+            if old and old['cover_image'] and not self.cover_image:
+                refresh_covers(Folder.all_objects.filter(pk=self.pk))
+
+    def delete(self, *args, **kwargs):
+        # The post_delete signal takes total_size off the parent's ancestors: use the stored values,
+        # not ones a bulk move or counter update may have made stale (queryset deletes load fresh rows)
+        stored = Folder.all_objects.filter(pk=self.pk).values('parent_id', 'total_size').first()
+        if stored:
+            self.parent_id, self.total_size = stored['parent_id'], stored['total_size']
+        return super().delete(*args, **kwargs)
+
     def get_ancestors(self):
-        ancestors = []
-        current = self
-        while current.parent:
-            current = current.parent
-            ancestors.append(current)
-        return ancestors[::-1]
+        """Root first, not including this folder. One query."""
+        return list(
+            Folder.objects.filter(descendant_links__descendant=self, descendant_links__depth__gt=0)
+            .order_by('-descendant_links__depth')
+        )
+
+    def get_descendants(self, include_self=False):
+        links = FolderClosure.objects.filter(ancestor=self)
+        if not include_self:
+            links = links.filter(depth__gt=0)
+        return Folder.objects.filter(pk__in=links.values('descendant'))
+
+    def subtree_items(self):
+        """Every MediaItem in this folder or any folder below it."""
+        return MediaItem.objects.filter(folder__in=FolderClosure.objects.filter(ancestor=self).values('descendant'))
+
+class FolderClosure(models.Model):
+    """
+    Closure table of the folder tree: one row per (ancestor, descendant) pair, including
+    each folder paired with itself at depth 0. Ancestor, descendant and subtree queries
+    become single indexed lookups. Maintained by Folder.save (and FolderClosure.link for
+    bulk-created folders); `manage.py rebuild_folder_tree` recomputes it from `parent`.
+    """
+    ancestor = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    @classmethod
+    def link(cls, folders):
+        """Add the rows for newly created folders (parents must already be linked)."""
+        parent_ids = {folder.parent_id for folder in folders if folder.parent_id}
+        above = {}
+        for ancestor_id, descendant_id, depth in cls.objects.filter(descendant_id__in=parent_ids).values_list('ancestor_id', 'descendant_id', 'depth'):
+            above.setdefault(descendant_id, []).append((ancestor_id, depth))
+
+        rows = []
+        for folder in folders:
+            rows.append(cls(ancestor_id=folder.pk, descendant_id=folder.pk, depth=0))
+            rows.extend(
+                cls(ancestor_id=ancestor_id, descendant_id=folder.pk, depth=depth + 1)
+                for ancestor_id, depth in above.get(folder.parent_id, [])
+            )
+        cls.objects.bulk_create(rows)
+
+    @classmethod
+    def relink(cls, folder):
+        """`folder` got a new parent: reattach its whole subtree below the new ancestors."""
+        subtree = list(cls.objects.filter(ancestor=folder).values_list('descendant_id', 'depth'))
+        subtree_ids = [pk for pk, _ in subtree]
+        cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+        if folder.parent_id:
+            above = cls.objects.filter(descendant_id=folder.parent_id).values_list('ancestor_id', 'depth')
+            cls.objects.bulk_create([
+                cls(ancestor_id=ancestor_id, descendant_id=pk, depth=up + down + 1)
+                for ancestor_id, up in above for pk, down in subtree
+            ])
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -72,8 +221,8 @@ class MediaItem(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, related_name='media_items', null=True, blank=True)
     title = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True)
-    file = models.FileField(upload_to=media_file_path)
-    thumbnail = models.ImageField(upload_to=thumbnail_path, null=True, blank=True)
+    file = models.FileField(upload_to=media_file_path, storage=blob_storage, db_index=True)
+    thumbnail = models.ImageField(upload_to=thumbnail_path, null=True, blank=True, db_index=True)
     media_type = models.CharField(max_length=20, choices=MEDIA_TYPE_CHOICES)
     duration = models.FloatField(null=True, blank=True) # Duration in seconds
     width = models.PositiveIntegerField(null=True, blank=True)
@@ -85,20 +234,92 @@ class MediaItem(models.Model):
     is_processed = models.BooleanField(default=False)
     is_private = models.BooleanField(default=False)
     is_hidden = models.BooleanField(default=False)
+    hls_manifest = models.CharField(max_length=255, blank=True, help_text="Master playlist of the HLS ladder, relative to MEDIA_ROOT")
+    sprite_vtt = models.CharField(max_length=255, blank=True, help_text="WebVTT index of the scrub sprite sheets")
+    preview_clip = models.CharField(max_length=255, blank=True, help_text="Short muted clip played on card hover")
+    phash = models.BigIntegerField(null=True, blank=True, help_text="64-bit perceptual hash (dHash) of images")
+    file_size = models.BigIntegerField(default=0, help_text="Size of `file` in bytes")
+    derived_size = models.BigIntegerField(default=0, help_text="Bytes of the thumbnail, renditions, HLS ladder and previews")
+    placeholder = models.TextField(blank=True, help_text="Tiny blurred WebP data URI shown while the image loads")
+    dominant_color = models.CharField(max_length=7, blank=True)
+    deletion = models.ForeignKey('Deletion', on_delete=models.PROTECT, related_name='media_items', null=True, blank=True)
+    # Copy of uploader.is_private so feeds can filter without joining core_user (kept in sync by media.signals)
+    uploader_is_private = models.BooleanField(default=False, editable=False)
+
+    objects = LiveManager.from_queryset(MediaItemQuerySet)()
+    all_objects = models.Manager.from_queryset(MediaItemQuerySet)()
+
+    # Written only by processing jobs, the reaper, signals and F() counters; never by a full save,
+    # so a stale instance cannot undo them (e.g. bring a tombstoned item back)
+    BACKGROUND_FIELDS = (
+        'views_count', 'downloads_count', 'is_processed', 'duration', 'width', 'height', 'hls_manifest',
+        'sprite_vtt', 'preview_clip', 'phash', 'derived_size', 'placeholder', 'dominant_color', 'deletion',
+        'uploader_is_private',
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Feeds (visible_to, newest first, optionally one media_type). is_hidden and is_private are
+            # folded into the conditions, so the listing is an ordered index scan that stops at the page size.
+            # The trailing id matches the keyset order of media.pagination.
+            models.Index(fields=['-created_at', '-id'], name='media_live_recent_idx', condition=LISTED),
+            models.Index(fields=['media_type', '-created_at', '-id'], name='media_live_type_idx', condition=LISTED),
+            models.Index(fields=['-created_at', '-id'], name='media_public_recent_idx', condition=LISTED & PUBLIC),
+            models.Index(fields=['media_type', '-created_at', '-id'], name='media_public_type_idx', condition=LISTED & PUBLIC),
+            models.Index(fields=['-views_count', '-id'], name='media_live_views_idx', condition=LISTED),
+            models.Index(fields=['title', 'id'], name='media_live_title_idx', condition=LISTED),
+            models.Index(fields=['uploader', 'is_hidden', '-created_at'], name='media_uploader_feed_idx'),
+            # Covers loading one user's hashes into the duplicate index
+            models.Index(fields=['uploader', 'phash'], name='media_uploader_phash_idx', condition=models.Q(phash__isnull=False)),
+        ]
 
     def __str__(self):
         return self.title or str(self.file.name)
 
+    @property
+    def hls_url(self):
+        return default_storage.url(self.hls_manifest) if self.hls_manifest else None
+
+    @property
+    def sprite_vtt_url(self):
+        return default_storage.url(self.sprite_vtt) if self.sprite_vtt else None
+
+    @property
+    def preview_url(self):
+        return default_storage.url(self.preview_clip) if self.preview_clip else None
+
     def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.uploader_is_private = self.uploader.is_private
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.BACKGROUND_FIELDS
+            ]
         if not self.file:
             super().save(*args, **kwargs)
             return
 
+        self.apply_file_defaults()
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        # Folder counters and quota are released from these by post_delete; see Folder.delete
+        stored = MediaItem.all_objects.filter(pk=self.pk).values('folder_id', 'file_size', 'derived_size').first()
+        if stored:
+            self.folder_id, self.file_size, self.derived_size = stored['folder_id'], stored['file_size'], stored['derived_size']
+        return super().delete(*args, **kwargs)
+
+    def apply_file_defaults(self):
+        """Derive title, size and media_type from the file. Also used for rows created via bulk_create."""
         if not self.title:
             self.title = os.path.basename(self.file.name)
+        if not self.file_size:
+            try:
+                self.file_size = self.file.size
+            except OSError:
+                pass
         
         # Determine media type from extension automatically
         try:
@@ -114,8 +335,31 @@ class MediaItem(models.Model):
                 self.media_type = 'OTHER'
         except Exception:
             self.media_type = 'OTHER'
-        
-        super().save(*args, **kwargs)
+
+def rendition_path(instance, filename):
+    ext = filename.split('.')[-1]
+    return os.path.join('renditions', str(instance.media_item_id), f'{instance.width}.{ext}')
+
+class Rendition(models.Model):
+    """A downscaled copy of an image MediaItem, used for srcset."""
+    FORMAT_CHOICES = (
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    )
+
+    media_item = models.ForeignKey(MediaItem, on_delete=models.CASCADE, related_name='renditions')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    file = models.ImageField(upload_to=rendition_path, storage=blob_storage, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['width']
+        unique_together = ('media_item', 'width', 'format')
+
+    def __str__(self):
+        return f"{self.media_item} @ {self.width}w ({self.format})"
 
 class Collection(models.Model):
     name = models.CharField(max_length=255)
@@ -128,3 +372,179 @@ class Collection(models.Model):
 
     def __str__(self):
         return self.name
+
+class Blob(models.Model):
+    """A stored file, shared by every field that points at the same content."""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+class UploadSession(models.Model):
+    """A resumable upload: bytes are appended to `storage_path` until `offset` reaches `total_size`."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    parent_folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='upload_sessions', null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True)
+    relative_path = models.CharField(max_length=1024, blank=True)
+    total_size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    storage_path = models.CharField(max_length=255)
+    media_item = models.OneToOneField(MediaItem, on_delete=models.SET_NULL, related_name='upload_session', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Upload of {self.filename} by {self.uploader}"
+
+    def save(self, *args, **kwargs):
+        if not self.storage_path:
+            self.storage_path = media_file_path(self, self.filename)
+        super().save(*args, **kwargs)
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.total_size
+
+    @classmethod
+    def stale(cls):
+        cutoff = timezone.now() - datetime.timedelta(hours=settings.UPLOAD_SESSION_EXPIRY_HOURS)
+        return cls.objects.filter(updated_at__lt=cutoff)
+
+class ProcessingJob(models.Model):
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    media_item = models.ForeignKey(MediaItem, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job #{self.id} ({self.status})"
+
+class Deletion(models.Model):
+    """
+    A bulk delete in progress. Its rows point at it, which hides them at once; the
+    reaper job then removes them in batches.
+    """
+    KIND_CHOICES = (
+        ('SELECTION', 'Selection'),
+        ('ACCOUNT', 'Account'),
+    )
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+    )
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name='deletions', null=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='SELECTION')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    total_items = models.PositiveIntegerField(default=0)
+    total_folders = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Deletion #{self.id} ({self.status})"
+
+    @property
+    def remaining_items(self):
+        return MediaItem.all_objects.filter(deletion=self).count()
+
+    @property
+    def remaining_folders(self):
+        return Folder.all_objects.filter(deletion=self).count()
+
+class TrendingScore(models.Model):
+    """
+    Time-decayed engagement per item, maintained incrementally by media.trending. `score` is
+    log2 of the forward-decayed sum, so ordering by it ranks by the current decayed score.
+    """
+    media_item = models.OneToOneField(MediaItem, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='media_trending_score_idx')]
+
+    def __str__(self):
+        return f"{self.media_item_id}: {self.score:.3f}"
+
+class RelatedItems(models.Model):
+    """The items most co-engaged with `media_item`, best first, precomputed by media.related."""
+    media_item = models.OneToOneField(MediaItem, on_delete=models.CASCADE, primary_key=True, related_name='related')
+    item_ids = models.JSONField(default=list)
+    # When the list was computed; the newest is the watermark of incremental refreshes
+    updated_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.media_item_id}: {self.item_ids}"
+
+class Recommendation(models.Model):
+    """A user's precomputed home rail picks, best first (see media.recommend)."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='recommendation')
+    item_ids = models.JSONField(default=list)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.item_ids}"
+
+class SearchEntry(models.Model):
+    """
+    One row per searchable media item, folder and user, with the columns visibility is
+    decided on. The full-text index over title/body is backend specific (see media.search).
+    """
+    KIND_CHOICES = (
+        ('media', 'Media'),
+        ('folder', 'Folder'),
+        ('user', 'User'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    media_type = models.CharField(max_length=20, blank=True)
+    is_hidden = models.BooleanField(default=False)
+    is_private = models.BooleanField(default=False)
+    owner_is_private = models.BooleanField(default=False)
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+        verbose_name_plural = "Search entries"
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
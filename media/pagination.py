@@ -0,0 +1,71 @@
+"""
+Keyset pagination for the media listings.
+
+A cursor is the sort key and id of the last item on the previous page, so the next
+page is `WHERE (key, id) < (last key, last id) ORDER BY key, id LIMIT n`: an index
+seek that costs the same at any depth, unlike OFFSET. Cursors are opaque to clients
+(URL-safe base64 of JSON) and tied to the sort they were issued for.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+
+# sort name -> (field, descending); the id breaks ties in the same direction
+SORTS = {
+    'date_desc': ('created_at', True),
+    'views': ('views_count', True),
+    'name_asc': ('title', False),
+}
+
+# Python type of each sort key as decoded from a cursor
+KEY_TYPES = {
+    'created_at': datetime.datetime,
+    'views_count': int,
+    'title': str,
+}
+
+def encode_cursor(sort, item):
+    field, _ = SORTS[sort]
+    value = getattr(item, field)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, item.pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(sort, cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        issued_for, value, pk = json.loads(raw)
+        if SORTS[sort][0] == 'created_at':
+            value = datetime.datetime.fromisoformat(value)
+    except (binascii.Error, ValueError, TypeError):
+        raise BadRequest("Invalid cursor.")
+    if issued_for != sort:
+        raise BadRequest("The cursor belongs to a different sort order.")
+    # Crafted values of the wrong type would otherwise fail inside the query
+    if type(value) is not KEY_TYPES[SORTS[sort][0]] or type(pk) is not int:
+        raise BadRequest("Invalid cursor.")
+    return value, pk
+
+def order_for(sort):
+    field, descending = SORTS[sort]
+    return (f'-{field}', '-id') if descending else (field, 'id')
+
+def keyset_page(qs, sort, cursor=None, size=24):
+    """One page of `qs` in `sort` order after `cursor`. Returns (items, cursor of the next page or None)."""
+    field, descending = SORTS[sort]
+    qs = qs.order_by(*order_for(sort))
+    if cursor:
+        value, pk = decode_cursor(sort, cursor)
+        after = 'lt' if descending else 'gt'
+        qs = qs.filter(Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk}))
+    # One extra row tells whether there is a next page without a COUNT
+    items = list(qs[:size + 1])
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    return items, encode_cursor(sort, items[-1])
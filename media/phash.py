@@ -0,0 +1,138 @@
+"""
+Perceptual hashes and the near-duplicate index.
+
+Every image gets a 64-bit dHash (stored signed in MediaItem.phash). Resized or
+re-encoded copies of a photo land within a few bits of each other, so duplicates
+are found by Hamming distance.
+
+`HashIndex` keeps a scope's hashes in packed uint64 arrays. Single lookups are one
+vectorised XOR + popcount over the whole array. Finding every duplicate pair uses
+multi-index hashing: the hash is cut into m bands, and two hashes within distance d
+must agree on some band to within d // m bits. Each band is bucketed with a counting
+sort, so candidates come from bucket lookups (the band value and its few bit flips)
+instead of comparing all pairs, and are verified with popcount as they are produced.
+m is picked per query from the scope size and distance to keep buckets small.
+"""
+import hashlib
+import itertools
+from functools import lru_cache
+from math import comb
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Probe this many hashes at a time so candidate arrays stay small
+PROBE_CHUNK = 1 << 18
+
+def dhash(image):
+    """64-bit difference hash of a PIL image, as a signed int for BigIntegerField."""
+    image.draft('L', (64, 64))  # let JPEG decode at reduced size
+    gray = ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>i8')[0])
+
+@lru_cache(maxsize=None)
+def _flip_masks(width, radius):
+    masks = [0]
+    for r in range(1, radius + 1):
+        for positions in itertools.combinations(range(width), r):
+            masks.append(sum(1 << p for p in positions))
+    return np.array(masks, dtype=np.int64)
+
+def _bands(count):
+    """(shift, width) of `count` near-equal bands covering 64 bits."""
+    widths = [64 // count + (1 if k < 64 % count else 0) for k in range(count)]
+    shifts = [sum(widths[:k]) for k in range(count)]
+    return list(zip(shifts, widths))
+
+def _band_count(n, distance):
+    """Band count with the fewest expected bucket probes + random collisions (bands of 11-22 bits)."""
+    def cost(m):
+        widest, narrowest = 64 // m + (64 % m > 0), 64 // m
+        probes = sum(comb(widest, k) for k in range(distance // m + 1))
+        return m * probes * (n + n * n / 2 ** narrowest)
+    return min(range(3, 7), key=cost)
+
+class HashIndex:
+    def __init__(self, ids, hashes):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        rows = np.fromiter(
+            queryset.filter(phash__isnull=False).values_list('id', 'phash').iterator(chunk_size=10000),
+            dtype=[('id', np.int64), ('phash', np.int64)],
+        )
+        return cls(rows['id'], rows['phash'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def fingerprint(self):
+        """Changes whenever an image is added, removed or rehashed; used as a cache key."""
+        return hashlib.blake2b(self.ids.tobytes() + self.hashes.tobytes(), digest_size=16).hexdigest()
+
+    def near(self, phash, distance):
+        """(ids, distances) of hashes within `distance` bits of `phash`, closest first."""
+        target = np.array([phash], dtype=np.int64).view(np.uint64)[0]
+        distances = np.bitwise_count(self.hashes ^ target)
+        hits = np.flatnonzero(distances <= distance)
+        hits = hits[np.argsort(distances[hits], kind='stable')]
+        return self.ids[hits], distances[hits]
+
+    def pairs(self, distance):
+        """(i, j, distance) index arrays for every pair within `distance` bits, i < j."""
+        n = len(self.hashes)
+        found = []
+        positions = np.arange(n, dtype=np.int64)
+        band_count = _band_count(n, distance)
+        for shift, width in _bands(band_count) if n > 1 else []:
+            band = ((self.hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)).astype(np.int64)
+            # Counting sort: members of bucket v are order[starts[v]:starts[v] + sizes[v]]
+            order = np.argsort(band, kind='stable')
+            sizes = np.bincount(band, minlength=1 << width)
+            starts = np.cumsum(sizes) - sizes
+            for flip in _flip_masks(width, distance // band_count):
+                for lo in range(0, n, PROBE_CHUNK):
+                    target = band[lo:lo + PROBE_CHUNK] ^ flip
+                    counts = sizes[target]
+                    total = int(counts.sum())
+                    if not total:
+                        continue
+                    src = np.repeat(positions[lo:lo + PROBE_CHUNK], counts)
+                    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                    dst = order[np.repeat(starts[target], counts) + offsets]
+                    keep = src < dst
+                    src, dst = src[keep], dst[keep]
+                    distances = np.bitwise_count(self.hashes[src] ^ self.hashes[dst])
+                    close = distances <= distance
+                    found.append(src[close] * n + dst[close])
+
+        pair_codes = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+        i, j = np.divmod(pair_codes, n)
+        return i, j, np.bitwise_count(self.hashes[i] ^ self.hashes[j]).astype(np.int64)
+
+    def groups(self, distance):
+        """Clusters of MediaItem ids linked by near-duplicate pairs, largest first."""
+        i, j, _ = self.pairs(distance)
+        parent = {}
+
+        def find(x):
+            root = x
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while x != root:
+                parent[x], x = root, parent.get(x, x)
+            return root
+
+        for a, b in zip(i.tolist(), j.tolist()):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        clusters = {}
+        for member in parent.keys() | set(parent.values()):
+            clusters.setdefault(find(member), []).append(int(self.ids[member]))
+        return sorted((sorted(ids) for ids in clusters.values()), key=lambda ids: (-len(ids), ids[0]))
@@ -0,0 +1,37 @@
+"""
+Low-quality image placeholders.
+
+Each image (and each video's thumbnail) gets a ~20px WebP inlined as a data URI and
+its dominant colour, stored on MediaItem. Grid cards paint them as the <img>
+background, so a card has a blurred preview in the initial HTML instead of an empty
+box while the real image loads.
+"""
+import base64
+import io
+
+from django.conf import settings
+from PIL import Image, ImageFilter, ImageOps
+
+def placeholder_for(image):
+    """(data URI, '#rrggbb') for a PIL image."""
+    image.draft('RGB', (settings.PLACEHOLDER_WIDTH * 4, settings.PLACEHOLDER_WIDTH * 4))
+    img = ImageOps.exif_transpose(image)
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        flat = Image.new('RGB', img.size, (255, 255, 255))
+        flat.paste(img, mask=img.getchannel('A'))
+        img = flat
+    img = img.convert('RGB')
+
+    width = settings.PLACEHOLDER_WIDTH
+    height = max(1, round(img.height * width / img.width))
+    tiny = img.resize((width, height), Image.Resampling.BOX).filter(ImageFilter.GaussianBlur(1))
+    buf = io.BytesIO()
+    tiny.save(buf, 'WEBP', quality=settings.PLACEHOLDER_QUALITY, method=6)
+    data_uri = 'data:image/webp;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+    # Most common colour after reducing to a small palette
+    palette = img.resize((64, 64), Image.Resampling.BOX).quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    _, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+    return data_uri, f'#{r:02x}{g:02x}{b:02x}'
@@ -0,0 +1,16 @@
+"""Process pools for media work. Kept free of model imports so spawned workers can load it before setup."""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+def init_worker():
+    # Spawned workers start from a clean interpreter and open their own DB connections
+    django.setup()
+
+def worker_pool(workers):
+    connections.close_all()
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker
+    )
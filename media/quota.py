@@ -0,0 +1,149 @@
+"""
+Per-user storage accounting and quotas.
+
+User.storage_used counts the bytes of a user's originals (MediaItem.file_size) plus
+everything generated from them (MediaItem.derived_size: thumbnails, renditions, HLS
+ladders, previews). Both are moved with F() updates as files appear and disappear,
+so the admin report and quota checks never touch the filesystem. Per-folder usage
+is Folder.total_size (see media.counters).
+
+Uploads are checked before their body is parsed: a Content-Length that cannot fit
+is refused outright, and QuotaUploadHandler stops reading a multipart body as soon
+as it passes the remaining allowance.
+"""
+import os
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.template.defaultfilters import filesizeformat
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import MediaItem, UploadSession
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_code = 'quota_exceeded'
+
+    def __init__(self, allowance):
+        super().__init__({'error': f"This upload does not fit in your storage quota ({filesizeformat(allowance)} left)."})
+
+def quota_for(user):
+    """Bytes `user` may store, or None for no limit."""
+    if user.is_superuser:
+        return None
+    quota = settings.STORAGE_QUOTA_DEFAULT if user.storage_quota is None else user.storage_quota
+    return quota or None
+
+def allowance(user):
+    """Bytes `user` can still upload (None if unlimited). Open resumable sessions count as used."""
+    quota = quota_for(user)
+    if quota is None:
+        return None
+    used = get_user_model().objects.filter(pk=user.pk).values_list('storage_used', flat=True).first() or 0
+    reserved = UploadSession.objects.filter(uploader=user, media_item__isnull=True).aggregate(total=Sum('total_size'))['total'] or 0
+    return max(quota - used - reserved, 0)
+
+def enforce(request, size=None):
+    """
+    Raise QuotaExceeded unless `size` bytes (default: the request body) fit in the user's
+    allowance. With no size it must run before anything parses the body, and it also
+    installs an upload handler that stops reading once the allowance is passed.
+    """
+    if not request.user.is_authenticated:
+        return
+    left = allowance(request.user)
+    if left is None:
+        return
+    if size is None:
+        size = int(request.META.get('CONTENT_LENGTH') or 0)
+        request.upload_handlers.insert(0, QuotaUploadHandler(left))
+    if size > left:
+        raise QuotaExceeded(left)
+
+class QuotaUploadHandler(FileUploadHandler):
+    """Counts file bytes as they arrive; aborts the parse instead of buffering past the allowance."""
+    def __init__(self, allowance, request=None):
+        super().__init__(request)
+        self.allowance = allowance
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.allowance:
+            raise QuotaExceeded(self.allowance)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+def charge(user_id, size):
+    if size:
+        get_user_model().objects.filter(pk=user_id).update(storage_used=F('storage_used') + size)
+
+def charge_derived(item, size):
+    """Account for `size` bytes of generated files (negative when they are replaced by smaller ones)."""
+    if size:
+        MediaItem.all_objects.filter(pk=item.pk).update(derived_size=F('derived_size') + size)
+        item.derived_size += size
+        charge(item.uploader_id, size)
+
+def charge_items(items):
+    """Usage for MediaItems created with bulk_create, which skips post_save."""
+    totals = {}
+    for item in items:
+        totals[item.uploader_id] = totals.get(item.uploader_id, 0) + item.file_size
+    for user_id, size in totals.items():
+        charge(user_id, size)
+
+def directory_size(name):
+    total = 0
+    for root, _, files in os.walk(default_storage.path(name)):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+def measure_derived(apps=global_apps):
+    """Recompute MediaItem.derived_size from the files on disk; returns how many were off."""
+    item_model = apps.get_model('media', 'MediaItem')
+    rendition_model = apps.get_model('media', 'Rendition')
+    blob_model = apps.get_model('media', 'Blob')
+
+    sizes = {}
+    renditions = rendition_model.objects.annotate(
+        size=Subquery(blob_model.objects.filter(name=OuterRef('file')).values('size')[:1])
+    ).values_list('media_item_id', 'size')
+    for item_id, size in renditions.iterator():
+        sizes[item_id] = sizes.get(item_id, 0) + (size or 0)
+
+    generated = item_model._base_manager.filter(~Q(thumbnail='') & Q(thumbnail__isnull=False) | ~Q(hls_manifest='') | ~Q(sprite_vtt=''))
+    for pk, thumbnail, *outputs in generated.values_list('pk', 'thumbnail', 'hls_manifest', 'sprite_vtt').iterator():
+        if thumbnail and default_storage.exists(thumbnail):
+            sizes[pk] = sizes.get(pk, 0) + default_storage.size(thumbnail)
+        for name in {os.path.dirname(path) for path in outputs if path}:
+            sizes[pk] = sizes.get(pk, 0) + directory_size(name)
+
+    drifted = [
+        item_model(pk=pk, derived_size=sizes.get(pk, 0))
+        for pk, current in item_model._base_manager.values_list('pk', 'derived_size').iterator()
+        if current != sizes.get(pk, 0)
+    ]
+    item_model._base_manager.bulk_update(drifted, ['derived_size'], batch_size=500)
+    return len(drifted)
+
+def reconcile(apps=global_apps):
+    """Recompute every user's storage_used from their items; returns how many were off."""
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    item_model = apps.get_model('media', 'MediaItem')
+    usage = (
+        item_model._base_manager.filter(uploader=OuterRef('pk')).order_by().values('uploader')
+        .annotate(total=Sum(F('file_size') + F('derived_size'))).values('total')
+    )
+    drifted = user_model.objects.annotate(real=Coalesce(Subquery(usage), 0)).filter(~Q(storage_used=F('real')))
+    fixed = [user_model(pk=pk, storage_used=real) for pk, real in drifted.values_list('pk', 'real').iterator()]
+    user_model.objects.bulk_update(fixed, ['storage_used'], batch_size=500)
+    return len(fixed)
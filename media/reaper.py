@@ -0,0 +1,125 @@
+"""
+Asynchronous bulk deletion.
+
+`schedule` tombstones the selection in a few UPDATEs: every affected MediaItem and
+Folder (whole subtrees, via the closure table) points at a Deletion row, which the
+default managers filter out, so the content disappears from every listing at once. Its
+search entries go in the same transaction.
+The 'reap_deletion' job then deletes the rows in DELETION_BATCH_SIZE batches - items
+first, then folders leaves-first, then the account for ACCOUNT deletions - so no
+single transaction cascades a whole library. Files that belong to one item alone
+(thumbnails, HLS and preview directories) are unlinked by a thread pool after each
+batch commits; shared blobs go through the usual ref-counted purge.
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import search
+from .counters import refresh_covers
+from .jobs import enqueue
+from .models import Deletion, Folder, FolderClosure, MediaItem
+
+_pending_unlinks = ContextVar('pending_unlinks', default=None)
+
+def schedule(owner, items=None, folders=None, kind='SELECTION'):
+    """
+    Hide `items`, `folders` and everything inside those folders now (querysets, owner
+    checks already applied) and queue the reaper. Returns the Deletion.
+    """
+    with transaction.atomic():
+        deletion = Deletion.objects.create(owner=owner, kind=kind)
+        roots = list(folders.values_list('pk', flat=True)) if folders is not None else []
+        subtree = FolderClosure.objects.filter(ancestor_id__in=roots).values('descendant_id')
+        deletion.total_folders = Folder.objects.filter(pk__in=subtree).update(deletion=deletion)
+        # Detached roots free their (name, parent, owner) slot for a new folder of the same name
+        Folder.all_objects.filter(pk__in=roots).update(parent=None)
+
+        doomed = Q(folder_id__in=subtree)
+        if items is not None:
+            doomed |= Q(pk__in=items.values('pk'))
+        deletion.total_items = MediaItem.objects.filter(doomed).update(deletion=deletion)
+        deletion.save(update_fields=['total_items', 'total_folders'])
+        search.remove('media', MediaItem.all_objects.filter(deletion=deletion).values('pk'))
+        search.remove('folder', Folder.all_objects.filter(deletion=deletion).values('pk'))
+        if kind == 'ACCOUNT':
+            # Deactivated with update(), which skips the signal that reindexes the profile
+            search.index_users(type(owner).objects.filter(pk=owner.pk))
+
+        # Live folders must not keep showing a cover that is about to go away
+        refresh_covers(Folder.objects.filter(cover_cache__in=MediaItem.all_objects.filter(deletion=deletion).values('file')))
+        transaction.on_commit(lambda: enqueue('reap_deletion', deletion=deletion.pk))
+    return deletion
+
+def reap(deletion, heartbeat=lambda: None):
+    """Delete everything `deletion` hid, one bounded batch per transaction."""
+    Deletion.objects.filter(pk=deletion.pk).update(status='RUNNING')
+    size = settings.DELETION_BATCH_SIZE
+
+    items = MediaItem.all_objects.filter(deletion=deletion).order_by('pk')
+    while batch := list(items.values_list('pk', flat=True)[:size]):
+        with batched_unlinks(), transaction.atomic():
+            MediaItem.all_objects.filter(pk__in=batch).delete()
+        heartbeat()
+
+    # Leaves first, so each delete only cascades through what is left of its own subtree
+    folders = Folder.all_objects.filter(deletion=deletion).annotate(depth=Max('ancestor_links__depth')).order_by('-depth', 'pk')
+    while batch := list(folders.values_list('pk', flat=True)[:size]):
+        with transaction.atomic():
+            Folder.all_objects.filter(pk__in=batch).delete()
+        heartbeat()
+
+    if deletion.kind == 'ACCOUNT' and deletion.owner_id:
+        with transaction.atomic():
+            deletion.owner.delete()
+
+    Deletion.objects.filter(pk=deletion.pk).update(status='DONE', finished_at=timezone.now())
+
+def generated_files(item):
+    """Storage names (files and directories) that belong to `item` alone."""
+    names = {os.path.dirname(path) for path in (item.hls_manifest, item.sprite_vtt, item.preview_clip) if path}
+    if item.thumbnail:
+        names.add(item.thumbnail.name)
+    return names
+
+def discard_files(names):
+    """Unlink `names` once the surrounding transaction commits, or with the batch when inside batched_unlinks."""
+    pending = _pending_unlinks.get()
+    if pending is not None:
+        pending.extend(names)
+    elif names:
+        transaction.on_commit(lambda: unlink(names))
+
+@contextmanager
+def batched_unlinks():
+    """Collect the files discarded inside the block and unlink them in parallel at the end."""
+    token = _pending_unlinks.set([])
+    try:
+        yield
+        names = _pending_unlinks.get()
+    finally:
+        _pending_unlinks.reset(token)
+    with ThreadPoolExecutor(settings.DELETION_UNLINK_THREADS) as pool:
+        list(pool.map(_unlink_one, names))
+
+def unlink(names):
+    for name in names:
+        _unlink_one(name)
+
+def _unlink_one(name):
+    path = default_storage.path(name)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,213 @@
+"""
+Personal recommendations for the home page rail, by matrix factorisation.
+
+The weighted view/like/favorite matrix of media.related is factorised with implicit-
+feedback ALS (Hu, Koren & Volinsky): every user u and item i get RECOMMEND_FACTORS-long
+vectors x_u, y_i, fitted so x_u . y_i approaches 1 where u engaged with i and 0
+elsewhere, with confidence 1 + RECOMMEND_ALPHA * weight on the observed cells. Each
+half-step solves one small regularised least-squares system per user (or item):
+
+    x_u = (Y^T Y + Y^T (C_u - I) Y + reg I)^-1 Y^T C_u p_u
+
+Y^T Y is shared and only the observed cells add to it, so a step costs
+O(interactions * f^2 + rows * f^3). Rows are solved in batches of similar length,
+padded to a dense block so NumPy does the sums and the batched solve.
+
+`manage.py build_recommendations` fits the model and stores the best RECOMMEND_TOP_N
+public items for every user active in the last RECOMMEND_ACTIVE_DAYS (Recommendation).
+The home rail reads a user's list through the cache and tops it up with trending items,
+which is also all new and anonymous users get. `manage.py benchmark_recommendations`
+holds out interactions and reports recall/nDCG against a popularity baseline, with timings.
+"""
+import datetime
+import time
+
+import numpy as np
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LISTED, PUBLIC, MediaItem, Recommendation
+from .related import SOURCES, interactions
+
+# Padded block size (rows x longest row) of one batched solve
+SOLVE_BUDGET = 1 << 16
+
+def _rows(rows, n_rows):
+    """Entry order grouped by row, each row's start in it, and its length."""
+    order = np.argsort(rows, kind='stable')
+    counts = np.bincount(rows, minlength=n_rows)
+    return order, np.cumsum(counts) - counts, counts
+
+def _half_step(rows, cols, confidence, fixed, n_rows, reg):
+    """Solve every row's factors against the `fixed` side's factors."""
+    factors = fixed.shape[1]
+    gram = fixed.T @ fixed + reg * np.eye(factors)
+    order, starts, counts = _rows(rows, n_rows)
+    cols, confidence = cols[order], confidence[order]
+    solved = np.zeros((n_rows, factors))
+    by_length = np.argsort(-counts, kind='stable')
+    by_length = by_length[counts[by_length] > 0]
+    i = 0
+    while i < len(by_length):
+        longest = counts[by_length[i]]
+        batch = by_length[i:i + max(1, SOLVE_BUDGET // longest)]
+        i += len(batch)
+        offsets = np.arange(longest)
+        present = offsets < counts[batch, None]
+        entries = np.where(present, starts[batch, None] + offsets, 0)
+        vectors = fixed[cols[entries]]
+        c = np.where(present, confidence[entries], 0.0)
+        # (C_u - I) is zero off the observed cells, and so are the padding cells
+        a = gram + (vectors * np.where(present, c - 1, 0.0)[..., None]).transpose(0, 2, 1) @ vectors
+        b = np.einsum('bm,bmk->bk', c, vectors)
+        solved[batch] = np.linalg.solve(a, b[..., None])[..., 0]
+    return solved
+
+def factorize(users, items, weights, n_users, n_items, factors=None, reg=None, alpha=None, iterations=None, seed=0):
+    """User and item factor matrices for dense user/item indices and interaction weights."""
+    factors = factors or settings.RECOMMEND_FACTORS
+    reg = reg if reg is not None else settings.RECOMMEND_REGULARIZATION
+    alpha = alpha if alpha is not None else settings.RECOMMEND_ALPHA
+    confidence = 1 + alpha * np.asarray(weights, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    y = rng.normal(scale=0.01, size=(n_items, factors))
+    x = np.zeros((n_users, factors))
+    for _ in range(iterations or settings.RECOMMEND_ITERATIONS):
+        x = _half_step(users, items, confidence, y, n_users, reg)
+        y = _half_step(items, users, confidence, x, n_items, reg)
+    return x, y
+
+def _positions(starts, counts):
+    """Indices of every entry of the given rows, row after row."""
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+def top_n(scores_for, users, seen_users, seen_items, n_users, candidates, n):
+    """
+    Best `n` candidate item indices for each of `users` (dense indices), skipping the items
+    they have seen; -1 pads rows with fewer. `scores_for(batch)` returns the batch's score
+    rows over all items.
+    """
+    order, starts, counts = _rows(seen_users, n_users)
+    seen_items = seen_items[order]
+    n = min(n, int(candidates.sum()))
+    result = np.zeros((len(users), n), dtype=np.int64)
+    if not n:
+        return result
+    # About 64 MB of float32 scores per batch
+    step = max(1, (1 << 24) // len(candidates))
+    for begin in range(0, len(users), step):
+        batch = users[begin:begin + step]
+        scores = scores_for(batch).astype(np.float32)
+        scores[:, ~candidates] = -np.inf
+        scores[np.repeat(np.arange(len(batch)), counts[batch]), seen_items[_positions(starts[batch], counts[batch])]] = -np.inf
+        best = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        ranked = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-ranked, axis=1, kind='stable')
+        best, ranked = np.take_along_axis(best, order, axis=1), np.take_along_axis(ranked, order, axis=1)
+        result[begin:begin + len(batch)] = np.where(np.isfinite(ranked), best, -1)
+    return result
+
+def active_users(since):
+    ids = set()
+    for app_label, model_name, _ in SOURCES:
+        model = global_apps.get_model(app_label, model_name)
+        ids.update(model.objects.filter(created_at__gte=since).values_list('user_id', flat=True).distinct())
+    return ids
+
+def refresh():
+    """Refit the model and rewrite every active user's list; returns (users written, seconds spent fitting)."""
+    started = timezone.now()
+    user_ids, item_ids, weights = interactions()
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    items, item_index = np.unique(item_ids, return_inverse=True)
+    active = np.isin(users, list(active_users(started - datetime.timedelta(days=settings.RECOMMEND_ACTIVE_DAYS))))
+    public = MediaItem.objects.filter(LISTED, PUBLIC, pk__in=items.tolist())
+    candidates = np.isin(items, list(public.values_list('pk', flat=True)))
+    if not active.any() or not candidates.any():
+        Recommendation.objects.all().delete()
+        return 0, 0.0
+
+    clock = time.perf_counter()
+    x, y = factorize(user_index, item_index, weights, len(users), len(items))
+    fitted = time.perf_counter() - clock
+    picks = top_n(lambda batch: x[batch] @ y.T, np.flatnonzero(active), user_index, item_index, len(users), candidates, settings.RECOMMEND_TOP_N)
+    rows = [
+        Recommendation(user_id=pk, item_ids=items[best[best >= 0]].tolist(), updated_at=started)
+        for pk, best in zip(users[active].tolist(), picks)
+    ]
+    with transaction.atomic():
+        Recommendation.objects.all().delete()
+        Recommendation.objects.bulk_create(rows, batch_size=1000)
+    return len(rows), fitted
+
+def _cached_ids(user):
+    key = f'recommended_{user.pk}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = Recommendation.objects.filter(pk=user.pk).values_list('item_ids', flat=True).first() or []
+        cache.set(key, ids, settings.RECOMMEND_CACHE_SECONDS)
+    return ids
+
+def recommended_for(user, items, limit=15):
+    """
+    The home rail: `user`'s precomputed picks among `items` (a visible_to queryset), then
+    trending and then staff uploads for whatever is left, and for new or anonymous users.
+    """
+    ids = _cached_ids(user) if user.is_authenticated else []
+    found = items.in_bulk(ids[:limit * 2])
+    picks = [found[pk] for pk in ids if pk in found][:limit]
+    for fallback in (items.filter(trending__isnull=False).order_by('-trending__score'), items.filter(uploader__is_superuser=True).order_by('-created_at')):
+        if len(picks) >= limit:
+            break
+        picks += fallback.exclude(pk__in=[item.pk for item in picks])[:limit - len(picks)]
+    return picks
+
+def split(users, holdout, seed=0):
+    """Mask of held-out entries: a random `holdout` share of each user's interactions (at least one), for users with two or more."""
+    counts = np.bincount(users)
+    order = np.lexsort((np.random.default_rng(seed).random(len(users)), users))
+    rank = np.arange(len(users)) - (np.cumsum(counts) - counts)[users[order]]
+    take = np.maximum(1, (counts * holdout).astype(np.int64))
+    held = np.zeros(len(users), bool)
+    held[order] = (rank < take[users[order]]) & (counts[users[order]] >= 2)
+    return held
+
+def evaluate(users, items, weights, n_users, n_items, holdout=0.2, k=10, seed=0, **params):
+    """
+    Offline evaluation on dense indices: hold out part of each user's interactions, fit on
+    the rest, and score the top `k` of ALS and of a popularity ranking against the held-out
+    items. Returns {'als': metrics, 'popular': metrics, 'fit_seconds', 'rank_seconds'}.
+    """
+    held = split(users, holdout, seed)
+    train = ~held
+    clock = time.perf_counter()
+    x, y = factorize(users[train], items[train], weights[train], n_users, n_items, seed=seed, **params)
+    fitted = time.perf_counter() - clock
+
+    tested = np.unique(users[held])
+    truth = {}
+    for user, item in zip(users[held].tolist(), items[held].tolist()):
+        truth.setdefault(user, set()).add(item)
+    everything = np.ones(n_items, bool)
+    popularity = np.bincount(items[train], minlength=n_items).astype(np.float32)
+
+    clock = time.perf_counter()
+    als = top_n(lambda batch: x[batch] @ y.T, tested, users[train], items[train], n_users, everything, k)
+    ranked = time.perf_counter() - clock
+    popular = top_n(lambda batch: np.broadcast_to(popularity, (len(batch), n_items)), tested, users[train], items[train], n_users, everything, k)
+
+    discount = 1 / np.log2(np.arange(2, k + 2))
+    def metrics(picks):
+        recall, ndcg = [], []
+        for user, row in zip(tested.tolist(), picks.tolist()):
+            hits = np.array([item in truth[user] for item in row], dtype=float)
+            recall.append(hits.sum() / min(k, len(truth[user])))
+            ndcg.append((hits * discount[:len(hits)]).sum() / discount[:min(k, len(truth[user]))].sum())
+        return {
+            f'recall@{k}': float(np.mean(recall)), f'ndcg@{k}': float(np.mean(ndcg)),
+            'coverage': len(np.unique(picks[picks >= 0])) / n_items,
+        }
+    return {'als': metrics(als), 'popular': metrics(popular), 'fit_seconds': fitted, 'rank_seconds': ranked, 'users': len(tested)}
@@ -0,0 +1,144 @@
+"""
+Item-to-item recommendations from co-engagement ("people who viewed this also viewed").
+
+Views, likes and favorites form a weighted user x item matrix R (RELATED_WEIGHTS per
+event, summed when a user has several with one item). Two items are related by the
+cosine of their columns, (R^T R)[i, j] / (|R_i| |R_j|), and RelatedItems keeps the best
+RELATED_TOP_K ids of every item, so media_detail reads one row by primary key and
+filters it through visible_to.
+
+There is no SciPy, so R^T R is built in NumPy from coordinate arrays: entries are
+grouped by user, every pair within a user's group is one product term, and terms are
+summed per (item, item) key with unique + bincount. Users are processed in slices of
+about RELATED_PAIR_CHUNK terms to bound memory; users with more than
+RELATED_MAX_USER_ITEMS interactions (crawlers, bulk viewers) would add quadratically
+many weak terms and are left out.
+
+`manage.py build_related` refreshes the rows of items with interactions since the last
+run (their columns changed); `--full` recomputes everything, which also accounts for
+removed likes and favorites.
+"""
+import numpy as np
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import MediaItem, RelatedItems
+
+# (app label, model, event) whose rows, with user and media_item, are interactions
+SOURCES = [
+    ('social', 'MediaView', 'view'),
+    ('social', 'Like', 'like'),
+    ('social', 'Favorite', 'favorite'),
+]
+
+def interactions(apps=global_apps):
+    """(user ids, item ids, weights) with one entry per user and item, sorted by user then item."""
+    parts = []
+    for app_label, model_name, event in SOURCES:
+        rows = apps.get_model(app_label, model_name).objects.values_list('user_id', 'media_item_id')
+        pairs = np.fromiter(rows.iterator(chunk_size=10000), dtype=[('user', np.int64), ('item', np.int64)])
+        parts.append((pairs, np.full(len(pairs), settings.RELATED_WEIGHTS[event], dtype=np.float32)))
+    pairs = np.concatenate([pairs for pairs, _ in parts])
+    weights = np.concatenate([weights for _, weights in parts])
+    if not len(pairs):
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float32)
+    pairs, index = np.unique(pairs, return_inverse=True)
+    return pairs['user'], pairs['item'], np.bincount(index, weights=weights).astype(np.float32)
+
+def touched_since(when, apps=global_apps):
+    """Ids of the items with an interaction after `when`."""
+    ids = set()
+    for app_label, model_name, _ in SOURCES:
+        model = apps.get_model(app_label, model_name)
+        ids.update(model.objects.filter(created_at__gt=when).values_list('media_item_id', flat=True).distinct())
+    return ids
+
+def _sum_by_key(keys, values):
+    keys, index = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(index, weights=values)
+
+def similar(users, items, weights, targets=None, top_k=None):
+    """{item id: [related item ids, best first]} for `targets` (default every item)."""
+    top_k = top_k or settings.RELATED_TOP_K
+    if not len(users):
+        return {}
+    ids, column = np.unique(items, return_inverse=True)
+    n = len(ids)
+    norms = np.sqrt(np.bincount(column, weights=np.square(weights, dtype=np.float64), minlength=n))
+
+    # Group entries by user (the input is already user-sorted); drop users too heavy to pair up
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    counts = np.diff(np.r_[starts, len(users)])
+    keep = counts <= settings.RELATED_MAX_USER_ITEMS
+    entry_keep = np.repeat(keep, counts)
+    column, weights = column[entry_keep], weights[entry_keep].astype(np.float64)
+    counts = counts[keep]
+    starts = np.cumsum(counts) - counts
+
+    group_start = np.repeat(starts, counts)
+    group_size = np.repeat(counts, counts)
+    wanted = np.ones(n, bool) if targets is None else np.isin(ids, list(targets))
+    left_entries = np.flatnonzero(wanted[column])
+
+    # Slices of left entries whose pair terms add up to about RELATED_PAIR_CHUNK
+    terms = np.cumsum(group_size[left_entries])
+    bounds = np.searchsorted(terms, np.arange(settings.RELATED_PAIR_CHUNK, terms[-1] if len(terms) else 0, settings.RELATED_PAIR_CHUNK))
+    keys, sums = [], []
+    for chunk in np.split(left_entries, bounds):
+        if not len(chunk):
+            continue
+        sizes = group_size[chunk]
+        left = np.repeat(chunk, sizes)
+        offset = np.arange(len(left)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        right = np.repeat(group_start[chunk], sizes) + offset
+        mask = column[left] != column[right]
+        left, right = left[mask], right[mask]
+        chunk_keys, chunk_sums = _sum_by_key(column[left] * n + column[right], weights[left] * weights[right])
+        keys.append(chunk_keys)
+        sums.append(chunk_sums)
+    if not keys:
+        return {}
+    keys, sums = _sum_by_key(np.concatenate(keys), np.concatenate(sums))
+
+    rows, cols = keys // n, keys % n
+    scores = sums / (norms[rows] * norms[cols])
+    order = np.lexsort((cols, -scores, rows))
+    rows, cols = rows[order], cols[order]
+    first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(first, np.diff(np.r_[first, len(rows)]))
+    rows, cols = rows[rank < top_k], cols[rank < top_k]
+
+    related = {}
+    for row, col in zip(ids[rows].tolist(), ids[cols].tolist()):
+        related.setdefault(row, []).append(col)
+    return related
+
+def refresh(full=False, apps=global_apps):
+    """Recompute the related lists of items interacted with since the last run (or all); returns how many were written."""
+    model = apps.get_model('media', 'RelatedItems')
+    started = timezone.now()
+    targets = None
+    if not full:
+        last = model.objects.aggregate(last=Max('updated_at'))['last']
+        if last is not None:
+            targets = touched_since(last, apps)
+            if not targets:
+                return 0
+    related = similar(*interactions(apps), targets=targets)
+    rows = [model(media_item_id=pk, item_ids=ids, updated_at=started) for pk, ids in related.items()]
+    with transaction.atomic():
+        (model.objects.all() if targets is None else model.objects.filter(pk__in=targets)).delete()
+        model.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+def related_to(item, user, limit=10):
+    """Items to show next to `item` for `user`: its precomputed list, or recent items of its type."""
+    ids = RelatedItems.objects.filter(pk=item.pk).values_list('item_ids', flat=True).first()
+    visible = MediaItem.objects.visible_to(user).prefetch_related('renditions')
+    if not ids:
+        return list(visible.filter(media_type=item.media_type).exclude(pk=item.pk).order_by('-created_at', '-id')[:limit])
+    found = visible.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found][:limit]
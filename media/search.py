@@ -0,0 +1,205 @@
+"""
+Full-text search over media items, folders and users.
+
+SearchEntry holds one row per searchable object: a title, a body (description, file
+name, folder name, owner) and the columns visibility is decided on. The text index is
+backend specific and created by the migration (`install`):
+
+* SQLite: an external-content FTS5 table kept in step with SearchEntry by triggers,
+  ranked with bm25() (titles weigh more than bodies).
+* PostgreSQL: a generated, weighted tsvector column with a GIN index, ranked with
+  ts_rank_cd (PostgreSQL has no built-in BM25).
+* Anything else falls back to unranked LIKE matching.
+
+The signals in media.signals keep SearchEntry current, and `manage.py rebuild_search_index`
+rebuilds it. `search` answers a query with one statement that applies the visibility
+rules and keeps the best SEARCH_RESULTS_PER_GROUP hits of every group (each media type,
+folders, users) with a window function.
+"""
+import posixpath
+import re
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import SearchEntry
+
+FTS_TABLE = 'media_search_fts'
+ENTRY_FIELDS = ('kind', 'object_id', 'owner_id', 'media_type', 'is_hidden', 'is_private', 'owner_is_private', 'title', 'body')
+# Saves touching none of these leave an object's entry unchanged
+ITEM_FIELDS = {'title', 'description', 'file', 'folder', 'folder_id', 'media_type', 'is_private', 'is_hidden', 'uploader_is_private'}
+FOLDER_FIELDS = {'name', 'is_private', 'is_hidden'}
+USER_FIELDS = {'username', 'first_name', 'last_name', 'bio', 'is_private', 'is_active'}
+
+SQLITE_INSTALL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, body, content='media_searchentry', content_rowid='id', "
+    "prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER media_search_ai AFTER INSERT ON media_searchentry BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    f"CREATE TRIGGER media_search_ad AFTER DELETE ON media_searchentry BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    f"CREATE TRIGGER media_search_au AFTER UPDATE ON media_searchentry BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS media_search_ai',
+    'DROP TRIGGER IF EXISTS media_search_ad',
+    'DROP TRIGGER IF EXISTS media_search_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+POSTGRES_INSTALL = [
+    "ALTER TABLE media_searchentry ADD COLUMN vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')) STORED",
+    'CREATE INDEX media_search_vector_idx ON media_searchentry USING GIN (vector)',
+]
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS media_search_vector_idx',
+    'ALTER TABLE media_searchentry DROP COLUMN IF EXISTS vector',
+]
+
+def install(schema_editor):
+    for sql in {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+def uninstall(schema_editor):
+    for sql in {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+def _text(*parts):
+    return ' '.join(part for part in parts if part)
+
+def item_entries(items):
+    """SearchEntry field dicts for a MediaItem queryset (any manager, historical models too)."""
+    rows = items.values(
+        'pk', 'title', 'description', 'file', 'media_type', 'is_private', 'is_hidden', 'uploader_is_private',
+        'uploader_id', 'folder__name', 'uploader__username',
+    )
+    for row in rows.iterator():
+        yield {
+            'kind': 'media', 'object_id': row['pk'], 'owner_id': row['uploader_id'], 'media_type': row['media_type'],
+            'is_hidden': row['is_hidden'], 'is_private': row['is_private'], 'owner_is_private': row['uploader_is_private'],
+            'title': row['title'][:255],
+            'body': _text(row['description'], posixpath.basename(row['file'] or ''), row['folder__name'], row['uploader__username']),
+        }
+
+def folder_entries(folders):
+    rows = folders.values('pk', 'name', 'owner_id', 'is_private', 'is_hidden', 'owner__is_private', 'owner__username')
+    for row in rows.iterator():
+        yield {
+            'kind': 'folder', 'object_id': row['pk'], 'owner_id': row['owner_id'], 'media_type': '',
+            'is_hidden': row['is_hidden'], 'is_private': row['is_private'], 'owner_is_private': row['owner__is_private'],
+            'title': row['name'], 'body': row['owner__username'],
+        }
+
+def user_entries(users):
+    rows = users.values('pk', 'username', 'first_name', 'last_name', 'bio', 'is_private', 'is_active')
+    for row in rows.iterator():
+        # Profiles are listed whatever their privacy; deactivated accounts are not
+        yield {
+            'kind': 'user', 'object_id': row['pk'], 'owner_id': row['pk'], 'media_type': '',
+            'is_hidden': not row['is_active'], 'is_private': False, 'owner_is_private': row['is_private'],
+            'title': row['username'], 'body': _text(row['first_name'], row['last_name'], row['bio']),
+        }
+
+def _sync(kind, entries):
+    """Rewrite the entries that differ from what is stored; unchanged objects cost one SELECT."""
+    entries = {entry['object_id']: entry for entry in entries}
+    if not entries:
+        return
+    stored = {row['object_id']: row for row in SearchEntry.objects.filter(kind=kind, object_id__in=entries).values(*ENTRY_FIELDS)}
+    stale = [pk for pk, entry in entries.items() if stored.get(pk) != entry]
+    if stale:
+        with transaction.atomic():
+            SearchEntry.objects.filter(kind=kind, object_id__in=stale).delete()
+            SearchEntry.objects.bulk_create([SearchEntry(**entries[pk]) for pk in stale])
+
+def index_items(items):
+    _sync('media', item_entries(items))
+
+def index_folders(folders):
+    _sync('folder', folder_entries(folders))
+
+def index_users(users):
+    _sync('user', user_entries(users))
+
+def remove(kind, ids):
+    SearchEntry.objects.filter(kind=kind, object_id__in=ids).delete()
+
+def rebuild(apps=global_apps):
+    """Recreate every entry; returns how many. Takes an app registry so migrations can run it."""
+    entry_model = apps.get_model('media', 'SearchEntry')
+    items = apps.get_model('media', 'MediaItem')._base_manager.filter(deletion__isnull=True)
+    folders = apps.get_model('media', 'Folder')._base_manager.filter(deletion__isnull=True)
+    users = apps.get_model(settings.AUTH_USER_MODEL).objects.all()
+    with transaction.atomic():
+        entry_model.objects.all().delete()
+        total = 0
+        for entries in (item_entries(items), folder_entries(folders), user_entries(users)):
+            batch = [entry_model(**entry) for entry in entries]
+            entry_model.objects.bulk_create(batch, batch_size=1000)
+            total += len(batch)
+    return total
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())[:8]
+
+def _visibility(user):
+    """WHERE clause (on alias e) and params: the MediaItem/Folder visible_to rules, plus every active profile."""
+    if user.is_authenticated and user.is_superuser:
+        return 'NOT e.is_hidden', []
+    rule = "e.kind = 'user' OR (NOT e.is_private AND NOT e.owner_is_private)"
+    params = []
+    if user.is_authenticated:
+        follow_table = connection.ops.quote_name(global_apps.get_model('social', 'Follow')._meta.db_table)
+        rule += f' OR e.owner_id = %s OR e.owner_id IN (SELECT followed_id FROM {follow_table} WHERE follower_id = %s AND is_accepted)'
+        params = [user.pk, user.pk]
+    return f'NOT e.is_hidden AND ({rule})', params
+
+def _hits(words):
+    """A SELECT of (grp, object_id, rank) over the matching entries, higher rank first, and its params."""
+    group = "CASE WHEN e.kind = 'media' THEN e.media_type ELSE e.kind END AS grp"
+    if connection.vendor == 'sqlite':
+        # Quoted terms are literal tokens; the trailing * makes each a prefix query
+        match = ' '.join(f'"{word}"*' for word in words)
+        return (
+            f'SELECT {group}, e.object_id, -bm25({FTS_TABLE}, 10.0, 1.0) AS rank '
+            f'FROM {FTS_TABLE} JOIN media_searchentry e ON e.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s',
+            [match],
+        )
+    if connection.vendor == 'postgresql':
+        match = ' & '.join(f'{word}:*' for word in words)
+        return (
+            f"SELECT {group}, e.object_id, ts_rank_cd(e.vector, q) AS rank "
+            f"FROM media_searchentry e, to_tsquery('simple', %s) q WHERE e.vector @@ q",
+            [match],
+        )
+    like = ' AND '.join(['(LOWER(e.title) LIKE %s OR LOWER(e.body) LIKE %s)'] * len(words))
+    return (
+        f'SELECT {group}, e.object_id, 0 AS rank FROM media_searchentry e WHERE {like}',
+        [f'%{word}%' for word in words for _ in range(2)],
+    )
+
+def search(user, query, per_group=None):
+    """
+    Ids of the best matches for `query` that `user` may see, grouped as
+    {'IMAGE': [...], 'VIDEO': [...], 'DOCUMENT': [...], 'OTHER': [...], 'folder': [...], 'user': [...]}.
+    """
+    words = terms(query)
+    if not words:
+        return {}
+    hits, params = _hits(words)
+    visible, visible_params = _visibility(user)
+    sql = (
+        'SELECT grp, object_id FROM ('
+        'SELECT grp, object_id, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY rank DESC, object_id DESC) AS n '
+        f'FROM ({hits} AND {visible}) hits'
+        ') ranked WHERE n <= %s ORDER BY grp, n'
+    )
+    groups = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, *visible_params, per_group or settings.SEARCH_RESULTS_PER_GROUP])
+        for group, object_id in cursor.fetchall():
+            groups.setdefault(group, []).append(object_id)
+    return groups
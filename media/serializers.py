@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Folder, MediaItem, Collection, Category
+from .models import Folder, MediaItem, Collection, Category, Deletion, UploadSession
 from core.serializers import UserSerializer
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -12,7 +12,7 @@ class FolderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Folder
         fields = '__all__'
-        read_only_fields = ['owner', 'created_at', 'updated_at']
+        read_only_fields = ['owner', 'created_at', 'updated_at', 'item_count', 'total_size', 'cover_cache']
 
 class MediaItemSerializer(serializers.ModelSerializer):
     uploader = UserSerializer(read_only=True)
@@ -25,11 +25,19 @@ class MediaItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = MediaItem
         fields = '__all__'
-        read_only_fields = ['uploader', 'created_at', 'updated_at', 'views_count', 'downloads_count', 'media_type', 'duration', 'width', 'height', 'is_processed']
+        read_only_fields = ['uploader', 'created_at', 'updated_at', 'views_count', 'downloads_count', 'media_type', 'duration', 'width', 'height', 'is_processed', 'hls_manifest', 'sprite_vtt', 'preview_clip', 'file_size', 'phash', 'placeholder', 'dominant_color']
 
     def get_extension(self, obj):
         return obj.file.name.split('.')[-1] if obj.file else ''
 
+class DeletionSerializer(serializers.ModelSerializer):
+    remaining_items = serializers.ReadOnlyField()
+    remaining_folders = serializers.ReadOnlyField()
+
+    class Meta:
+        model = Deletion
+        fields = ['id', 'kind', 'status', 'total_items', 'total_folders', 'remaining_items', 'remaining_folders', 'created_at', 'finished_at']
+
 class CollectionSerializer(serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     items = MediaItemSerializer(many=True, read_only=True)
@@ -37,3 +45,25 @@ class CollectionSerializer(serializers.ModelSerializer):
         model = Collection
         fields = '__all__'
         read_only_fields = ['owner', 'created_at']
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    parent_folder_id = serializers.PrimaryKeyRelatedField(
+        queryset=Folder.objects.all(), source='parent_folder', write_only=True, required=False, allow_null=True
+    )
+    is_complete = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'title', 'relative_path', 'parent_folder_id', 'total_size', 'offset', 'is_complete', 'media_item', 'created_at', 'updated_at']
+        read_only_fields = ['offset', 'media_item', 'created_at', 'updated_at']
+
+    def validate_parent_folder_id(self, folder):
+        if folder and folder.owner != self.context['request'].user:
+            raise serializers.ValidationError("Folder not found.")
+        return folder
+
+    def validate_total_size(self, value):
+        # An empty upload never writes a chunk, so there would be no file to finalize
+        if value < 1:
+            raise serializers.ValidationError("Empty files cannot be uploaded.")
+        return value
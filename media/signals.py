@@ -1,38 +1,127 @@
-import os
-import subprocess
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
-from .models import MediaItem
-from django.core.files import File
+from .models import MediaItem, Folder, Rendition, SearchEntry
+from . import search
+from .counters import no_cover, refresh_covers, shift
+from .jobs import enqueue_processing
+from .quota import charge, charge_derived
+from .reaper import discard_files, generated_files
+from .storage import track_blob_field
+from .trending import SOURCES, record
+
+track_blob_field(MediaItem, 'file')
+track_blob_field(Folder, 'cover_image')
+track_blob_field(Rendition, 'file')
+
+@receiver(post_save, sender=MediaItem)
+def queue_processing(sender, instance, created, **kwargs):
+    # Heavy work (ffmpeg etc.) runs in `manage.py process_media`; the request only enqueues it.
+    if created:
+        enqueue_processing([instance])
+
+@receiver(post_delete, sender=MediaItem)
+def remove_generated(sender, instance, **kwargs):
+    # Thumbnail, HLS ladder and preview directories belong to this item alone
+    discard_files(generated_files(instance))
+
+@receiver(post_init, sender=MediaItem)
+def remember_placement(sender, instance, **kwargs):
+    # Raw column values, so deferred fields are not fetched
+    if 'folder_id' in instance.__dict__:
+        instance._placement = (instance.__dict__['folder_id'], instance.__dict__.get('file_size', 0))
+
+@receiver(post_save, sender=MediaItem)
+def update_folder_counters(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'folder', 'folder_id', 'file_size'} & set(update_fields):
+        return
+    if not created and not hasattr(instance, '_placement'):
+        return
+    old_folder, old_size = (None, 0) if created else instance._placement
+    new_folder, new_size = instance.folder_id, instance.file_size
+    instance._placement = (new_folder, new_size)
+    charge(instance.uploader_id, new_size - old_size)
+
+    if old_folder == new_folder:
+        shift(new_folder, size=new_size - old_size)
+        return
+    shift(old_folder, -1, -old_size)
+    shift(new_folder, 1, new_size)
+    if instance.media_type == 'IMAGE':
+        refresh_covers(Folder.objects.filter(pk=old_folder, cover_cache=instance.file.name))
+        if created:
+            # The newest image is the default cover
+            Folder.objects.filter(no_cover(), pk=new_folder).update(cover_cache=instance.file.name)
+        else:
+            refresh_covers(Folder.objects.filter(no_cover(), pk=new_folder))
+
+@receiver(post_delete, sender=MediaItem)
+def release_folder_counters(sender, instance, **kwargs):
+    shift(instance.folder_id, -1, -instance.file_size)
+    charge(instance.uploader_id, -instance.file_size - instance.derived_size)
+    if instance.folder_id and instance.media_type == 'IMAGE':
+        refresh_covers(Folder.objects.filter(pk=instance.folder_id, cover_cache=instance.file.name))
+
+@receiver(post_save, sender=Rendition)
+def account_rendition(sender, instance, created, **kwargs):
+    # Renditions only go away with their item, whose derived_size already includes them
+    if created:
+        charge_derived(instance.media_item, instance.file.size)
+
+@receiver(post_delete, sender=Folder)
+def release_folder_size(sender, instance, **kwargs):
+    # Subfolders removed by the same cascade find their parent's links already gone, so only
+    # the top of a deleted subtree takes its bytes off the surviving ancestors
+    shift(instance.parent_id, size=-instance.total_size)
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def sync_uploader_privacy(sender, instance, created, update_fields=None, **kwargs):
+    # Keep MediaItem.uploader_is_private in step with the profile setting
+    if created or (update_fields is not None and 'is_private' not in update_fields):
+        return
+    MediaItem.all_objects.filter(uploader=instance).exclude(uploader_is_private=instance.is_private).update(uploader_is_private=instance.is_private)
+
+def record_trending(event):
+    def handler(sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            record(event, [instance.media_item_id])
+    return handler
+
+# Bulk inserts (archive downloads) call media.trending.record themselves
+for app_label, model_name, event in SOURCES:
+    post_save.connect(record_trending(event), sender=f'{app_label}.{model_name}', weak=False, dispatch_uid=f'trending_{event}')
 
 @receiver(post_save, sender=MediaItem)
-def generate_thumbnail(sender, instance, created, **kwargs):
-    if created and instance.media_type == 'VIDEO' and not instance.thumbnail:
-        try:
-            # Assume file is available locally (FileSystemStorage)
-            if not instance.file:
-                return
-
-            video_path = instance.file.path
-            base_dir = os.path.dirname(video_path)
-            thumb_name = f"{instance.id}_thumb.jpg"
-            thumb_path = os.path.join(base_dir, thumb_name)
-
-            # Generate thumbnail
-            subprocess.run([
-                'ffmpeg', '-y', '-i', video_path, 
-                '-ss', '00:00:01.000', '-vframes', '1', 
-                thumb_path
-            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            
-            # Save to instance
-            if os.path.exists(thumb_path):
-                with open(thumb_path, 'rb') as f:
-                    instance.thumbnail.save(thumb_name, File(f), save=False)
-                    instance.save(update_fields=['thumbnail'])
-                
-                # clean up temporary file
-                os.remove(thumb_path)
-                
-        except Exception as e:
-            print(f"Thumbnail generation failed: {e}")
+def index_item(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or search.ITEM_FIELDS & set(update_fields):
+        search.index_items(MediaItem.all_objects.filter(pk=instance.pk))
+
+@receiver(post_delete, sender=MediaItem)
+def unindex_item(sender, instance, **kwargs):
+    search.remove('media', [instance.pk])
+
+@receiver(post_save, sender=Folder)
+def index_folder(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not search.FOLDER_FIELDS & set(update_fields):
+        return
+    renamed = SearchEntry.objects.filter(kind='folder', object_id=instance.pk).exclude(title=instance.name).exists()
+    search.index_folders(Folder.all_objects.filter(pk=instance.pk))
+    if renamed:
+        # Item entries include their folder's name
+        search.index_items(MediaItem.all_objects.filter(folder=instance))
+
+@receiver(post_delete, sender=Folder)
+def unindex_folder(sender, instance, **kwargs):
+    search.remove('folder', [instance.pk])
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_user(sender, instance, update_fields=None, **kwargs):
+    # Connected after sync_uploader_privacy, so item rows already carry the new privacy
+    if update_fields is not None and not search.USER_FIELDS & set(update_fields):
+        return
+    changed = SearchEntry.objects.filter(kind='user', object_id=instance.pk).exclude(title=instance.username, owner_is_private=instance.is_private).exists()
+    search.index_users(type(instance).objects.filter(pk=instance.pk))
+    if changed:
+        # Owner name and privacy are copied into every entry of theirs
+        search.index_items(MediaItem.all_objects.filter(uploader=instance))
+        search.index_folders(Folder.all_objects.filter(owner=instance))
@@ -0,0 +1,138 @@
+"""
+Content-addressed storage for uploaded files.
+
+Every file is hashed (SHA-256) while it is written and stored once under
+`blobs/<aa>/<bb>/<sha256><ext>`, so re-uploading the same bytes - by the same user
+or anyone else - reuses the existing blob. Fields using this storage are tracked
+with `track_blob_field`, which keeps `Blob.ref_count` in step with the rows that
+point at each blob; a blob is only removed once nothing references it.
+"""
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+BLOB_PREFIX = 'blobs'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def blob_name(digest, ext):
+    return '/'.join([BLOB_PREFIX, digest[:2], digest[2:4], f'{digest}{ext.lower()}'])
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1]
+        digest = hashlib.sha256()
+
+        if hasattr(content, 'temporary_file_path'):
+            # Large uploads are already on disk: hash in place, then move instead of copying
+            for chunk in content.chunks(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+            final = blob_name(digest.hexdigest(), ext)
+            if not self.exists(final):
+                os.makedirs(os.path.dirname(self.path(final)), exist_ok=True)
+                file_move_safe(content.temporary_file_path(), self.path(final))
+        else:
+            # Hash while streaming into a scratch file next to the blob tree, then rename
+            tmp_path = self.path(os.path.join(BLOB_PREFIX, 'tmp', uuid.uuid4().hex))
+            os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+            try:
+                with open(tmp_path, 'wb') as fh:
+                    for chunk in content.chunks(HASH_CHUNK_SIZE):
+                        digest.update(chunk)
+                        fh.write(chunk)
+                final = blob_name(digest.hexdigest(), ext)
+                if not self.exists(final):
+                    os.makedirs(os.path.dirname(self.path(final)), exist_ok=True)
+                    os.replace(tmp_path, self.path(final))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        self._register(final, digest.hexdigest())
+        return final
+
+    def adopt(self, name):
+        """Move an already-written file (e.g. a finished resumable upload) into the blob tree."""
+        path = self.path(name)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        final = blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+        if self.exists(final):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(self.path(final)), exist_ok=True)
+            os.replace(path, self.path(final))
+        self._register(final, digest.hexdigest())
+        return final
+
+    def delete(self, name):
+        # Blobs are shared; only purge_blob may remove one, after its last reference is gone
+        if not is_blob(name):
+            super().delete(name)
+
+    def purge(self, name):
+        super().delete(name)
+
+    def _register(self, name, digest):
+        from .models import Blob
+        blob, created = Blob.objects.get_or_create(name=name, defaults={'sha256': digest, 'size': self.size(name)})
+        if not created:
+            # Touch it so a pending purge of a zero-ref blob sees it was just reused
+            Blob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+
+def blob_storage():
+    return ContentAddressedStorage()
+
+def incref(name, count=1):
+    from .models import Blob
+    if is_blob(name):
+        Blob.objects.filter(name=name).update(ref_count=F('ref_count') + count, updated_at=timezone.now())
+
+def decref(name):
+    from .models import Blob
+    from .jobs import enqueue
+    if not is_blob(name):
+        return
+    Blob.objects.filter(name=name).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+    if Blob.objects.filter(name=name, ref_count__lte=0).exists():
+        transaction.on_commit(lambda: enqueue('purge_blob', name=name, delay=settings.BLOB_PURGE_GRACE_SECONDS))
+
+def track_blob_field(model, field_name):
+    """Keep Blob.ref_count in sync with `model.field_name` on save and delete."""
+    attname = model._meta.get_field(field_name).attname
+
+    def remember(sender, instance, **kwargs):
+        # Read the raw column value so deferred fields are not fetched
+        if attname in instance.__dict__:
+            instance.__dict__.setdefault('_blob_names', {})[field_name] = str(instance.__dict__[attname] or '')
+
+    def saved(sender, instance, created=False, update_fields=None, **kwargs):
+        if update_fields is not None and field_name not in update_fields:
+            return
+        names = instance.__dict__.setdefault('_blob_names', {})
+        old = '' if created else names.get(field_name, '')
+        new = getattr(instance, field_name).name or ''
+        if old != new:
+            incref(new)
+            decref(old)
+            names[field_name] = new
+
+    def deleted(sender, instance, **kwargs):
+        decref(getattr(instance, field_name).name or '')
+
+    uid = f'{model._meta.label}.{field_name}'
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=f'blob_init_{uid}')
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=f'blob_save_{uid}')
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f'blob_delete_{uid}')
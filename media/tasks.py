@@ -0,0 +1,373 @@
+import fcntl
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from .jobs import RetryLater, extend_lease, task
+from .models import Blob, Deletion, MediaItem, Rendition
+from .phash import dhash
+from .placeholders import placeholder_for
+from .quota import charge_derived, directory_size
+from .reaper import reap
+from .storage import blob_storage
+
+@task('thumbnail')
+def generate_video_thumbnail(job):
+    instance = job.media_item
+    if instance.media_type != 'VIDEO' or instance.thumbnail or not instance.file:
+        return
+
+    # Assume file is available locally (FileSystemStorage)
+    video_path = instance.file.path
+    base_dir = os.path.dirname(video_path)
+    thumb_name = f"{instance.id}_thumb.jpg"
+    thumb_path = os.path.join(base_dir, thumb_name)
+
+    try:
+        # Grab a frame one second in; clips shorter than that yield no frame, so fall back to the first
+        for offset in ('00:00:01.000', '0'):
+            subprocess.run([
+                'ffmpeg', '-y', '-ss', offset, '-i', video_path,
+                '-vframes', '1', thumb_path
+            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=settings.MEDIA_JOB_VISIBILITY_TIMEOUT)
+            if os.path.exists(thumb_path):
+                break
+        else:
+            # No decodable frame at all; the item keeps its type icon
+            return
+
+        # Save to instance
+        with open(thumb_path, 'rb') as f:
+            instance.thumbnail.save(thumb_name, File(f), save=False)
+            instance.save(update_fields=['thumbnail'])
+        charge_derived(instance, instance.thumbnail.size)
+        store_placeholder(instance)
+    finally:
+        # clean up temporary file
+        if os.path.exists(thumb_path):
+            os.remove(thumb_path)
+
+@task('metadata')
+def extract_metadata(job):
+    read_metadata(job.media_item)
+
+def read_metadata(item):
+    """Fill duration/width/height: ffprobe for videos, a header-only Pillow read for images."""
+    if not item.file:
+        return False
+    if item.media_type == 'VIDEO':
+        fields = probe_video(item.file.path)
+    elif item.media_type == 'IMAGE':
+        fields = probe_image(item.file)
+    else:
+        return False
+    MediaItem.objects.filter(pk=item.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(item, name, value)
+    return True
+
+def probe_video(path):
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height:stream_tags=rotate:stream_side_data=rotation:format=duration',
+        '-of', 'json', path
+    ], check=True, capture_output=True, timeout=120)
+    info = json.loads(result.stdout or b'{}')
+    stream = (info.get('streams') or [{}])[0]
+    duration = info.get('format', {}).get('duration')
+
+    width, height = stream.get('width'), stream.get('height')
+    rotation = stream.get('tags', {}).get('rotate') or next(
+        (d.get('rotation') for d in stream.get('side_data_list', []) if 'rotation' in d), 0
+    )
+    if abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    return {'duration': float(duration) if duration else None, 'width': width, 'height': height}
+
+def probe_image(file):
+    # Image.open only parses the header; pixel data is never decoded here
+    with file.open('rb') as fh, Image.open(fh) as img:
+        width, height = img.size
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):  # EXIF orientation with a 90 degree turn
+            width, height = height, width
+    return {'width': width, 'height': height}
+
+def read_metadata_for(item_id):
+    # Entry point for the backfill process pool
+    item = MediaItem.objects.filter(pk=item_id).first()
+    return read_metadata(item) if item else False
+
+@contextmanager
+def host_slot(name, limit):
+    """Hold one of `limit` per-host slots (flock'd files) or defer the job."""
+    for i in range(limit):
+        fh = open(os.path.join(settings.HLS_LOCK_DIR, f'mediavault-{name}-{i}.lock'), 'w')
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fh.close()
+            continue
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+            fh.close()
+        return
+    raise RetryLater(60)
+
+@task('hls')
+def transcode_hls(job):
+    item = job.media_item
+    if item.media_type != 'VIDEO' or not item.file:
+        return
+    with host_slot('hls', settings.HLS_MAX_CONCURRENT):
+        extend_lease(job, settings.HLS_TIMEOUT)
+        build_hls(item)
+
+def has_audio(path):
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'a', '-show_entries', 'stream=index', '-of', 'csv=p=0', path
+    ], check=True, capture_output=True, timeout=120)
+    return bool(result.stdout.strip())
+
+def build_hls(item):
+    """Encode every rung of HLS_LADDER from a single decode of the source and publish master.m3u8."""
+    source = item.file.path
+    source_height = item.height or probe_video(source)['height']
+    rungs = [rung for rung in settings.HLS_LADDER if rung[0] <= source_height]
+    if not rungs:
+        # Smaller than the lowest rung: one variant at the source size
+        rungs = [(source_height - source_height % 2, *settings.HLS_LADDER[-1][1:])]
+    audio = has_audio(source)
+    seg = settings.HLS_SEGMENT_SECONDS
+
+    out_name = os.path.join('hls', str(item.id))
+    n = len(rungs)
+    graph = f"[0:v]split={n}" + ''.join(f'[s{i}]' for i in range(n)) + ';' + ';'.join(
+        f'[s{i}]scale=-2:{height}[v{i}]' for i, (height, _, _) in enumerate(rungs)
+    )
+    with publish_dir(out_name, item) as tmp_dir:
+        cmd = ['ffmpeg', '-y', '-v', 'error', '-i', source, '-filter_complex', graph]
+        for i, (height, video_rate, audio_rate) in enumerate(rungs):
+            bufsize = f'{int(video_rate.rstrip("k")) * 2}k'
+            cmd += ['-map', f'[v{i}]', f'-c:v:{i}', 'libx264', f'-b:v:{i}', video_rate,
+                    f'-maxrate:v:{i}', video_rate, f'-bufsize:v:{i}', bufsize]
+            if audio:
+                cmd += ['-map', '0:a:0', f'-c:a:{i}', 'aac', f'-b:a:{i}', audio_rate]
+        cmd += [
+            '-preset', 'veryfast', '-threads', str(settings.HLS_THREADS), '-ac', '2',
+            # Keyframes on segment boundaries so every rung switches cleanly
+            '-force_key_frames', f'expr:gte(t,n_forced*{seg})', '-sc_threshold', '0',
+            '-f', 'hls', '-hls_time', str(seg), '-hls_playlist_type', 'vod', '-hls_flags', 'independent_segments',
+            '-hls_segment_filename', os.path.join(tmp_dir, 'v%v', 'seg_%05d.ts'),
+            '-master_pl_name', 'master.m3u8',
+            '-var_stream_map', ' '.join(f'v:{i},a:{i}' if audio else f'v:{i}' for i in range(n)),
+            os.path.join(tmp_dir, 'v%v', 'index.m3u8'),
+        ]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=settings.HLS_TIMEOUT)
+
+    manifest = os.path.join(out_name, 'master.m3u8')
+    MediaItem.objects.filter(pk=item.pk).update(hls_manifest=manifest)
+    item.hls_manifest = manifest
+
+@task('previews')
+def generate_previews(job):
+    item = job.media_item
+    if item.media_type != 'VIDEO' or not item.file:
+        return
+    with host_slot('previews', settings.PREVIEW_MAX_CONCURRENT):
+        extend_lease(job, settings.HLS_TIMEOUT)
+        build_previews(item)
+
+def build_previews(item):
+    """
+    Scrub sprite sheets (indexed by thumbs.vtt) and a short muted hover clip, both
+    fed from one decode of the source through a split filter graph.
+    """
+    source = item.file.path
+    if item.duration and item.width and item.height:
+        duration, width, height = item.duration, item.width, item.height
+    else:
+        info = probe_video(source)
+        duration, width, height = info['duration'], info['width'], info['height']
+    if not (duration and width and height):
+        return
+
+    cols, rows = settings.SPRITE_GRID
+    interval = max(settings.SPRITE_INTERVAL, math.ceil(duration / settings.SPRITE_MAX_FRAMES))
+    frames = max(1, math.ceil(duration / interval))
+    tile_w = settings.SPRITE_TILE_WIDTH
+    tile_h = even(tile_w * height / width)
+    clip_w = settings.PREVIEW_CLIP_WIDTH
+    clip_h = even(clip_w * height / width)
+    clip_len = min(settings.PREVIEW_CLIP_SECONDS, duration)
+    clip_start = duration * 0.1 if duration > clip_len * 2 else 0
+
+    graph = ';'.join([
+        '[0:v]split=2[s][p]',
+        f'[s]fps=1/{interval},scale={tile_w}:{tile_h},tile={cols}x{rows}[sprite]',
+        f'[p]trim=start={clip_start:.3f}:duration={clip_len:.3f},setpts=PTS-STARTPTS,'
+        f'fps={settings.PREVIEW_CLIP_FPS},scale={clip_w}:{clip_h}[clip]',
+    ])
+    out_name = os.path.join('previews', str(item.id))
+    with publish_dir(out_name, item) as tmp_dir:
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-i', source, '-filter_complex', graph,
+            '-map', '[sprite]', '-q:v', '5', '-start_number', '0', os.path.join(tmp_dir, 'sprite_%03d.jpg'),
+            '-map', '[clip]', '-an', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '32',
+            '-pix_fmt', 'yuv420p', '-movflags', '+faststart', os.path.join(tmp_dir, 'preview.mp4'),
+        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=settings.HLS_TIMEOUT)
+
+        per_sheet = cols * rows
+        with open(os.path.join(tmp_dir, 'thumbs.vtt'), 'w') as vtt:
+            vtt.write('WEBVTT\n\n')
+            for frame in range(frames):
+                sheet = f'sprite_{frame // per_sheet:03d}.jpg'
+                if not os.path.exists(os.path.join(tmp_dir, sheet)):
+                    break
+                x = frame % per_sheet % cols * tile_w
+                y = frame % per_sheet // cols * tile_h
+                start, end = frame * interval, min((frame + 1) * interval, duration)
+                vtt.write(f'{vtt_time(start)} --> {vtt_time(end)}\n{sheet}#xywh={x},{y},{tile_w},{tile_h}\n\n')
+
+    item.sprite_vtt = os.path.join(out_name, 'thumbs.vtt')
+    item.preview_clip = os.path.join(out_name, 'preview.mp4')
+    MediaItem.objects.filter(pk=item.pk).update(sprite_vtt=item.sprite_vtt, preview_clip=item.preview_clip)
+
+def even(value):
+    return max(2, int(round(value / 2)) * 2)
+
+def vtt_time(seconds):
+    ms = int(round(seconds * 1000))
+    return f'{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}'
+
+@contextmanager
+def publish_dir(name, item):
+    """
+    Write into a scratch copy of MEDIA_ROOT/`name`; it replaces the real one only if the
+    block succeeds, and the size difference is charged to `item`.
+    """
+    out_dir = default_storage.path(name)
+    tmp_dir = f'{out_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        yield tmp_dir
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    replaced = directory_size(name)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    charge_derived(item, directory_size(name) - replaced)
+
+@task('renditions')
+def generate_renditions(job):
+    build_renditions(job.media_item)
+
+def build_renditions(item):
+    """Write the missing IMAGE_RENDITION_WIDTHS x IMAGE_RENDITION_FORMATS copies of an image."""
+    if item.media_type != 'IMAGE' or not item.file:
+        return []
+
+    existing = set(item.renditions.values_list('width', 'format'))
+    created = []
+    with item.file.open('rb') as fh, Image.open(fh) as original:
+        original.seek(0)  # first frame of animated images
+        img = ImageOps.exif_transpose(original)
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+        for width in settings.IMAGE_RENDITION_WIDTHS:
+            if width >= img.width:
+                break
+            height = max(1, round(img.height * width / img.width))
+            resized = img.resize((width, height), Image.Resampling.LANCZOS)
+
+            for fmt in settings.IMAGE_RENDITION_FORMATS:
+                if (width, fmt) in existing:
+                    continue
+                frame = resized
+                if fmt == 'jpeg' and has_alpha:
+                    frame = Image.new('RGB', resized.size, (255, 255, 255))
+                    frame.paste(resized, mask=resized.getchannel('A'))
+                buf = io.BytesIO()
+                frame.save(buf, fmt.upper(), quality=settings.IMAGE_RENDITION_QUALITY, optimize=True)
+
+                rendition = Rendition(media_item=item, width=width, height=height, format=fmt)
+                rendition.file.save(f'{width}.{fmt}', ContentFile(buf.getvalue()), save=False)
+                rendition.save()
+                created.append(rendition)
+    return created
+
+def build_renditions_for(item_id):
+    # Entry point for the backfill process pool
+    item = MediaItem.objects.filter(pk=item_id).first()
+    return len(build_renditions(item)) if item else 0
+
+@task('phash')
+def compute_phash(job):
+    compute_phash_for(job.media_item_id)
+
+def compute_phash_for(item_id):
+    item = MediaItem.objects.filter(pk=item_id, media_type='IMAGE').only('id', 'file').first()
+    if item is None or not item.file:
+        return None
+    with item.file.open('rb') as fh, Image.open(fh) as img:
+        value = dhash(img)
+    MediaItem.objects.filter(pk=item_id).update(phash=value)
+    return value
+
+@task('placeholder')
+def generate_placeholder(job):
+    store_placeholder(job.media_item)
+
+def build_placeholder(item):
+    """(placeholder, dominant_color) from an image's file or a video's thumbnail, or None."""
+    source = item.file if item.media_type == 'IMAGE' else item.thumbnail
+    if not source:
+        return None
+    with source.open('rb') as fh, Image.open(fh) as img:
+        img.seek(0)
+        return placeholder_for(img)
+
+def store_placeholder(item):
+    result = build_placeholder(item)
+    if result:
+        item.placeholder, item.dominant_color = result
+        MediaItem.objects.filter(pk=item.pk).update(placeholder=item.placeholder, dominant_color=item.dominant_color)
+    return result
+
+def build_placeholder_for(item_id):
+    # Entry point for the backfill process pool; the parent writes results in bulk
+    item = MediaItem.objects.filter(pk=item_id).only('id', 'media_type', 'file', 'thumbnail').first()
+    result = build_placeholder(item) if item else None
+    return (item_id, *result) if result else None
+
+@task('purge_blob')
+def purge_blob(job):
+    name = job.payload['name']
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(name=name, ref_count__lte=0).first()
+        if blob is None:
+            return  # referenced again since the purge was queued
+        blob_storage().purge(name)
+        blob.delete()
+
+@task('reap_deletion')
+def reap_deletion(job):
+    deletion = Deletion.objects.filter(pk=job.payload['deletion']).first()
+    if deletion is None or deletion.status == 'DONE':
+        return
+    # Every batch is its own transaction, so a retry after a crash picks up where this left off
+    reap(deletion, heartbeat=lambda: extend_lease(job, settings.MEDIA_JOB_VISIBILITY_TIMEOUT))
@@ -0,0 +1,33 @@
+from django import template
+
+register = template.Library()
+
+@register.filter
+def srcset(item, fmt='jpeg'):
+    """`url 320w, url 640w, ...` for an image MediaItem's renditions in the given format."""
+    # .all() so views can prefetch_related('renditions') and grids stay at one query
+    entries = [f'{r.file.url} {r.width}w' for r in item.renditions.all() if r.format == fmt]
+    if entries and fmt == 'jpeg' and item.width:
+        entries.append(f'{item.file.url} {item.width}w')
+    return ', '.join(entries)
+
+@register.filter
+def placeholder_style(item):
+    """Inline background for an <img>: the blurred placeholder over the dominant colour."""
+    rules = []
+    if item.dominant_color:
+        rules.append(f'background-color: {item.dominant_color};')
+    if item.placeholder:
+        rules.append(f"background-image: url('{item.placeholder}'); background-size: cover; background-position: center;")
+    return ' '.join(rules)
+
+@register.inclusion_tag('media/responsive_image.html')
+def responsive_image(item, css_class='', sizes='100vw', style=''):
+    return {
+        'item': item,
+        'webp_srcset': srcset(item, 'webp'),
+        'jpeg_srcset': srcset(item, 'jpeg'),
+        'sizes': sizes,
+        'css_class': css_class,
+        'style': f'{placeholder_style(item)} {style}'.strip(),
+    }
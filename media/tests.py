@@ -1,3 +1,349 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .counters import reconcile
+from .jobs import TASKS, RetryLater, claim, enqueue, run_job
+from .models import Blob, Folder, FolderClosure, MediaItem, ProcessingJob, Rendition, UploadSession
+from .reaper import reap, schedule
+from .transfer import copy, move
+
+def run_due_jobs():
+    """Claim and run due jobs until none are left, as process_media does; returns {kind: [outcomes]}."""
+    outcomes = {}
+    while claimed := claim(100):
+        for pk in claimed:
+            kind = ProcessingJob.objects.values_list('kind', flat=True).get(pk=pk)
+            outcomes.setdefault(kind, []).append(run_job(pk))
+    return outcomes
+
+class MediaRootMixin:
+    """Runs each test against an empty MEDIA_ROOT."""
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=root))
+
+class CopyTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='owner', email='owner@example.com', password='x')
+
+    def folder(self, name, parent=None):
+        return Folder.objects.create(name=name, owner=self.user, parent=parent)
+
+    def tree(self, folder):
+        """{name: subtree} below `folder`."""
+        return {child.name: self.tree(child) for child in Folder.objects.filter(parent=folder)}
+
+    def test_folder_selected_with_its_subfolder_is_copied_once(self):
+        p = self.folder('P')
+        q = self.folder('Q', p)
+        self.folder('R', q)
+        target = self.folder('T')
+        for selection in ([p.pk, q.pk], [q.pk, p.pk]):
+            with self.subTest(selection=selection):
+                _, copied_folders = copy(self.user, [], selection, target)
+                self.assertEqual(copied_folders, 3)
+                self.assertEqual(self.tree(target), {'P': {'Q': {'R': {}}}})
+                Folder.objects.filter(parent=target).delete()
+
+class UploadSessionTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(username='owner', email='owner@example.com', password='x')
+        self.client.force_login(self.user)
+
+    def start(self, total_size):
+        return self.client.post('/api/media/uploads/', {'filename': 'notes.txt', 'total_size': total_size})
+
+    def put(self, session_id, body, content_range):
+        return self.client.put(
+            f'/api/media/uploads/{session_id}/', body, content_type='application/octet-stream', HTTP_CONTENT_RANGE=content_range,
+        )
+
+    def test_empty_upload_is_rejected(self):
+        response = self.start(0)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('total_size', response.json())
+
+    def test_content_range_total_must_match_session(self):
+        session_id = self.start(10).json()['id']
+        self.assertEqual(self.put(session_id, b'hello', 'bytes 0-4/20').status_code, 400)
+        self.assertEqual(self.put(session_id, b'hello', 'bytes 0-4/10').status_code, 200)
+        self.assertEqual(self.put(session_id, b'world', 'bytes 5-9/*').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/media/uploads/{session_id}/finalize/').status_code, 201)
+
+    def test_finalize_without_a_file_is_a_conflict(self):
+        session = UploadSession.objects.create(uploader=self.user, filename='notes.txt', total_size=5, offset=5)
+        response = self.client.post(f'/api/media/uploads/{session.pk}/finalize/')
+        self.assertEqual(response.status_code, 409)
+
+@override_settings(BLOB_PURGE_GRACE_SECONDS=0)
+class BlobRefcountTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(username='owner', email='owner@example.com', password='x')
+
+    def upload(self, content=b'same bytes', name='notes.txt'):
+        return MediaItem.objects.create(uploader=self.user, file=SimpleUploadedFile(name, content))
+
+    def refs(self, name):
+        return Blob.objects.values_list('ref_count', flat=True).get(name=name)
+
+    def purges(self):
+        return ProcessingJob.objects.filter(kind='purge_blob').count()
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(name='a.txt')
+        # The second copy arrives as a resumable upload, which adopts the finished file
+        self.client.force_login(self.user)
+        session = self.client.post('/api/media/uploads/', {'filename': 'b.txt', 'total_size': 10}).json()['id']
+        self.client.put(f'/api/media/uploads/{session}/', b'same bytes', content_type='application/octet-stream')
+        second = MediaItem.objects.get(pk=self.client.post(f'/api/media/uploads/{session}/finalize/').json()['id'])
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(self.refs(first.file.name), 2)
+        self.assertEqual(len(default_storage.listdir(os.path.dirname(first.file.name))[1]), 1)
+
+    def test_copy_outlives_the_original(self):
+        original = self.upload()
+        copy(self.user, [original.pk], [], None)
+        self.assertEqual(self.refs(original.file.name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            original.delete()
+        self.assertEqual(self.refs(original.file.name), 1)
+        self.assertEqual(self.purges(), 0)
+        self.assertTrue(default_storage.exists(original.file.name))
+
+    def test_rendition_blob_is_shared_by_copies(self):
+        original = self.upload(b'image bytes', 'photo.jpg')
+        rendition = Rendition.objects.create(
+            media_item=original, width=320, height=240, format='webp', file=SimpleUploadedFile('320.webp', b'small image'),
+        )
+        # Another item whose rendition happens to have the same bytes
+        other = self.upload(b'other image', 'other.jpg')
+        Rendition.objects.create(media_item=other, width=320, height=240, format='webp', file=SimpleUploadedFile('320.webp', b'small image'))
+        copy(self.user, [original.pk], [], None)
+        self.assertEqual(self.refs(rendition.file.name), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            original.delete()
+            other.delete()
+        self.assertEqual(self.refs(rendition.file.name), 1)
+        self.assertEqual(self.refs(original.file.name), 1)
+        self.assertEqual(self.purges(), 1)
+        run_due_jobs()
+        self.assertTrue(default_storage.exists(rendition.file.name))
+        self.assertFalse(Blob.objects.filter(name=other.file.name).exists())
+
+    def test_reaper_releases_blobs_and_purges_unreferenced_ones(self):
+        kept = self.upload(name='kept.txt')
+        doomed = [self.upload(name='doomed.txt'), self.upload(b'only here')]
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule(self.user, items=MediaItem.objects.filter(pk__in=[item.pk for item in doomed]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_due_jobs()['reap_deletion'], ['DONE'])
+        self.assertEqual(self.refs(kept.file.name), 1)
+        self.assertEqual(self.refs(doomed[1].file.name), 0)
+
+        self.assertEqual(run_due_jobs(), {'purge_blob': ['DONE']})
+        self.assertTrue(default_storage.exists(kept.file.name))
+        self.assertFalse(default_storage.exists(doomed[1].file.name))
+        self.assertFalse(Blob.objects.filter(name=doomed[1].file.name).exists())
+
+    def test_purge_skips_a_blob_reused_before_it_ran(self):
+        name = self.upload().file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            MediaItem.objects.get(file=name).delete()
+        self.upload()
+        run_due_jobs()
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(default_storage.exists(name))
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.outcome = None
+        self.enterContext(mock.patch.dict(TASKS, {'probe': self.probe}))
+
+    def probe(self, job):
+        self.calls.append(job.pk)
+        if self.outcome is not None:
+            raise self.outcome
+
+    def job(self, pk):
+        return ProcessingJob.objects.get(pk=pk)
+
+    def expire(self, pk):
+        ProcessingJob.objects.filter(pk=pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+
+    def make_due(self, pk):
+        ProcessingJob.objects.filter(pk=pk).update(run_after=timezone.now())
+
+    def test_expired_lease_is_claimed_again(self):
+        job = enqueue('probe')
+        self.assertEqual(claim(10), [job.pk])
+        # Leased: no other worker gets it
+        self.assertEqual(claim(10), [])
+
+        self.expire(job.pk)
+        self.assertEqual(claim(10), [job.pk])
+        self.assertEqual(self.job(job.pk).attempts, 2)
+        self.assertEqual(run_job(job.pk), 'DONE')
+        self.assertEqual(self.job(job.pk).status, 'DONE')
+
+    @override_settings(MEDIA_JOB_MAX_ATTEMPTS=2)
+    def test_lease_expiring_on_the_last_attempt_fails_the_job(self):
+        job = enqueue('probe')
+        claim(10)
+        self.expire(job.pk)
+        claim(10)
+        self.expire(job.pk)
+        with self.assertLogs('media.jobs', 'ERROR'):
+            self.assertEqual(claim(10), [])
+        self.assertEqual(self.job(job.pk).status, 'FAILED')
+        self.assertEqual(self.calls, [])
+
+    @override_settings(MEDIA_JOB_MAX_ATTEMPTS=3, MEDIA_JOB_RETRY_BACKOFF=30, MEDIA_JOB_MAX_BACKOFF=45)
+    def test_failures_back_off_until_max_attempts(self):
+        self.outcome = ValueError('broken file')
+        job = enqueue('probe')
+        backoffs = []
+        for expected in ['PENDING', 'PENDING', 'FAILED']:
+            self.make_due(job.pk)
+            self.assertEqual(claim(10), [job.pk])
+            started = timezone.now()
+            with self.assertLogs('media.jobs', 'WARNING'):
+                self.assertEqual(run_job(job.pk), expected)
+            backoffs.append((self.job(job.pk).run_after - started).total_seconds())
+
+        job = self.job(job.pk)
+        self.assertEqual((job.status, job.attempts, len(self.calls)), ('FAILED', 3, 3))
+        self.assertIn('broken file', job.last_error)
+        # 30 s, then doubled but capped at MEDIA_JOB_MAX_BACKOFF
+        self.assertAlmostEqual(backoffs[0], 30, delta=1)
+        self.assertAlmostEqual(backoffs[1], 45, delta=1)
+        self.make_due(job.pk)
+        self.assertEqual(claim(10), [])
+
+    @override_settings(MEDIA_JOB_MAX_ATTEMPTS=1)
+    def test_retry_later_does_not_use_an_attempt(self):
+        self.outcome = RetryLater(delay=60)
+        job = enqueue('probe')
+        claim(10)
+        self.assertEqual(run_job(job.pk), 'DEFERRED')
+        job = self.job(job.pk)
+        self.assertEqual((job.status, job.attempts), ('PENDING', 0))
+        self.assertGreater(job.run_after, timezone.now() + datetime.timedelta(seconds=50))
+
+    def test_job_of_a_deleted_item_is_dropped(self):
+        user = get_user_model().objects.create_user(username='owner', email='owner@example.com', password='x')
+        item = MediaItem.objects.create(uploader=user, title='gone', file='gone.txt', media_type='DOCUMENT')
+        job = enqueue('probe', media_item=item)
+        self.assertIn(job.pk, claim(10))
+        # Deleted (e.g. reaped) while the job was leased: its jobs go with it
+        item.delete()
+        self.assertEqual(run_job(job.pk), None)
+        self.assertEqual(self.calls, [])
+        self.assertFalse(ProcessingJob.objects.filter(kind='probe').exists())
+
+class FolderTreeTests(TestCase):
+    """The closure table and counters against a recount after every kind of tree change."""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='owner', email='owner@example.com', password='x')
+        self.a = self.folder('a')
+        self.b = self.folder('b', self.a)
+        self.c = self.folder('c', self.b)
+        self.d = self.folder('d')
+
+    def folder(self, name, parent=None):
+        return Folder.objects.create(name=name, owner=self.user, parent=parent)
+
+    def assertClosureConsistent(self):
+        parents = dict(Folder.all_objects.values_list('pk', 'parent_id'))
+        expected = set()
+        for pk in parents:
+            ancestor, depth = pk, 0
+            while ancestor is not None:
+                expected.add((ancestor, pk, depth))
+                ancestor, depth = parents[ancestor], depth + 1
+        self.assertEqual(set(FolderClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), expected)
+
+    def test_closure_follows_save_move_copy_and_delete(self):
+        self.assertClosureConsistent()
+        self.c.parent = self.d
+        self.c.save()
+        self.assertClosureConsistent()
+
+        self.folder('e', self.c)
+        move(self.user, [], [self.b.pk, self.c.pk], self.d)
+        self.assertClosureConsistent()
+
+        copy(self.user, [], [self.d.pk], self.a)
+        self.assertClosureConsistent()
+        self.assertEqual(self.a.get_descendants().count(), 4)
+
+        self.b.refresh_from_db()
+        self.b.delete()
+        self.d.delete()
+        self.assertClosureConsistent()
+
+    def item(self, name, folder, size):
+        return MediaItem.objects.create(uploader=self.user, folder=folder, file=name, file_size=size)
+
+    def assertCountersConsistent(self):
+        # reconcile() recounts every folder and reports how many had drifted
+        self.assertEqual(reconcile(), 0)
+
+    def test_counters_follow_item_and_folder_changes(self):
+        photo = self.item('photo.jpg', self.c, 100)
+        notes = self.item('notes.txt', self.b, 20)
+        self.item('old.jpg', self.c, 7)
+        self.assertCountersConsistent()
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.item_count, self.a.total_size), (0, 127))
+
+        photo.folder = self.d
+        photo.save()
+        notes.file_size = 25
+        notes.save()
+        self.assertCountersConsistent()
+
+        self.c.parent = self.d
+        self.c.save()
+        self.assertCountersConsistent()
+
+        move(self.user, [notes.pk], [self.b.pk], self.d)
+        self.assertCountersConsistent()
+        copy(self.user, [photo.pk], [self.d.pk], self.a)
+        self.assertCountersConsistent()
+
+        # In-memory instances are stale after the bulk move; deletes must not release stale counters
+        notes.delete()
+        self.c.delete()
+        self.assertCountersConsistent()
+
+        deletion = schedule(self.user, folders=Folder.objects.filter(pk=self.d.pk))
+        self.assertCountersConsistent()
+        reap(deletion)
+        self.assertCountersConsistent()
+        # What is left: the copy of d (photo, notes and c's old.jpg) under a
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.total_size, 100 + 25 + 7)
+
+    def test_folder_cannot_move_into_its_own_subtree(self):
+        self.a.parent = self.c
+        with self.assertRaises(ValueError):
+            self.a.save()
+        self.assertClosureConsistent()
@@ -0,0 +1,153 @@
+"""
+Bulk move and copy of media items and folders.
+
+A move is one UPDATE per model (`... SET folder_id/parent_id = target WHERE id IN
+(...)`); the closure table and the denormalised counters are then adjusted per moved
+folder / source folder rather than per item. Copies never duplicate bytes: the new
+rows point at the same content-addressed blobs (and renditions), whose reference
+counts are bumped in bulk.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .counters import items_added, no_cover, refresh_covers, shift
+from .models import Folder, FolderClosure, MediaItem, ProcessingJob, Rendition
+from .quota import allowance, charge, charge_items
+from .search import index_folders, index_items
+from .storage import incref
+
+# Copied as-is; everything else (ids, counters, timestamps, job state) starts fresh
+ITEM_COPY_FIELDS = [
+    'uploader_id', 'category_id', 'title', 'description', 'file', 'media_type', 'duration', 'width', 'height',
+    'is_private', 'is_hidden', 'phash', 'placeholder', 'dominant_color', 'file_size', 'uploader_is_private',
+]
+# Generated files that live in per-item directories and must be rebuilt for a copy
+VIDEO_COPY_JOBS = ['thumbnail', 'hls', 'previews']
+
+class TransferError(Exception):
+    status = 400
+
+class NameConflict(TransferError):
+    status = 409
+
+    def __init__(self, names):
+        super().__init__(f"The target folder already contains: {', '.join(sorted(names))}.")
+        self.names = sorted(names)
+
+def check_names(user, folders, target):
+    """Raise NameConflict if `folders` cannot all live in `target` (unique_together on name, parent, owner)."""
+    names = Counter(folder.name for folder in folders)
+    clashes = {name for name, count in names.items() if count > 1}
+    clashes |= set(
+        Folder.all_objects.filter(owner=user, parent=target, name__in=names)
+        .exclude(pk__in=[folder.pk for folder in folders]).values_list('name', flat=True)
+    )
+    if clashes:
+        raise NameConflict(clashes)
+
+def move(user, media_ids, folder_ids, target):
+    """Move the user's items and folders into `target` (None for the top level). Returns (items, folders) moved."""
+    with transaction.atomic():
+        folders = list(Folder.objects.select_for_update().filter(pk__in=folder_ids, owner=user))
+        if target is not None and FolderClosure.objects.filter(ancestor__in=folders, descendant=target).exists():
+            raise TransferError("A folder cannot be moved into itself or one of its subfolders.")
+        folders = [folder for folder in folders if folder.parent_id != (target.pk if target else None)]
+        check_names(user, folders, target)
+
+        items = MediaItem.objects.filter(pk__in=media_ids, uploader=user).exclude(folder=target)
+        sources = list(items.order_by().values('folder_id').annotate(n=Count('pk'), size=Sum('file_size')))
+        moved_files = list(items.filter(media_type='IMAGE').values_list('file', flat=True))
+        moved_items = items.update(folder=target)
+        for source in sources:
+            shift(source['folder_id'], -source['n'], -source['size'])
+            shift(target and target.pk, source['n'], source['size'])
+        if moved_files:
+            refresh_covers(Folder.objects.filter(pk__in=[s['folder_id'] for s in sources], cover_cache__in=moved_files))
+            if target is not None:
+                refresh_covers(Folder.objects.filter(no_cover(), pk=target.pk))
+
+        if moved_items:
+            # Item entries carry their folder's name
+            index_items(MediaItem.objects.filter(pk__in=media_ids, uploader=user))
+
+        Folder.objects.filter(pk__in=[folder.pk for folder in folders]).update(parent=target)
+        for folder in folders:
+            # Sequential, so a moved folder inside another moved folder is settled against the current tree
+            size = Folder.all_objects.filter(pk=folder.pk).values_list('total_size', flat=True).get()
+            shift(folder.parent_id, size=-size)
+            folder.parent = target
+            FolderClosure.relink(folder)
+            shift(folder.parent_id, size=size)
+    return moved_items, len(folders)
+
+def copy(user, media_ids, folder_ids, target):
+    """Copy the user's items and folders (recursively) into `target`. Returns (items, folders) created."""
+    with transaction.atomic():
+        roots = Folder.objects.filter(pk__in=folder_ids, owner=user)
+        # A selected folder inside another selected folder is copied with it, not again at the top
+        nested = FolderClosure.objects.filter(ancestor__in=roots, descendant__in=roots, depth__gt=0).values('descendant_id')
+        roots = list(roots.exclude(pk__in=nested))
+        check_names(user, [Folder(name=root.name) for root in roots], target)
+
+        # Folders level by level, so each copy's parent already has its id and closure rows
+        links = FolderClosure.objects.filter(ancestor__in=roots, descendant__deletion__isnull=True).values_list('descendant_id', 'depth')
+        depth_of = dict(links)
+        sources = sorted(Folder.objects.filter(pk__in=depth_of), key=lambda folder: depth_of[folder.pk])
+        copies = {}
+        for depth in sorted(set(depth_of.values())):
+            level = [folder for folder in sources if depth_of[folder.pk] == depth]
+            new = [
+                Folder(
+                    name=folder.name, owner=user, is_private=folder.is_private, is_hidden=folder.is_hidden,
+                    parent=target if depth == 0 else copies[folder.parent_id],
+                    cover_image=folder.cover_image.name or None, cover_cache=folder.cover_cache,
+                )
+                for folder in level
+            ]
+            Folder.objects.bulk_create(new)
+            FolderClosure.link(new)
+            copies.update({folder.pk: clone for folder, clone in zip(level, new)})
+        for name, count in Counter(folder.cover_image.name for folder in sources if folder.cover_image).items():
+            incref(name, count)
+        index_folders(Folder.objects.filter(pk__in=[clone.pk for clone in copies.values()]))
+
+        originals = list(MediaItem.objects.filter(Q(pk__in=media_ids, uploader=user) | Q(folder_id__in=copies)))
+        if len(originals) > settings.BULK_COPY_MAX_ITEMS:
+            raise TransferError(f"Copies are limited to {settings.BULK_COPY_MAX_ITEMS} items at a time.")
+        left = allowance(user)
+        if left is not None and sum(item.file_size for item in originals) > left:
+            raise TransferError("The copies would not fit in your storage quota.")
+
+        new_items = []
+        for item in originals:
+            duplicate = MediaItem(**{field: getattr(item, field) for field in ITEM_COPY_FIELDS})
+            duplicate.folder = copies[item.folder_id] if item.folder_id in copies else target
+            # Image renditions are shared below; video outputs live in per-item directories and are rebuilt
+            duplicate.is_processed = item.media_type != 'VIDEO'
+            duplicate.derived_size = item.derived_size if item.media_type == 'IMAGE' else 0
+            new_items.append(duplicate)
+        MediaItem.objects.bulk_create(new_items)
+        for name, count in Counter(item.file.name for item in new_items).items():
+            incref(name, count)
+        items_added(new_items)
+        charge_items(new_items)
+        index_items(MediaItem.objects.filter(pk__in=[item.pk for item in new_items]))
+
+        source_of = {item.pk: clone.pk for item, clone in zip(originals, new_items)}
+        renditions = [
+            Rendition(media_item_id=source_of[r.media_item_id], width=r.width, height=r.height, format=r.format, file=r.file.name)
+            for r in Rendition.objects.filter(media_item_id__in=source_of)
+        ]
+        Rendition.objects.bulk_create(renditions)
+        for name, count in Counter(r.file.name for r in renditions).items():
+            incref(name, count)
+        charge(user.pk, sum(item.derived_size for item in new_items))
+
+        ProcessingJob.objects.bulk_create([
+            ProcessingJob(kind=kind, media_item=item, max_attempts=settings.MEDIA_JOB_MAX_ATTEMPTS)
+            for item in new_items if item.media_type == 'VIDEO' for kind in VIDEO_COPY_JOBS
+        ])
+    return len(new_items), len(copies)
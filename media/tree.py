@@ -0,0 +1,33 @@
+"""
+Rebuilding the folder closure table from `Folder.parent`.
+
+Takes the model classes as arguments so the data migration can run it against its
+historical models. Works in set-based SQL: self-links first, then one
+INSERT ... SELECT per tree level, so it scales to large libraries without loading
+the tree into Python.
+"""
+from django.db import connections
+
+MAX_DEPTH = 1000  # guards against parent cycles in corrupt data
+
+def rebuild_closure(folder_model, closure_model, using='default'):
+    folder_table = folder_model._meta.db_table
+    closure_table = closure_model._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {closure_table}')
+        cursor.execute(
+            f'INSERT INTO {closure_table} (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM {folder_table}'
+        )
+        rows = cursor.rowcount
+        # Links of depth d + 1 come from links of depth d and one parent step down
+        for depth in range(MAX_DEPTH):
+            cursor.execute(
+                f'INSERT INTO {closure_table} (ancestor_id, descendant_id, depth) '
+                f'SELECT c.ancestor_id, f.id, c.depth + 1 FROM {folder_table} f '
+                f'JOIN {closure_table} c ON c.descendant_id = f.parent_id WHERE c.depth = %s',
+                [depth],
+            )
+            if cursor.rowcount <= 0:
+                break
+            rows += cursor.rowcount
+    return rows
@@ -0,0 +1,100 @@
+"""
+Time-decayed trending scores.
+
+Every like, favorite, view and download adds TRENDING_WEIGHTS[event] to its item's score,
+and scores halve every TRENDING_HALF_LIFE_HOURS. Rather than decaying every row as time
+passes, events are weighted up by when they happened (forward decay):
+
+    score = log2(sum(weight * 2 ** ((event time - EPOCH) / half-life)))
+
+Ranking by that number is ranking by the current decayed score, so the home rail is a
+top-N read of the `-score` index, and an event is one UPDATE (a log-add-exp in SQL).
+Storing the log keeps the numbers small however long the clock runs. `compact_trending`
+prunes items that have gone cold and can rebuild the table from the event logs.
+"""
+import datetime
+import math
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone
+
+from .models import TrendingScore
+
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+# (app label, model, event) whose rows, with media_item and created_at, are trending events
+SOURCES = [
+    ('social', 'MediaView', 'view'),
+    ('stats', 'DownloadLog', 'download'),
+    ('social', 'Like', 'like'),
+    ('social', 'Favorite', 'favorite'),
+]
+
+def clock(when=None):
+    """Half-lives elapsed between EPOCH and `when` (default now)."""
+    return ((when or timezone.now()) - EPOCH).total_seconds() / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+def event_score(event, when=None):
+    return math.log2(settings.TRENDING_WEIGHTS[event]) + clock(when)
+
+def decayed(score, when=None):
+    """The score as a plain decayed sum at `when`, e.g. for display."""
+    return 2 ** (score - clock(when))
+
+def log_add(a, b):
+    hi, lo = max(a, b), min(a, b)
+    return hi + math.log2(1 + 2 ** (lo - hi))
+
+def _log_add_sql(score):
+    value = Value(score, output_field=FloatField())
+    return Greatest(F('score'), value) + Log(2, 1 + Power(2, -Abs(F('score') - value)))
+
+def record(event, item_ids, when=None):
+    """Add one `event` at `when` to each item in `item_ids`: one UPDATE plus an INSERT for new items."""
+    ids = set(item_ids)
+    if not ids:
+        return
+    score = event_score(event, when)
+    with transaction.atomic():
+        existing = set(TrendingScore.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if existing:
+            TrendingScore.objects.filter(pk__in=existing).update(score=_log_add_sql(score))
+        # A concurrent first event for the same item may win the insert; compaction rebuilds repair that
+        TrendingScore.objects.bulk_create([TrendingScore(media_item_id=pk, score=score) for pk in ids - existing], ignore_conflicts=True)
+
+def cutoff(now=None):
+    """Stored scores below this have decayed under TRENDING_MIN_SCORE."""
+    return math.log2(settings.TRENDING_MIN_SCORE) + clock(now)
+
+def compact(now=None):
+    """Drop items that have gone cold; returns how many."""
+    return TrendingScore.objects.filter(score__lt=cutoff(now)).delete()[0]
+
+def rebuild(now=None, apps=global_apps):
+    """
+    Recompute every score from the event logs (undoing unlikes and repairing lost updates);
+    returns the row count. Takes an app registry so migrations can run it.
+    """
+    now = now or timezone.now()
+    score_model = apps.get_model('media', 'TrendingScore')
+    # Older events cannot lift an item above the cutoff on their own
+    horizon = max(settings.TRENDING_WEIGHTS.values()) / settings.TRENDING_MIN_SCORE
+    since = now - datetime.timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS * math.log2(horizon))
+
+    scores = {}
+    for app_label, model_name, event in SOURCES:
+        model = apps.get_model(app_label, model_name)
+        weight = math.log2(settings.TRENDING_WEIGHTS[event])
+        for item_id, created_at in model.objects.filter(created_at__gte=since).values_list('media_item_id', 'created_at').iterator():
+            score = weight + clock(created_at)
+            scores[item_id] = log_add(scores[item_id], score) if item_id in scores else score
+
+    floor = cutoff(now)
+    rows = [score_model(media_item_id=pk, score=score) for pk, score in scores.items() if score >= floor]
+    with transaction.atomic():
+        score_model.objects.all().delete()
+        score_model.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -3,12 +3,14 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     folder_detail, set_folder_cover, delete_media, delete_folder, 
     edit_folder, edit_media, media_detail, toggle_media_visibility, toggle_folder_visibility,
-    bulk_delete, all_media
+    bulk_delete, bulk_move, bulk_copy, all_media
 )
-from .api_views import MediaItemViewSet
+from .api_views import DeletionViewSet, MediaItemViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'items', MediaItemViewSet, basename='mediaitem')
+router.register(r'uploads', UploadSessionViewSet, basename='uploadsession')
+router.register(r'deletions', DeletionViewSet, basename='deletion')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -17,6 +19,8 @@ urlpatterns = [
     path('folder/edit/<int:pk>/', edit_folder, name='folder-edit'),
     path('folder/delete/<int:pk>/', delete_folder, name='folder-delete'),
     path('bulk-delete/', bulk_delete, name='bulk-delete'),
+    path('bulk-move/', bulk_move, name='bulk-move'),
+    path('bulk-copy/', bulk_copy, name='bulk-copy'),
     
     path('edit/<int:pk>/', edit_media, name='media-edit'),
     path('view/<int:pk>/', media_detail, name='media-detail-page'),
@@ -1,14 +1,21 @@
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Count, F
 from .models import MediaItem, Folder, Category
 from .forms import MediaEditForm, FolderEditForm
 from social.forms import ReviewForm
 from social.models import Review, Like, MediaView, Favorite
 import json
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+import posixpath
+from django.http import Http404, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_POST, require_safe
+from .delivery import download_denied, find_grant, send_file
+from .pagination import SORTS, keyset_page
+from .reaper import schedule
+from .related import related_to
+from . import search, trending
+from .transfer import NameConflict, TransferError, copy, move
 
 def folder_detail(request, pk):
     folder = get_object_or_404(Folder, pk=pk)
@@ -32,7 +39,7 @@ def folder_detail(request, pk):
         return redirect('home')
 
     subfolders = Folder.objects.filter(parent=folder)
-    media_items = MediaItem.objects.filter(folder=folder)
+    media_items = MediaItem.objects.filter(folder=folder).prefetch_related('renditions')
 
     if not is_owner and not is_admin:
         subfolders = subfolders.filter(is_private=False, is_hidden=False)
@@ -71,7 +78,7 @@ def delete_media(request, pk):
 def delete_folder(request, pk):
     folder = get_object_or_404(Folder, pk=pk, owner=request.user)
     parent = folder.parent
-    folder.delete()
+    schedule(request.user, folders=Folder.objects.filter(pk=folder.pk))
     messages.success(request, "Deleted.")
     return redirect('folder_detail', pk=parent.id) if parent else redirect('profile')
 
@@ -88,7 +95,7 @@ def edit_folder(request, pk):
 
 # Keeping media_detail for completeness
 def media_detail(request, pk):
-    media = get_object_or_404(MediaItem, pk=pk)
+    media = get_object_or_404(MediaItem.objects.prefetch_related('renditions'), pk=pk)
     is_owner = (request.user.is_authenticated and media.uploader == request.user)
     is_admin = (request.user.is_authenticated and request.user.is_superuser)
     
@@ -121,27 +128,27 @@ def media_detail(request, pk):
     view_key = f'viewed_media_{media.id}'
     if not request.session.get(view_key):
         if request.user.is_authenticated:
-            viewed, created = MediaView.objects.get_or_create(user=request.user, media_item=media)
-            if created:
-                media.views_count += 1
-                media.save()
+            _, counted = MediaView.objects.get_or_create(user=request.user, media_item=media)
         else:
+            counted = True
+            # Signed-in views are recorded through their MediaView
+            trending.record('view', [media.pk])
+        if counted:
+            # F() so concurrent views and background writes are not overwritten
+            MediaItem.objects.filter(pk=media.pk).update(views_count=F('views_count') + 1)
             media.views_count += 1
-            media.save()
         request.session[view_key] = True
 
-    # Suggestions: Similar items (same category or same type)
-    related_items = MediaItem.objects.filter(
-        Q(category=media.category) | Q(media_type=media.media_type)
-    ).exclude(id=media.id).filter(is_private=False, is_hidden=False)[:10]
+    # Suggestions: co-engaged items (see media.related), filtered to what the viewer may see
+    related_items = related_to(media, request.user)
 
     # Folder Items
     folder_items = []
     if media.folder:
-        folder_items = MediaItem.objects.filter(folder=media.folder).exclude(id=media.id).order_by('created_at')[:10]
+        folder_items = MediaItem.objects.filter(folder=media.folder).exclude(id=media.id).order_by('created_at').prefetch_related('renditions')[:10]
 
     # Recent Uploads for sidebar
-    recent_uploads = MediaItem.objects.filter(is_private=False, is_hidden=False).order_by('-created_at')[:5]
+    recent_uploads = MediaItem.objects.filter(is_private=False, is_hidden=False).order_by('-created_at').prefetch_related('renditions')[:5]
 
     # Next/Prev logic
     next_item = None
@@ -185,64 +192,54 @@ def all_media(request):
     media_type = request.GET.get('type', 'ALL')
     sort_by = request.GET.get('sort', 'date_desc')
     
-    # Base Queryset
-    items_qs = MediaItem.objects.filter(is_hidden=False)
-    
-    # Security/Privacy Filter
-    if not (request.user.is_authenticated and request.user.is_superuser):
-        if request.user.is_authenticated:
-            from social.models import Follow
-            followed_users = Follow.objects.filter(follower=request.user, is_accepted=True).values_list('followed_id', flat=True)
-            items_qs = items_qs.filter(
-                (Q(is_private=False) & Q(uploader__is_private=False)) | 
-                Q(uploader=request.user) |
-                Q(uploader_id__in=followed_users)
-            )
-        else:
-            items_qs = items_qs.filter(is_private=False, uploader__is_private=False)
+    items_qs = MediaItem.objects.visible_to(request.user)
 
     if media_type != 'ALL':
         items_qs = items_qs.filter(media_type=media_type)
 
-    if sort_by == 'views': items_qs = items_qs.order_by('-views_count')
-    elif sort_by == 'name_asc': items_qs = items_qs.order_by('title')
-    else: items_qs = items_qs.order_by('-created_at')
+    if sort_by not in SORTS:
+        sort_by = 'date_desc'
+
+    # Infinite scroll handling (Initial load + AJAX loads): keyset cursors, see media.pagination
+    items, next_cursor = keyset_page(items_qs.prefetch_related('renditions'), sort_by, request.GET.get('cursor'))
 
-    # Infinite scroll handling (Initial load + AJAX loads)
-    page = int(request.GET.get('page', 1))
-    per_page = 24
-    start = (page - 1) * per_page
-    end = start + per_page
-    
-    items = items_qs[start:end]
-    
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return render(request, 'media/media_grid_items.html', {'items': items})
+        response = render(request, 'media/media_grid_items.html', {'items': items})
+        response['X-Next-Cursor'] = next_cursor or ''
+        return response
 
     return render(request, 'media/all_media.html', {
         'items': items,
         'selected_type': media_type,
         'selected_sort': sort_by,
-        'next_page': page + 1 if len(items) == per_page else None
+        'next_cursor': next_cursor,
     })
 
+VISIBILITY_ACTIONS = {
+    'hide': ('is_hidden', True),
+    'unhide': ('is_hidden', False),
+    'private': ('is_private', True),
+    'public': ('is_private', False),
+}
+
 @login_required
 def toggle_media_visibility(request, pk, action):
-    m = get_object_or_404(MediaItem, pk=pk, uploader=request.user)
-    if action == 'hide': m.is_hidden = True
-    elif action == 'unhide': m.is_hidden = False
-    elif action == 'private': m.is_private = True
-    elif action == 'public': m.is_private = False
-    m.save(); return redirect(request.META.get('HTTP_REFERER', 'home'))
+    # One single-column UPDATE instead of loading and re-saving the whole row
+    if action in VISIBILITY_ACTIONS:
+        field, value = VISIBILITY_ACTIONS[action]
+        if not MediaItem.objects.filter(pk=pk, uploader=request.user).update(**{field: value}):
+            raise Http404
+        search.index_items(MediaItem.objects.filter(pk=pk))
+    return redirect(request.META.get('HTTP_REFERER', 'home'))
 
 @login_required
 def toggle_folder_visibility(request, pk, action):
-    f = get_object_or_404(Folder, pk=pk, owner=request.user)
-    if action == 'hide': f.is_hidden = True
-    elif action == 'unhide': f.is_hidden = False
-    elif action == 'private': f.is_private = True
-    elif action == 'public': f.is_private = False
-    f.save(); return redirect(request.META.get('HTTP_REFERER', 'home'))
+    if action in VISIBILITY_ACTIONS:
+        field, value = VISIBILITY_ACTIONS[action]
+        if not Folder.objects.filter(pk=pk, owner=request.user).update(**{field: value}):
+            raise Http404
+        search.index_folders(Folder.objects.filter(pk=pk))
+    return redirect(request.META.get('HTTP_REFERER', 'home'))
 
 @login_required
 @require_POST
@@ -255,10 +252,69 @@ def bulk_delete(request):
         folder_ids = [item['id'] for item in items if item['type'] == 'folder']
         
         # Security: Only delete items owned by the user
-        deleted_media_count = MediaItem.objects.filter(id__in=media_ids, uploader=request.user).delete()[0]
-        deleted_folder_count = Folder.objects.filter(id__in=folder_ids, owner=request.user).delete()[0]
-        
-        messages.success(request, f"Successfully deleted {deleted_media_count} files and {deleted_folder_count} folders.")
-        return JsonResponse({'status': 'ok'})
+        deletion = schedule(
+            request.user,
+            items=MediaItem.objects.filter(id__in=media_ids, uploader=request.user),
+            folders=Folder.objects.filter(id__in=folder_ids, owner=request.user),
+        )
+
+        messages.success(request, f"Successfully deleted {deletion.total_items} files and {deletion.total_folders} folders.")
+        return JsonResponse({'status': 'ok', 'deletion': deletion.id})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
+
+@login_required
+@require_POST
+def bulk_move(request):
+    return _bulk_transfer(request, move, "Moved")
+
+@login_required
+@require_POST
+def bulk_copy(request):
+    return _bulk_transfer(request, copy, "Copied")
+
+def _bulk_transfer(request, operation, verb):
+    """JSON body: {"items": [{"type": "media"|"folder", "id": ...}], "target": <folder id or null for the top level>}"""
+    try:
+        data = json.loads(request.body)
+        items = data.get('items', [])
+        media_ids = [item['id'] for item in items if item['type'] == 'media']
+        folder_ids = [item['id'] for item in items if item['type'] == 'folder']
+        target = data.get('target')
+    except (ValueError, TypeError, KeyError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if target is not None:
+        target = get_object_or_404(Folder, pk=target, owner=request.user)
+    try:
+        item_count, folder_count = operation(request.user, media_ids, folder_ids, target)
+    except NameConflict as e:
+        return JsonResponse({'error': str(e), 'conflicts': e.names}, status=e.status)
+    except TransferError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    messages.success(request, f"{verb} {item_count} files and {folder_count} folders.")
+    return JsonResponse({'status': 'ok', 'items': item_count, 'folders': folder_count})
+
+@require_safe
+def serve_media(request, name):
+    """Everything under MEDIA_URL. `?download=1` also enforces the uploader's download preference."""
+    name = posixpath.normpath(name).lstrip('/')
+    if name.startswith('..'):
+        raise Http404
+
+    grant = find_grant(request.user, name)
+    if grant is None:
+        # Same answer for private and missing files
+        raise Http404
+
+    filename = None
+    if request.GET.get('download') == '1':
+        if not isinstance(grant, MediaItem):
+            return HttpResponseForbidden()
+        error = download_denied(request.user, grant.uploader)
+        if error:
+            return HttpResponseForbidden(error)
+        filename = f'{grant.title or "download"}{posixpath.splitext(name)[1]}'
+
+    return send_file(request, name, filename=filename, public=grant is True)
@@ -9,12 +9,13 @@ django.setup()
 
 # Import routing after django.setup()
 import chat.routing
+import media.routing
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
-            chat.routing.websocket_urlpatterns
+            chat.routing.websocket_urlpatterns + media.routing.websocket_urlpatterns
         )
     ),
 })
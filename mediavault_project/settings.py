@@ -97,6 +97,115 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media_root'
 
+# --- UPLOADS ---
+# Resumable upload sessions untouched for this long are purged by `purge_upload_sessions`
+UPLOAD_SESSION_EXPIRY_HOURS = int(os.environ.get('UPLOAD_SESSION_EXPIRY_HOURS', 24))
+UPLOAD_CHUNK_READ_SIZE = 1024 * 1024
+# The batch endpoint takes many files per request; the client splits drops larger than this
+DATA_UPLOAD_MAX_NUMBER_FILES = 500
+# Bytes each uploader may store (originals plus thumbnails, renditions, HLS and previews);
+# User.storage_quota overrides it per user. 0 means unlimited.
+STORAGE_QUOTA_DEFAULT = int(os.environ.get('STORAGE_QUOTA_DEFAULT', 20 * 1024 ** 3))
+
+# --- MEDIA PROCESSING ---
+# Background jobs are run by `manage.py process_media`
+MEDIA_WORKER_PROCESSES = int(os.environ.get('MEDIA_WORKER_PROCESSES', os.cpu_count() or 2))
+MEDIA_JOB_MAX_ATTEMPTS = 5
+MEDIA_JOB_RETRY_BACKOFF = 30  # seconds, doubled on every failed attempt
+MEDIA_JOB_MAX_BACKOFF = 60 * 60
+MEDIA_JOB_VISIBILITY_TIMEOUT = 15 * 60  # a claimed job is handed out again if not finished by then
+# Bulk deletes are reaped in the background: rows per transaction, threads unlinking files
+DELETION_BATCH_SIZE = 200
+DELETION_UNLINK_THREADS = 8
+# Downscaled copies generated for every image; widths wider than the original are skipped
+IMAGE_RENDITION_WIDTHS = [320, 640, 1280]
+IMAGE_RENDITION_FORMATS = ['webp', 'jpeg']
+IMAGE_RENDITION_QUALITY = 80
+# Inline placeholders for grid cards (images and video thumbnails)
+PLACEHOLDER_WIDTH = 20
+PLACEHOLDER_QUALITY = 40
+# HLS ladder for videos: (height, video bitrate, audio bitrate). Rungs taller than the source are skipped.
+HLS_LADDER = [
+    (1080, '5000k', '192k'),
+    (720, '2800k', '128k'),
+    (480, '1400k', '128k'),
+    (360, '800k', '96k'),
+]
+HLS_SEGMENT_SECONDS = 6
+HLS_MAX_CONCURRENT = int(os.environ.get('HLS_MAX_CONCURRENT', 1))  # transcodes per host
+HLS_LOCK_DIR = os.environ.get('HLS_LOCK_DIR', '/tmp')
+HLS_THREADS = 2  # ffmpeg threads per transcode (CPU only)
+HLS_TIMEOUT = 4 * 60 * 60
+# Near-duplicate search: max differing bits (of 64) between perceptual hashes
+PHASH_DUPLICATE_DISTANCE = 6
+PHASH_MAX_DISTANCE = 10
+PHASH_MAX_GROUPS = 500  # per response
+PHASH_GROUPS_CACHE_SECONDS = 60 * 60  # keyed by the library's hashes, so new uploads invalidate it
+# Video previews: scrub sprites (one frame every SPRITE_INTERVAL s, at most SPRITE_MAX_FRAMES) and a hover clip
+SPRITE_INTERVAL = 5
+SPRITE_MAX_FRAMES = 400
+SPRITE_TILE_WIDTH = 160
+SPRITE_GRID = (10, 10)  # tiles per sheet: columns, rows
+PREVIEW_CLIP_SECONDS = 4
+PREVIEW_CLIP_WIDTH = 320
+PREVIEW_CLIP_FPS = 12
+PREVIEW_MAX_CONCURRENT = int(os.environ.get('PREVIEW_MAX_CONCURRENT', 1))
+# Unreferenced blobs are kept this long before deletion, in case an in-flight upload reuses them
+BLOB_PURGE_GRACE_SECONDS = 60 * 60
+
+# --- MEDIA DELIVERY ---
+# Who sends the bytes once `serve_media` has checked access:
+#   ''         Django itself (os.sendfile via the WSGI server's file_wrapper where available)
+#   'nginx'    X-Accel-Redirect to MEDIA_ACCEL_REDIRECT_LOCATION, an `internal` location aliased to MEDIA_ROOT
+#   'xsendfile' X-Sendfile with the absolute path (Apache mod_xsendfile, lighttpd)
+MEDIA_SENDFILE_BACKEND = os.environ.get('MEDIA_SENDFILE_BACKEND', '')
+MEDIA_ACCEL_REDIRECT_LOCATION = os.environ.get('MEDIA_ACCEL_REDIRECT_LOCATION', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = 5 * 60
+# Folder/selection ZIPs are streamed in reads of this size; selections of more files are refused (413)
+ARCHIVE_READ_SIZE = 1024 * 1024
+ARCHIVE_MAX_ITEMS = 5000
+# Items one bulk copy request may duplicate (rows only; the files are shared)
+BULK_COPY_MAX_ITEMS = 5000
+
+# --- DISCOVERY ---
+# Trending: each event adds its weight, halving every TRENDING_HALF_LIFE_HOURS (see media.trending)
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+TRENDING_WEIGHTS = {'view': 1.0, 'download': 2.0, 'like': 3.0, 'favorite': 4.0}
+# `compact_trending` drops items whose score has decayed below this (a single view ~10 half-lives ago)
+TRENDING_MIN_SCORE = 0.001
+# Search: best hits kept per result group (each media type, folders, users); see media.search
+SEARCH_RESULTS_PER_GROUP = 20
+# User typeahead (core.typeahead): prefixes matching more tokens than this are served from
+# precomputed top lists of TYPEAHEAD_TOP_K users
+TYPEAHEAD_SCAN_LIMIT = 2000
+TYPEAHEAD_TOP_K = 50
+# Each process applies changed users this often and rebuilds (popularity, deletions) this often
+TYPEAHEAD_REFRESH_SECONDS = 10
+TYPEAHEAD_REBUILD_SECONDS = 60 * 60
+# Following timelines (social.timeline): uploads are fanned out to followers' timelines, except
+# for accounts with more followers than this, which are read at query time
+TIMELINE_CELEBRITY_FOLLOWERS = 10000
+TIMELINE_CELEBRITY_CACHE_SECONDS = 5 * 60
+# Uploads copied into a timeline when its owner follows an account; entries written per INSERT
+TIMELINE_BACKFILL_ITEMS = 50
+TIMELINE_FANOUT_BATCH = 1000
+# Related items (media.related): co-engagement weights, ids kept per item, and users with more
+# interactions than RELATED_MAX_USER_ITEMS are skipped; RELATED_PAIR_CHUNK bounds memory per step
+RELATED_WEIGHTS = {'view': 1.0, 'like': 3.0, 'favorite': 4.0}
+RELATED_TOP_K = 30
+RELATED_MAX_USER_ITEMS = 500
+RELATED_PAIR_CHUNK = 1 << 22
+# Recommended rail (media.recommend): implicit ALS over the same interactions, with confidence
+# 1 + RECOMMEND_ALPHA * weight; picks are kept for users active in the last RECOMMEND_ACTIVE_DAYS
+RECOMMEND_FACTORS = 32
+RECOMMEND_REGULARIZATION = 0.1
+RECOMMEND_ALPHA = 10.0
+RECOMMEND_ITERATIONS = 10
+RECOMMEND_TOP_N = 50
+RECOMMEND_ACTIVE_DAYS = 30
+# How long a process serves a user's picks before re-reading them
+RECOMMEND_CACHE_SECONDS = 10 * 60
+
 # --- REST FRAMEWORK ---
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.urls import path, include
+import re
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from core.views import (
     home, signup_view, login_view, profile, request_upload_access, 
@@ -10,6 +10,7 @@ from core.views import (
     update_username, verify_password,
     admin_user_list, admin_media_list, search_users
 )
+from media.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -52,4 +53,7 @@ urlpatterns = [
     path('api/social/', include('social.urls')),
     path('api/stats/', include('stats.urls')),
     path('chat/', include('chat.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+    # Uploaded files, permission-checked
+    re_path(r'^%s(?P<name>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='serve-media'),
+]
@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from social import timeline
+
+class Command(BaseCommand):
+    help = "Refill every following timeline from the follow graph and each account's latest uploads"
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS(f"Wrote {timeline.rebuild()} timeline entries."))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.11 on 2026-10-18 05:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from social import timeline
+
+
+def fill_timelines(apps, schema_editor):
+    timeline.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0019_search_index'),
+        ('social', '0002_follow_is_accepted_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('media_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='media.mediaitem')),
+                ('uploader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-media_item'], name='timeline_read_idx'), models.Index(fields=['user', 'uploader'], name='timeline_uploader_idx')],
+                'unique_together': {('user', 'media_item')},
+            },
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -83,3 +83,18 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f"{self.user} favorited {self.media_item}"
+
+class TimelineEntry(models.Model):
+    """An upload in a follower's timeline, written by fan-out (see social.timeline)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline')
+    media_item = models.ForeignKey(MediaItem, on_delete=models.CASCADE, related_name='+')
+    uploader = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    # The item's created_at, copied so a page is one index range
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'media_item')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-media_item'], name='timeline_read_idx'),
+            models.Index(fields=['user', 'uploader'], name='timeline_uploader_idx'),
+        ]
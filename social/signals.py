@@ -0,0 +1,9 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from media.models import MediaItem
+from .timeline import fan_out
+
+@receiver(post_save, sender=MediaItem)
+def deliver_to_followers(sender, instance, created, **kwargs):
+    if created:
+        fan_out([instance])
@@ -0,0 +1,148 @@
+"""
+Following timelines: the uploads of the accounts a user follows, newest first.
+
+Fan-out on write: when someone uploads, a job (run by `manage.py process_media`) copies
+a TimelineEntry for the item into every accepted follower's timeline, so reading a
+timeline is one index range on (user, created_at, item) instead of a scan of MediaItem
+for all followed uploaders. Following an account backfills its latest
+TIMELINE_BACKFILL_ITEMS uploads (also a job); unfollowing removes them.
+
+Accounts with more than TIMELINE_CELEBRITY_FOLLOWERS followers are not fanned out, which
+would write that many rows per upload. Their items are read at query time instead
+(through the uploader feed index) and merged into the page, and their stored entries,
+if any, are skipped. Hidden and deleted items are filtered out when a page is read.
+"""
+import heapq
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from media.jobs import enqueue, task
+from media.models import LISTED, MediaItem
+from media.pagination import decode_cursor, encode_cursor
+
+from .models import Follow, TimelineEntry
+
+CELEBRITIES_KEY = 'timeline_celebrities'
+
+def _celebrities(follow_model):
+    counts = follow_model.objects.filter(is_accepted=True).values('followed_id').annotate(n=Count('pk'))
+    return set(counts.filter(n__gt=settings.TIMELINE_CELEBRITY_FOLLOWERS).values_list('followed_id', flat=True))
+
+def celebrities():
+    """Ids of the accounts read at query time; recomputed every TIMELINE_CELEBRITY_CACHE_SECONDS."""
+    found = cache.get(CELEBRITIES_KEY)
+    if found is None:
+        found = _celebrities(Follow)
+        previous = cache.get(f'{CELEBRITIES_KEY}_previous', set())
+        # Uploads made while an account was a celebrity were never fanned out
+        for author_id in previous - found:
+            enqueue('timeline_backfill', author=author_id)
+        cache.set(CELEBRITIES_KEY, found, settings.TIMELINE_CELEBRITY_CACHE_SECONDS)
+        cache.set(f'{CELEBRITIES_KEY}_previous', found, None)
+    return found
+
+def _entries(entry_model, user_ids, items):
+    return [
+        entry_model(user_id=user_id, media_item_id=pk, uploader_id=uploader_id, created_at=created_at)
+        for user_id in user_ids for pk, uploader_id, created_at in items
+    ]
+
+def fan_out(items):
+    """Queue delivery of new uploads to their uploaders' followers (one job per batch)."""
+    if items:
+        enqueue('timeline_fan_out', items=[item.pk for item in items])
+
+def follow_started(follow):
+    if follow.is_accepted:
+        enqueue('timeline_backfill', author=follow.followed_id, follower=follow.follower_id)
+
+def follow_ended(follower_id, followed_id):
+    TimelineEntry.objects.filter(user_id=follower_id, uploader_id=followed_id).delete()
+
+def _latest(media_model, author_id):
+    """The author's newest TIMELINE_BACKFILL_ITEMS live uploads, as (pk, uploader_id, created_at)."""
+    items = media_model._base_manager.filter(LISTED, uploader_id=author_id).order_by('-created_at', '-id')
+    return list(items.values_list('pk', 'uploader_id', 'created_at')[:settings.TIMELINE_BACKFILL_ITEMS])
+
+def _deliver(entry_model, follower_ids, items):
+    follower_ids = list(follower_ids)
+    step = max(1, settings.TIMELINE_FANOUT_BATCH // max(1, len(items)))
+    for start in range(0, len(follower_ids), step):
+        entry_model.objects.bulk_create(_entries(entry_model, follower_ids[start:start + step], items), ignore_conflicts=True)
+
+@task('timeline_fan_out')
+def deliver(job):
+    by_author = {}
+    for item in MediaItem.objects.filter(pk__in=job.payload['items']).values_list('pk', 'uploader_id', 'created_at'):
+        by_author.setdefault(item[1], []).append(item)
+    for author_id, items in by_author.items():
+        if author_id not in celebrities():
+            followers = Follow.objects.filter(followed_id=author_id, is_accepted=True).values_list('follower_id', flat=True)
+            _deliver(TimelineEntry, followers.iterator(), items)
+
+@task('timeline_backfill')
+def backfill(job):
+    """Copy an author's latest uploads into one follower's timeline, or into all of them."""
+    author_id, follower_id = job.payload['author'], job.payload.get('follower')
+    if author_id in celebrities():
+        return
+    followers = Follow.objects.filter(followed_id=author_id, is_accepted=True)
+    if follower_id is not None:
+        followers = followers.filter(follower_id=follower_id)
+    items = _latest(MediaItem, author_id)
+    if items:
+        _deliver(TimelineEntry, followers.values_list('follower_id', flat=True).iterator(), items)
+
+def rebuild(apps=global_apps):
+    """Refill every timeline from the follow graph; returns the entry count. Takes an app registry so migrations can run it."""
+    entry_model = apps.get_model('social', 'TimelineEntry')
+    follow_model = apps.get_model('social', 'Follow')
+    media_model = apps.get_model('media', 'MediaItem')
+    skip = _celebrities(follow_model)
+    following = {}
+    for follower_id, followed_id in follow_model.objects.filter(is_accepted=True).values_list('follower_id', 'followed_id').iterator():
+        if followed_id not in skip:
+            following.setdefault(followed_id, []).append(follower_id)
+    entry_model.objects.all().delete()
+    total = 0
+    for author_id, follower_ids in following.items():
+        items = _latest(media_model, author_id)
+        _deliver(entry_model, follower_ids, items)
+        total += len(follower_ids) * len(items)
+    return total
+
+def page(user, cursor=None, size=24):
+    """
+    One page of `user`'s timeline after `cursor`: (items, cursor of the next page or None).
+    Cursors are the date_desc cursors of media.pagination.
+    """
+    followed = set(Follow.objects.filter(follower=user, is_accepted=True).values_list('followed_id', flat=True))
+    famous = followed & celebrities()
+    after = Q()
+    if cursor:
+        value, pk = decode_cursor('date_desc', cursor)
+        after = Q(created_at__lt=value) | Q(created_at=value, media_item_id__lt=pk)
+
+    # Both sources are read newest first, one row past the page, and merged
+    stored = (
+        TimelineEntry.objects.filter(after, user=user, media_item__is_hidden=False, media_item__deletion__isnull=True)
+        .exclude(uploader_id__in=famous)
+        .order_by('-created_at', '-media_item_id').values_list('created_at', 'media_item_id')[:size + 1]
+    )
+    rows = list(stored)
+    if famous:
+        live = MediaItem.objects.filter(LISTED, uploader_id__in=famous)
+        if cursor:
+            live = live.filter(Q(created_at__lt=value) | Q(created_at=value, pk__lt=pk))
+        rows = heapq.merge(rows, live.order_by('-created_at', '-id').values_list('created_at', 'pk')[:size + 1], reverse=True)
+    ids = [pk for _, pk in rows][:size + 1]
+
+    items = MediaItem.objects.filter(pk__in=ids).select_related('uploader').prefetch_related('renditions').in_bulk()
+    items = [items[pk] for pk in ids if pk in items]
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    return items, encode_cursor('date_desc', items[-1])
@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     LikeToggleAPIView, ReviewListCreateAPIView, FollowToggleAPIView, 
     FavoriteToggleAPIView, NotificationListView, AcceptFollowRequestView,
-    MarkAllNotificationsReadView, notifications_page
+    MarkAllNotificationsReadView, TimelineView, notifications_page
 )
 
 urlpatterns = [
@@ -14,4 +14,5 @@ urlpatterns = [
     path('notifications/read-all/', MarkAllNotificationsReadView.as_view(), name='notifications-read-all'),
     path('follow/accept/<int:pk>/', AcceptFollowRequestView.as_view(), name='follow-accept'),
     path('notifications/all/', notifications_page, name='notifications-page'),
+    path('timeline/', TimelineView.as_view(), name='timeline'),
 ]
@@ -3,10 +3,13 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import BadRequest
 from django.utils import timezone
 from .models import Like, Review, Follow, Favorite
 from .serializers import LikeSerializer, ReviewSerializer, FollowSerializer
+from . import timeline
 from media.models import MediaItem
+from media.serializers import MediaItemSerializer
 from django.contrib.auth import get_user_model
 
 class LikeToggleAPIView(APIView):
@@ -37,7 +40,7 @@ class ReviewListCreateAPIView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         media_id = self.kwargs.get('pk') # Assuming media_id in URL
-        return Review.objects.filter(media_item_id=media_id)
+        return Review.objects.filter(media_item_id=media_id, media_item__deletion__isnull=True)
 
     def perform_create(self, serializer):
         media_item_id = self.kwargs.get('pk')
@@ -58,6 +61,7 @@ class FollowToggleAPIView(APIView):
         
         if follow:
             follow.delete()
+            timeline.follow_ended(request.user.pk, user_to_follow.pk)
             return Response({'status': 'unfollowed'}, status=status.HTTP_200_OK)
         else:
             # Check if user being followed is private
@@ -67,6 +71,7 @@ class FollowToggleAPIView(APIView):
                 followed=user_to_follow,
                 is_accepted=is_accepted
             )
+            timeline.follow_started(follow)
             
             # Create notification
             notif_type = 'FOLLOW_REQUEST' if user_to_follow.is_private else 'FOLLOW'
@@ -109,6 +114,7 @@ class AcceptFollowRequestView(APIView):
         follow = get_object_or_404(Follow, follower_id=pk, followed=request.user, is_accepted=False)
         follow.is_accepted = True
         follow.save()
+        timeline.follow_started(follow)
         
         # Notify follower
         Notification.objects.create(
@@ -124,6 +130,17 @@ class AcceptFollowRequestView(APIView):
         
         return Response({'status': 'accepted'})
 
+class TimelineView(APIView):
+    """Uploads of the accounts the user follows, newest first; pass `next_cursor` back as `cursor`."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            items, next_cursor = timeline.page(request.user, request.GET.get('cursor'))
+        except BadRequest as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': MediaItemSerializer(items, many=True).data, 'next_cursor': next_cursor})
+
 class MarkAllNotificationsReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -0,0 +1,42 @@
+import io
+import shutil
+import tempfile
+import zipfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from media.models import Folder, MediaItem
+
+class ArchiveDownloadTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=root))
+        User = get_user_model()
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='x')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='x')
+        self.folder = Folder.objects.create(name='notes', owner=self.owner)
+        for n, is_private in enumerate([False, False, True]):
+            MediaItem.objects.create(
+                uploader=self.owner, folder=self.folder, is_private=is_private,
+                file=SimpleUploadedFile(f'note{n}.txt', f'note {n}'.encode()),
+            )
+        self.client.force_login(self.reader)
+
+    def download(self):
+        return self.client.post('/api/stats/download/archive/', {'folder': self.folder.pk})
+
+    @override_settings(ARCHIVE_MAX_ITEMS=2)
+    def test_limit_counts_only_what_the_user_may_download(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(sorted(archive.namelist()), ['notes/note0.txt', 'notes/note1.txt'])
+
+    @override_settings(ARCHIVE_MAX_ITEMS=1)
+    def test_archive_over_the_limit_is_refused(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('limited to 1', response.json()['error'])
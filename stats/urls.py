@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import DownloadMediaView
+from .views import DownloadMediaView, ArchiveDownloadView
 
 urlpatterns = [
     path('download/<int:pk>/', DownloadMediaView.as_view(), name='download-media'),
+    path('download/archive/', ArchiveDownloadView.as_view(), name='download-archive'),
 ]
@@ -1,10 +1,21 @@
 from rest_framework import views, status, permissions
 from rest_framework.response import Response
 from .models import DownloadLog
-from media.models import MediaItem
+from media.models import MediaItem, Folder
+from media.archive import collect_entries, stream_zip, safe_name
+from media.delivery import can_view, download_denied
+from media import trending
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.http import content_disposition_header
 from django.shortcuts import get_object_or_404
 
+# Per-user daily download limits by media type (uploaders' own items and admins are exempt)
+DAILY_DOWNLOAD_LIMITS = {'VIDEO': 3, 'IMAGE': 5}
+
 class DownloadMediaView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -13,23 +24,14 @@ class DownloadMediaView(views.APIView):
         user = request.user
         
         if user.is_superuser or media_item.uploader == user:
-            return Response({'status': 'allowed', 'url': media_item.file.url})
+            return Response({'status': 'allowed', 'url': f'{media_item.file.url}?download=1'})
 
-        # Check Uploader's download preferences
-        uploader = media_item.uploader
-        pref = uploader.download_preference
+        if not can_view(user, media_item.uploader, media_item.is_private):
+            return Response({'error': 'This item is private.'}, status=status.HTTP_404_NOT_FOUND)
 
-        if uploader.download_preference == 'RESTRICTED':
-            # Check if user is an uploader/admin OR explicitly allowed
-            is_explicitly_allowed = uploader.allowed_downloaders.filter(id=user.id).exists()
-            if not (user.is_uploader or user.is_superuser or is_explicitly_allowed):
-                return Response({'error': 'Downloads for this content are restricted. You need explicit permission from the uploader.'}, status=status.HTTP_403_FORBIDDEN)
-        
-        elif uploader.download_preference == 'FOLLOWERS':
-            from social.models import Follow
-            is_following = Follow.objects.filter(follower=user, followed=uploader, is_accepted=True).exists()
-            if not is_following:
-                return Response({'error': 'You must be a follower to download this user\'s content.'}, status=status.HTTP_403_FORBIDDEN)
+        error = download_denied(user, media_item.uploader)
+        if error:
+            return Response({'error': error}, status=status.HTTP_403_FORBIDDEN)
 
         today = timezone.now().date()
         # Filter accurately
@@ -37,15 +39,90 @@ class DownloadMediaView(views.APIView):
         
         if media_item.media_type == 'VIDEO':
             video_downloads = daily_downloads.filter(media_item__media_type='VIDEO').count()
-            if video_downloads >= 3:
+            if video_downloads >= DAILY_DOWNLOAD_LIMITS['VIDEO']:
                 return Response({'error': 'Daily video download limit reached (3/3).'}, status=status.HTTP_403_FORBIDDEN)
         elif media_item.media_type == 'IMAGE':
             image_downloads = daily_downloads.filter(media_item__media_type='IMAGE').count()
-            if image_downloads >= 5:
+            if image_downloads >= DAILY_DOWNLOAD_LIMITS['IMAGE']:
                 return Response({'error': 'Daily image download limit reached (5/5).'}, status=status.HTTP_403_FORBIDDEN)
         
         DownloadLog.objects.create(user=user, media_item=media_item)
-        media_item.downloads_count += 1
-        media_item.save(update_fields=['downloads_count'])
+        MediaItem.objects.filter(pk=media_item.pk).update(downloads_count=F('downloads_count') + 1)
         
-        return Response({'status': 'allowed', 'url': media_item.file.url})
+        return Response({'status': 'allowed', 'url': f'{media_item.file.url}?download=1'})
+
+class ArchiveDownloadView(views.APIView):
+    """
+    POST folder=<id> (repeatable) and/or media=<id> (repeatable): a ZIP streamed as it is
+    built. Subfolders are included; anything the user may not see or download is left out.
+    Archives of more than ARCHIVE_MAX_ITEMS files are refused rather than cut short.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        try:
+            folder_ids = self._ids(request, 'folder')
+            media_ids = self._ids(request, 'media')
+        except ValueError:
+            return Response({'error': 'folder and media must be integer ids.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = collect_entries(user, folder_ids, media_ids)
+        denied = {}
+        for _, item in entries:
+            if item.uploader_id not in denied:
+                denied[item.uploader_id] = download_denied(user, item.uploader)
+        entries = [(name, item) for name, item in entries if not denied[item.uploader_id]]
+        if not entries:
+            error = next((reason for reason in denied.values() if reason), 'Nothing to download.')
+            return Response({'error': error}, status=status.HTTP_403_FORBIDDEN if denied else status.HTTP_404_NOT_FOUND)
+        if len(entries) > settings.ARCHIVE_MAX_ITEMS:
+            return Response(
+                {'error': f'This archive has {len(entries)} files; archives are limited to {settings.ARCHIVE_MAX_ITEMS}. Download fewer folders at a time.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        counted = [item for _, item in entries if not (user.is_superuser or item.uploader_id == user.pk)]
+        error = self._over_quota(user, counted)
+        if error:
+            return Response({'error': error}, status=status.HTTP_403_FORBIDDEN)
+
+        # One INSERT and one UPDATE for the whole archive, recorded before streaming starts
+        with transaction.atomic():
+            DownloadLog.objects.bulk_create([DownloadLog(user=user, media_item=item) for item in counted])
+            MediaItem.objects.filter(pk__in=[item.pk for _, item in entries]).update(downloads_count=F('downloads_count') + 1)
+            trending.record('download', [item.pk for item in counted])
+
+        if len(folder_ids) == 1 and not media_ids:
+            filename = safe_name(Folder.objects.get(pk=folder_ids[0]).name)
+        else:
+            filename = 'mediavault-download'
+        response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, f'{filename}.zip')
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def _ids(self, request, key):
+        values = request.data.getlist(key) if hasattr(request.data, 'getlist') else request.data.get(key, [])
+        if not isinstance(values, list):
+            values = [values]
+        return [int(value) for value in values if value != '']
+
+    def _over_quota(self, user, items):
+        wanted = {}
+        for item in items:
+            if item.media_type in DAILY_DOWNLOAD_LIMITS:
+                wanted[item.media_type] = wanted.get(item.media_type, 0) + 1
+        if not wanted:
+            return None
+
+        used = dict(
+            DownloadLog.objects.filter(user=user, created_at__date=timezone.now().date(), media_item__media_type__in=wanted)
+            .values_list('media_item__media_type').annotate(n=Count('id'))
+        )
+        for media_type, count in wanted.items():
+            limit = DAILY_DOWNLOAD_LIMITS[media_type]
+            left = max(limit - used.get(media_type, 0), 0)
+            if count > left:
+                return f'This archive has {count} {media_type.lower()}s but only {left} of your daily {limit} {media_type.lower()} downloads are left.'
+        return None